@@ -0,0 +1,132 @@
+"""Compare translator inference backends with the fp32 baseline on speed and output quality.
+
+    python -m benchmarks.compare_backends --backends int8 bf16 onnx
+    python -m benchmarks.compare_backends --input sentences.txt --lang en --json backends.json
+
+Quality is measured against the fp32 translations (chrF and exact-match rate),
+so it shows how far a backend drifts from the baseline, not absolute quality.
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from modules.backends import load_translator
+from modules.config import MODEL_CONFIGS, INFERENCE_BACKENDS, DECODING_PROFILES, DEFAULT_DECODING_PROFILE
+from modules.translation import GenerateWrapper, TARGET_LANG, decoding_kwargs
+
+SAMPLE_SENTENCES = [
+    "The contract enters into force on the first day of the following month.",
+    "Please submit the signed form before Friday.",
+    "Our office will be closed during the national holidays.",
+    "The results of the survey are summarized in the table below.",
+    "If the device overheats, disconnect it from the power supply immediately.",
+    "Thank you for your patience while we investigate the issue.",
+    "All employees must complete the safety training by the end of the year.",
+    "The meeting has been moved to the large conference room on the third floor.",
+    "Prices do not include shipping costs or import duties.",
+    "She has been working on this project for more than three years.",
+    "Hello.",
+    "Section 4.2 describes the procedure for filing a complaint with the regulator.",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _char_ngrams(text, n):
+    text = text.replace(" ", "")
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def chrf(hypothesis: str, reference: str, max_n: int = 6, beta: float = 2.0) -> float:
+    """Character n-gram F-score (chrF) in [0, 100]"""
+    precisions, recalls = [], []
+    for n in range(1, max_n + 1):
+        hyp, ref = _char_ngrams(hypothesis, n), _char_ngrams(reference, n)
+        if not hyp or not ref:
+            continue
+        overlap = sum((hyp & ref).values())
+        precisions.append(overlap / sum(hyp.values()))
+        recalls.append(overlap / sum(ref.values()))
+    if not precisions:
+        return 100.0 if hypothesis == reference else 0.0
+    p, r = sum(precisions) / len(precisions), sum(recalls) / len(recalls)
+    if p + r == 0:
+        return 0.0
+    return 100 * (1 + beta ** 2) * p * r / (beta ** 2 * p + r)
+
+
+def run_backend(model_name, backend, sentences, src_lang, repeats, profile=DEFAULT_DECODING_PROFILE):
+    start = time.perf_counter()
+    tokenizer, model, used = load_translator(model_name, backend, "cpu")
+    load_seconds = time.perf_counter() - start
+
+    translate = GenerateWrapper(model, tokenizer, src_lang, TARGET_LANG, decoding_kwargs(profile))
+    translate(sentences[:1])  # warm-up
+
+    outputs, latencies = [], []
+    for sentence in sentences:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            output = translate([sentence])[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+        outputs.append(output)
+
+    return {
+        "backend": backend,
+        "used": used,
+        "load_seconds": round(load_seconds, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "outputs": outputs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=next(iter(MODEL_CONFIGS.values()))['name'], help="HuggingFace model id")
+    parser.add_argument("--backends", nargs="+", default=[b for b in INFERENCE_BACKENDS if b != "fp32"],
+                        choices=[b for b in INFERENCE_BACKENDS if b != "fp32"])
+    parser.add_argument("--input", help="Text file with one source sentence per line (default: built-in sample)")
+    parser.add_argument("--lang", default="en", help="Source language of the sentences")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per sentence")
+    parser.add_argument("--profile", default=DEFAULT_DECODING_PROFILE, choices=list(DECODING_PROFILES), help="Decoding profile")
+    parser.add_argument("--json", help="Write the full report (including outputs) to this file")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+    else:
+        sentences = SAMPLE_SENTENCES
+
+    baseline = run_backend(args.model, "fp32", sentences, args.lang, args.repeats, args.profile)
+    reports = [baseline]
+    for backend in args.backends:
+        reports.append(run_backend(args.model, backend, sentences, args.lang, args.repeats, args.profile))
+
+    for report in reports:
+        pairs = list(zip(report["outputs"], baseline["outputs"]))
+        report["speedup"] = round(baseline["mean_ms"] / report["mean_ms"], 2) if report["mean_ms"] else 0.0
+        report["chrf_vs_fp32"] = round(sum(chrf(h, r) for h, r in pairs) / len(pairs), 1)
+        report["exact_match"] = round(sum(h == r for h, r in pairs) / len(pairs), 3)
+
+    print(f"{'backend':<8} {'used':<6} {'load s':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'chrF':>6} {'exact':>6}")
+    for r in reports:
+        print(f"{r['backend']:<8} {r['used']:<6} {r['load_seconds']:>7} {r['mean_ms']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['speedup']:>8} {r['chrf_vs_fp32']:>6} {r['exact_match']:>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "sentences": sentences, "reports": reports}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
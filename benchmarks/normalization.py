@@ -0,0 +1,159 @@
+"""Check the normalization engine against the per-language functions it replaced, and time both.
+
+    python -m benchmarks.normalization
+    python -m benchmarks.normalization --samples 20000 --seed 3
+
+The reference functions below are the pre-engine implementations, kept verbatim. Every
+language's output normalization, the Japanese clean-up, every cleaner and the Japanese check
+are run on the same generated strings (mixed scripts, control characters, odd whitespace,
+the NOT JAPANESE marker). Any difference is printed and the exit status is 1.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import unicodedata
+from modules.normalization import (
+    OUTPUT_RULES, CLEANER_RULES, output_normalizer, cleaner, japanese_normalizer, is_japanese, is_japanese_many
+)
+
+
+# Reference implementations (modules/translation.py, modules/utils.py, modules/postprocessing.py)
+def normalize_hindi(text):
+    text = unicodedata.normalize("NFC", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+def normalize_japanese(text):
+    text = text.replace(" ", "")
+    return text.strip()
+
+def normalize_korean(text):
+    return text.strip()
+
+def normalize_generic(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+def _normalize_for_lang(result, src_lang_hf):
+    if src_lang_hf == "hi":
+        return normalize_hindi(result)
+    elif src_lang_hf == "ja":
+        return normalize_japanese(result)
+    elif src_lang_hf == "ko":
+        return normalize_korean(result)
+    # fr, es, it, pt, ru had their own functions with the generic body
+    return normalize_generic(result)
+
+def post_process_japanese(text):
+    text = re.sub(r'[\x00-\x1f\x7f]', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = text.replace(" ?", "？").replace(" !", "！").replace(" :", "：")
+    text = re.sub(r'^\[NOT JAPANESE OUTPUT\]\s*', '', text)
+    return text
+
+def reference_is_japanese(text):
+    if not text:
+        return False
+    return bool(re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', text))
+
+def reference_finalize(result, src_lang_hf):
+    result = post_process_japanese(_normalize_for_lang(result, src_lang_hf))
+    if not reference_is_japanese(result):
+        result = "[NOT JAPANESE OUTPUT] " + result
+    return result
+
+def _space_between(text, script):
+    text = re.sub(rf'([a-zA-Z])([{script}])', r'\1 \2', text)
+    text = re.sub(rf'([{script}])([a-zA-Z])', r'\1 \2', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+REFERENCE_CLEANERS = {
+    "en": normalize_generic,
+    "ko": lambda text: _space_between(text, "\uAC00-\uD7AF"),
+    "fr": lambda text: re.sub(r'\s+', ' ', re.sub(r'\s+([?!:;])', r'\1', text)).strip(),
+    "es": normalize_generic,
+    "it": normalize_generic,
+    "pt": normalize_generic,
+    "ru": lambda text: _space_between(text, "\u0400-\u04FF"),
+    "ja": post_process_japanese,
+    "hi": lambda text: _space_between(text, "\u0900-\u097F"),
+}
+
+
+ALPHABET = (
+    list("abcXYZ019.,") + list("あいうアイウ日本語。、") + list("가나다") + list("абвЖ") + list("कखग")
+    + [" ", "  ", "\t", "\n", "　", "\x00", "\x1c", "\x1f", "\x7f", "\x85", "\u2028", " ", "?", "!", ":", ";", " ?", " !", " :"]
+    + ["é", "क़"]  # combining sequences that NFC composes
+)
+
+
+def generate(samples: int, seed: int) -> list:
+    rng = random.Random(seed)
+    texts = ["", " ", "[NOT JAPANESE OUTPUT] テスト", "  [NOT JAPANESE OUTPUT]\tabc", "日本語です ?", "abc가def"]
+    for _ in range(samples):
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 80)))
+        if rng.random() < 0.1:
+            text = "[NOT JAPANESE OUTPUT] " + text
+        texts.append(text)
+    return texts
+
+
+def check(texts: list) -> list:
+    """Return descriptions of every input where the engine and the reference differ"""
+    failures = []
+    languages = sorted(set(OUTPUT_RULES) - {"*"} | {"en", "fr", "es", "it", "pt", "ru", "de", "zh"})
+    for lang in languages:
+        engine = output_normalizer(lang).map(texts)
+        engine = [text if japanese else "[NOT JAPANESE OUTPUT] " + text for text, japanese in zip(engine, is_japanese_many(engine))]
+        for text, got in zip(texts, engine):
+            expected = reference_finalize(text, lang)
+            if got != expected:
+                failures.append(f"finalize[{lang}] {text!r}: {got!r} != {expected!r}")
+    for lang in CLEANER_RULES:
+        for text, got in zip(texts, cleaner(lang).map(texts)):
+            expected = REFERENCE_CLEANERS[lang](text)
+            if got != expected:
+                failures.append(f"cleaner[{lang}] {text!r}: {got!r} != {expected!r}")
+    for text in texts:
+        if japanese_normalizer(text) != post_process_japanese(text):
+            failures.append(f"post_process_japanese {text!r}")
+        if is_japanese(text) != reference_is_japanese(text):
+            failures.append(f"is_japanese {text!r}")
+    return failures
+
+
+def _time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5000, help="Generated strings per check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    texts = generate(args.samples, args.seed)
+    failures = check(texts)
+    for line in failures[:20]:
+        print(f"MISMATCH {line}")
+    print(f"{len(texts)} inputs, {len(failures)} mismatches")
+
+    # Long model outputs: the case where post-processing cost shows up
+    rng = random.Random(args.seed)
+    outputs = ["".join(rng.choice(ALPHABET[:25]) for _ in range(400)) + " ?" for _ in range(2000)]
+    reference = _time(lambda: [reference_finalize(text, "en") for text in outputs])
+    normalizer = output_normalizer("en")
+    engine = _time(lambda: is_japanese_many(normalizer.map(outputs)))
+    print(f"finalize {len(outputs)} x 400 chars: reference {1000 * reference:.1f} ms, engine {1000 * engine:.1f} ms "
+          f"({reference / engine:.2f}x)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""Benchmark the translation pipeline stage by stage.
+
+    python -m benchmarks.pipeline                          # offline, stub translator
+    python -m benchmarks.pipeline --translator real --sentences 100 --json real.json
+    python -m benchmarks.pipeline --json new.json --baseline old.json --tolerance 0.15
+
+Every stage reports sentences/s, p50/p95/p99 latency per call and the peak RSS of the
+process while it ran. With --baseline, stages whose throughput drops or whose p95 latency
+grows by more than the tolerance are flagged and the exit status is 1.
+
+The stub translator returns a canned Japanese string, so the translate_text stages measure
+the pipeline around the model (detection, segmentation, cache, post-processing). fastText is
+used when lid.176.ftz is available locally; otherwise detection falls back to the Unicode
+script classifier. Stages whose library is not installed (Sudachi, PyKakasi) are skipped.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from benchmarks.compare_backends import percentile
+from modules.config import MODEL_CONFIGS, DECODING_PROFILES, DEFAULT_DECODING_PROFILE
+
+WORDS = {
+    "en": "the report meeting customer office results project price week team data system".split(),
+    "fr": "le rapport réunion client bureau résultats projet prix semaine équipe données système".split(),
+    "de": "der Bericht Besprechung Kunde Büro Ergebnisse Projekt Preis Woche Team Daten System".split(),
+    "es": "el informe reunión cliente oficina resultados proyecto precio semana equipo datos sistema".split(),
+}
+JAPANESE_SENTENCES = [
+    "東京は日本の首都です。",
+    "明日の会議は午後三時から始まります。",
+    "このプロジェクトの結果を報告書にまとめました。",
+    "駅の近くに新しい図書館ができました。",
+    "価格には送料が含まれていません。",
+    "彼女は三年以上この仕事を続けています。",
+]
+
+
+def build_corpus(n: int, seed: int = 0) -> list:
+    """Deterministic mix of Latin-script and Japanese sentences"""
+    rng = random.Random(seed)
+    sentences = []
+    for i in range(n):
+        if i % 5 == 4:
+            sentences.append(f"{rng.choice(JAPANESE_SENTENCES)[:-1]}（{i}）。")
+            continue
+        words = rng.choices(WORDS[rng.choice(list(WORDS))], k=rng.randint(6, 20))
+        sentences.append(f"{' '.join(words).capitalize()} {i}.")
+    return sentences
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(lines: list, lines_per_page: int = 40) -> bytes:
+    """Minimal PDF (Helvetica, one text object per page) that pypdf can extract"""
+    lines = [line.encode("latin-1", "replace").decode("latin-1") for line in lines]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    n_pages = len(pages)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [" + " ".join(f"{4 + 2 * k} 0 R" for k in range(n_pages)) + f"] /Count {n_pages} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for k, page_lines in enumerate(pages):
+        stream = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in page_lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * k} 0 R >>")
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def build_docx(paragraphs: list) -> bytes:
+    """Minimal DOCX package: content types, relationships and word/document.xml"""
+    from xml.sax.saxutils import escape
+    body = "".join(f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml",
+                   '<?xml version="1.0" encoding="UTF-8"?>'
+                   '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                   '<Default Extension="xml" ContentType="application/xml"/>'
+                   '<Override PartName="/word/document.xml" '
+                   'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                   '</Types>')
+        z.writestr("_rels/.rels",
+                   '<?xml version="1.0" encoding="UTF-8"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                   'Target="word/document.xml"/></Relationships>')
+        z.writestr("word/document.xml",
+                   '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                   '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                   f'<w:body>{body}</w:body></w:document>')
+    return out.getvalue()
+
+
+class _Upload(io.BytesIO):
+    """Stands in for a Streamlit UploadedFile"""
+    def __init__(self, data: bytes, name: str, mime_type: str):
+        super().__init__(data)
+        self.name = name
+        self.type = mime_type
+
+
+class _PeakRSS:
+    """Samples RSS on a background thread while a stage runs"""
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        from modules.utils import rss_mb
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def measure(items, fn, count=lambda item: 1) -> dict:
+    """Call fn on each item, timing every call"""
+    latencies, sentences = [], 0
+    with _PeakRSS() as rss:
+        start = time.perf_counter()
+        for item in items:
+            t0 = time.perf_counter()
+            fn(item)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            sentences += count(item)
+        seconds = time.perf_counter() - start
+    return {
+        "calls": len(latencies),
+        "sentences": sentences,
+        "seconds": round(seconds, 4),
+        "sentences_per_s": round(sentences / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "peak_rss_mb": round(rss.peak, 1),
+    }
+
+
+class StubTokenizer:
+    """Whitespace 'tokenizer' with the call signature the segmenter uses"""
+    def __call__(self, texts, add_special_tokens=True, **kwargs):
+        return {"input_ids": [[0] * (len(text.split()) + 2) for text in texts]}
+
+    def decode(self, ids, skip_special_tokens=True, **kwargs):
+        return " ".join("▁" for _ in ids)
+
+
+class StubTranslator:
+    """Fixed-length Japanese output; carries a tokenizer like the real GenerateWrapper"""
+    def __init__(self):
+        self.tokenizer = StubTokenizer()
+
+    def __call__(self, texts):
+        return [f"翻訳結果です（{len(text)}文字）。" for text in texts]
+
+
+class StubLID:
+    """No fastText predictions, so detection uses the Unicode script fallback"""
+    def predict(self, texts, k=1):
+        return [[] for _ in texts], [[] for _ in texts]
+
+
+def _optional(loader):
+    try:
+        return loader()
+    except Exception as e:
+        print(f"note: {e}", file=sys.stderr)
+        return None
+
+
+def setup_models(translator: str, model_name: str) -> dict:
+    """Install the models for the run and describe what was used"""
+    from modules import models, translation
+
+    if translator == "real" or os.path.exists("lid.176.ftz"):
+        lid, lid_used = models.get_lid_model(), "fasttext"
+    else:
+        lid, lid_used = StubLID(), "script-fallback"
+    sudachi = _optional(models.get_sudachi)
+    kakasi = models.get_kakasi()
+
+    if translator == "stub":
+        models.set_models(lid, None, StubTokenizer(), sudachi, kakasi)
+        stub = StubTranslator()
+        translation.get_translator = lambda src_lang_hf, model_name, profile=None: stub
+    else:
+        models.configure_models(custom_model_name=model_name)
+        model, tokenizer = models.get_translator_model()
+        models.set_models(lid, model, tokenizer, sudachi, kakasi)
+    return {"translator": translator, "model": model_name, "lid": lid_used, "sudachi": sudachi, "kakasi": kakasi}
+
+
+def run(args) -> dict:
+    from modules.utils import split_sentences, extract_text_from_file, generate_furigana, is_japanese, _sudachi_to_string
+    from modules.langid import detect_language
+    from modules.translation import translate_text
+    from modules.cache import cache_lookup, cache_store, cache_flush, cache_fuzzy_lookup_many, cache_namespace
+    from modules.models import get_lid_model
+
+    setup = setup_models(args.translator, args.model)
+    corpus = build_corpus(args.sentences, args.seed)
+    japanese = [s for s in corpus if is_japanese(s)]
+    stages = {}
+
+    paragraphs = [" ".join(corpus[i:i + 20]) for i in range(0, len(corpus), 20)]
+    stages["split_sentences"] = measure(paragraphs, split_sentences, count=lambda p: len(split_sentences(p)))
+
+    stages["language_detection"] = measure(corpus, lambda s: detect_language(s, get_lid_model()))
+
+    # Fresh cache database: the first pass misses, the second is served from the cache
+    stages["translate_text_miss"] = measure(corpus, lambda s: translate_text(s, "auto", args.model, profile=args.profile))
+    cache_flush()
+    stages["translate_text_hit"] = measure(corpus, lambda s: translate_text(s, "auto", args.model, profile=args.profile))
+
+    # Revisions of the translated sentences (their number changed) against the translation memory
+    namespace = cache_namespace(args.model, args.profile)
+    revisions = [(re.sub(r"\d+", lambda m: str(int(m.group()) + 1), s), detect_language(s, get_lid_model())[0])
+                 for s in corpus if s not in japanese]
+    stages["tm_lookup"] = measure(revisions, lambda r: cache_fuzzy_lookup_many([r[0]], r[1], namespace, 0.75))
+
+    keys = [(f"bench {i}", "en", args.model) for i in range(len(corpus))]
+    stages["cache_lookup_miss"] = measure(keys, lambda k: cache_lookup(*k))
+    for key in keys:
+        cache_store(*key, "ベンチマーク")
+    cache_flush()
+    stages["cache_lookup_hit"] = measure(keys, lambda k: cache_lookup(*k))
+
+    if setup["sudachi"] is not None:
+        from sudachipy import SplitMode
+        sudachi = setup["sudachi"]
+        stages["sudachi"] = measure(japanese, lambda s: _sudachi_to_string(sudachi.tokenize(s, SplitMode.C)))
+    if setup["kakasi"] is not None:
+        stages["furigana"] = measure(japanese, lambda s: generate_furigana(s, setup["kakasi"]))
+
+    latin = [s for s in corpus if s not in japanese]
+    documents = {
+        "txt": ("bench.txt", "text/plain", lambda: " ".join(corpus).encode("utf-8")),
+        "pdf": ("bench.pdf", "application/pdf", lambda: build_pdf(latin)),
+        "docx": ("bench.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                 lambda: build_docx(corpus)),
+    }
+    for kind, (name, mime_type, build) in documents.items():
+        data = build()
+        uploads = [_Upload(data, name, mime_type) for _ in range(args.documents)]
+        n_sentences = len(split_sentences(extract_text_from_file(_Upload(data, name, mime_type)) or ""))
+        stages[f"extract_{kind}"] = measure(uploads, extract_text_from_file, count=lambda u: n_sentences)
+
+    return {
+        "meta": {
+            "translator": setup["translator"],
+            "model": setup["model"],
+            "profile": args.profile,
+            "lid": setup["lid"],
+            "sentences": len(corpus),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": stages,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Return human-readable regressions of report against baseline"""
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        if previous["sentences_per_s"] and current["sentences_per_s"] < previous["sentences_per_s"] * (1 - tolerance):
+            regressions.append(f"{stage}: throughput {previous['sentences_per_s']} -> {current['sentences_per_s']} sentences/s")
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--translator", choices=["stub", "real"], default="stub")
+    parser.add_argument("--model", default=next(iter(MODEL_CONFIGS.values()))['name'], help="HuggingFace model id for --translator real")
+    parser.add_argument("--profile", default=DEFAULT_DECODING_PROFILE, choices=list(DECODING_PROFILES), help="Decoding profile")
+    parser.add_argument("--sentences", type=int, default=500, help="Size of the synthetic corpus")
+    parser.add_argument("--documents", type=int, default=5, help="Extractions timed per document type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Earlier --json report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging")
+    args = parser.parse_args(argv)
+
+    # Keep benchmark entries out of the real translation cache (the database is opened on first use)
+    from modules import cache
+    with tempfile.TemporaryDirectory() as tmp:
+        cache.CACHE_DB = os.path.join(tmp, "bench_cache.sqlite")
+        report = run(args)
+        cache.cache_flush()
+
+    print(f"{'stage':<22} {'sent/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for stage, r in report["stages"].items():
+        print(f"{stage:<22} {r['sentences_per_s']:>10} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['peak_rss_mb']:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("translator") != report["meta"]["translator"]:
+            print("warning: baseline used a different translator; comparison is not meaningful", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
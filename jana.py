@@ -0,0 +1,249 @@
+"""JANA command-line interface: translate documents to Japanese without Streamlit.
+
+    python jana.py report.pdf notes.docx -o results.jsonl
+    python jana.py corpus.jsonl -o results.parquet --lang en --batch-size 32
+
+Inputs may be TXT, PDF, DOCX or JSONL (one {"text": ..., "id": ...} record per
+line). Results are written as they are produced, as JSONL, CSV or Parquet.
+"""
+import argparse
+import collections
+import csv
+import json
+import logging
+import os
+import sys
+from modules.config import (
+    LOG_FILE, MODEL_CONFIGS, LANGUAGE_CODE_MAPPING, TRANSLATION_BATCH_SIZE, INFERENCE_BACKENDS, DEFAULT_INFERENCE_BACKEND,
+    DECODING_PROFILES, DEFAULT_DECODING_PROFILE, TM_REUSE_THRESHOLD, TRANSLATION_ROUTING
+)
+from modules.models import load_model_components
+from modules.processing import ProcessingOptions, process_stream, dedup_ratio, result_columns
+from modules.ingest import stream_sentences
+from modules.metrics import metrics, start_metrics_server
+from modules.workers import configure_worker_pool
+from modules.store import apply_offline_mode
+from modules.translation import router
+from modules.utils import mime_type_for_path, split_sentences, cuda_available
+
+logger = logging.getLogger("jana")
+
+OUTPUT_FORMATS = ("jsonl", "csv", "parquet")
+
+
+def iter_records(path):
+    """Yield (record_id, sentence) for every sentence of a JSONL file, in file order"""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record_id, text = record.get("id", lineno), record.get("text") or ""
+            else:
+                record_id, text = lineno, str(record)
+            for sentence in split_sentences(text):
+                yield str(record_id), sentence
+
+
+def _noting_ids(records, record_ids):
+    for record_id, sentence in records:
+        record_ids.append(record_id)
+        yield sentence
+
+
+def iter_sources(paths):
+    """Yield (source_name, sentence_iterator, record_ids) for every input document.
+
+    A JSONL file is one source, so all its records are batched and deduplicated together;
+    record_ids is then a deque that receives each sentence's record id as the sentence is
+    read (None for other inputs).
+    """
+    for path in paths:
+        if path == "-":
+            yield "<stdin>", iter(split_sentences(sys.stdin.read())), None
+        elif path.lower().endswith(".jsonl"):
+            record_ids = collections.deque()
+            yield os.path.basename(path), _noting_ids(iter_records(path), record_ids), record_ids
+        else:
+            # Documents are extracted page by page while earlier sentences are translated
+            yield os.path.basename(path), stream_sentences(path, mime_type_for_path(path)), None
+
+
+class JsonlWriter:
+    def __init__(self, path, columns):
+        self.f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, rows):
+        for row in rows:
+            self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        # Fixed header: error rows and rows without optional columns get empty cells
+        self.writer = csv.DictWriter(self.f, fieldnames=columns, restval="")
+        self.writer.writeheader()
+
+    def write(self, rows):
+        if not rows:
+            return
+        self.writer.writerows(rows)
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        import pyarrow  # optional: only needed for Parquet output
+        import pyarrow.parquet
+        self.pa = pyarrow
+        # Fixed schema: missing fields are written as nulls
+        self.schema = pyarrow.schema([(name, pyarrow.float64() if name == "Confidence" else pyarrow.string()) for name in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"jsonl": JsonlWriter, "csv": CsvWriter, "parquet": ParquetWriter}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="jana", description="Translate documents to Standard Japanese")
+    parser.add_argument("inputs", nargs="+", help="TXT, PDF, DOCX or JSONL files ('-' reads text from stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Output file ('-' for stdout)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="Output format (default: from the output extension, else jsonl)")
+    parser.add_argument("--model", default=next(iter(MODEL_CONFIGS)), choices=list(MODEL_CONFIGS), help="Model configuration")
+    parser.add_argument("--custom-model", help="HuggingFace model id overriding --model")
+    parser.add_argument("--device", help="Torch device (default: cuda when available)")
+    parser.add_argument("--backend", default=DEFAULT_INFERENCE_BACKEND, choices=list(INFERENCE_BACKENDS), help="Translator inference backend")
+    parser.add_argument("--lang", choices=list(LANGUAGE_CODE_MAPPING), help="Force the source language")
+    parser.add_argument("--furigana", action="store_true", help="Add furigana readings")
+    parser.add_argument("--profile", default=DEFAULT_DECODING_PROFILE, choices=list(DECODING_PROFILES), help="Decoding profile")
+    parser.add_argument("--routes", action=argparse.BooleanOptionalAction, default=TRANSLATION_ROUTING,
+                        help="Send languages in TRANSLATION_ROUTES to their dedicated models")
+    parser.add_argument("--tm-suggestions", action="store_true", help="Add the closest translation-memory match to each row")
+    parser.add_argument("--tm-reuse", type=float, metavar="SCORE", default=TM_REUSE_THRESHOLD,
+                        help="Reuse translation-memory matches scoring at least SCORE (0-1) instead of running the model")
+    parser.add_argument("--workers", metavar="N|auto", help="Translator worker processes on CPU ('auto' calibrates the split)")
+    parser.add_argument("--worker-threads", type=int, help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument("--pin-cores", action="store_true", help="Pin each worker process to its own cores")
+    parser.add_argument("--batch-size", type=int, default=TRANSLATION_BATCH_SIZE)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Sentences processed before results are written")
+    parser.add_argument("--debug", action="store_true", help="Log detected languages for every sentence")
+    parser.add_argument("--timings", action="store_true", help="Add a per-result timing column and print stage totals")
+    parser.add_argument("--offline", action="store_true", help="Never use the network: models come from the model store or local caches")
+    parser.add_argument("--metrics-port", type=int, help="Serve /metrics and /metrics.json on this port while running")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        filename=LOG_FILE,
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+    output_format = args.format
+    if output_format is None:
+        ext = os.path.splitext(args.output)[1].lstrip(".").lower()
+        output_format = ext if ext in OUTPUT_FORMATS else "jsonl"
+    if output_format == "parquet" and args.output == "-":
+        print("Parquet output needs a file path (-o results.parquet)", file=sys.stderr)
+        return 2
+
+    if args.offline:
+        os.environ["JANA_OFFLINE"] = "1"
+    apply_offline_mode()
+
+    device = args.device
+    if device is None:
+        device = "cuda" if cuda_available() else "cpu"
+
+    if args.workers:
+        if args.workers != "auto" and not args.workers.isdigit():
+            print("--workers takes a number or 'auto'", file=sys.stderr)
+            return 2
+        configure_worker_pool(args.workers, args.worker_threads, args.pin_cores)
+
+    def _progress(pct, text):
+        print(f"[{pct:3d}%] {text}", file=sys.stderr)
+
+    models = load_model_components(args.model, device_name=device, custom_model_name=args.custom_model,
+                                   progress=_progress, backend=args.backend, furigana=args.furigana)
+    for message in models['warnings']:
+        print(f"warning: {message}", file=sys.stderr)
+    if models['errors']:
+        for message in models['errors']:
+            print(f"error: {message}", file=sys.stderr)
+        return 1
+
+    options = ProcessingOptions(
+        furigana=args.furigana,
+        debug=args.debug,
+        model_name=models.get('translator_name'),
+        src_lang=args.lang,
+        batch_size=args.batch_size,
+        timings=args.timings,
+        profile=args.profile,
+        tm_suggestions=args.tm_suggestions,
+        tm_reuse=args.tm_reuse,
+        routing=args.routes,
+    )
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    columns = ["Source File"] + (["Record Id"] if any(path.lower().endswith(".jsonl") for path in args.inputs) else [])
+    writer = WRITERS[output_format](args.output, columns + result_columns(options))
+    total = 0
+    try:
+        for source, sentences, record_ids in iter_sources(args.inputs):
+            written = 0
+            try:
+                for results in process_stream(sentences, options, chunk_size=args.chunk_size):
+                    # Split sentences are stripped and non-empty, so rows line up with the ids read
+                    for result in results:
+                        result["Source File"] = source
+                        if record_ids is not None:
+                            result["Record Id"] = record_ids.popleft()
+                    writer.write(results)
+                    written += len(results)
+            except Exception as e:
+                logger.exception(f"Processing {source} failed")
+                print(f"error: {source}: {e}", file=sys.stderr)
+            total += written
+            print(f"{source}: {written} rows", file=sys.stderr)
+    finally:
+        writer.close()
+
+    print(f"Wrote {total} rows ({output_format}), {dedup_ratio():.1%} served from repeated sentences", file=sys.stderr)
+    if args.timings:
+        for stage, t in metrics.snapshot()["timers"].items():
+            print(f"  {stage:<16} {t['count']:>7} calls {t['total_s']:>9.3f}s total {t['mean_ms']:>9.3f} ms mean", file=sys.stderr)
+        for route in router.stats():
+            if route["route"] == "failed":
+                print(f"  route model {route['model']} unavailable: {route['error']}", file=sys.stderr)
+            else:
+                print(f"  route {route['route']:<8} {route['model']:<28} {route['sentences']:>7} sentences "
+                      f"{route['ms_per_sentence']:>9.3f} ms/sentence", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,15 @@
 import streamlit as st
-import torch
 import logging
-from modules.ui import render_info_section, render_sidebar, render_batch_processor, display_results
-from modules.models import load_models, set_models, get_models
-from modules.utils import extract_text_from_file, split_sentences
-from modules.processing import process_text_batch
-from modules.config import LOG_FILE
+from modules.ui import (
+    render_info_section, render_sidebar, render_batch_processor, render_task,
+    render_model_status, preview_upload, stream_upload_sentences, process_stream_in_page,
+    process_uploaded_files
+)
+from modules.models import configure_models, prefetch_models
+from modules.utils import split_sentences
+from modules.config import LOG_FILE, METRICS_PORT, METRICS_HOST
+from modules.metrics import start_metrics_server
+from modules.store import apply_offline_mode
 
 # Initialize logging
 logging.basicConfig(
@@ -15,6 +19,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger("jana")
 logger.info("Starting JANA app")
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT, METRICS_HOST)
+apply_offline_mode()
 
 # Page config
 st.set_page_config(
@@ -49,27 +56,21 @@ def main():
     model_option, custom_model_name, _, use_gpu = render_sidebar()
     st.session_state.model_option = model_option
     
-    # Device selection
-    device = torch.device("cuda" if torch.cuda.is_available() and use_gpu else "cpu")
+    # Device selection (the sidebar only offers the GPU when one is available)
+    device = "cuda" if use_gpu else "cpu"
     logger.info(f"Using device: {device}")
 
-    # Load models
-    models = load_models(model_option, device_name=str(device), custom_model_name=custom_model_name)
-    set_models(
-        models.get('lid_model'),
-        models.get('translator_model'),
-        models.get('translator_tokenizer'),
-        models.get('sudachi_tokenizer_obj'),
-        models.get('kakasi')
+    # Start loading models in the background; the page renders meanwhile and
+    # processing tasks wait for them only when they need them
+    translator_name = configure_models(
+        model_option,
+        device_name=device,
+        custom_model_name=custom_model_name,
+        backend=st.session_state.inference_backend
     )
-    
-    translator_name = models.get('translator_name') or 'facebook/nllb-200-distilled-600M'
-    st.session_state.translator_name = translator_name
-
-    lid_model, translator_model, _, sudachi_tokenizer_obj, _ = get_models()
-    if lid_model is None or translator_model is None or sudachi_tokenizer_obj is None:
-        st.error("Failed to load required models. Please check the error messages above and logs.")
-        st.stop()
+    prefetch_models(furigana=st.session_state.generate_furigana)
+    st.session_state.translator_name = translator_name or 'facebook/nllb-200-distilled-600M'
+    render_model_status()
 
     # Single file/text processing
     st.header("Single Document Input")
@@ -98,26 +99,25 @@ def main():
 
     # Decide which input to process
     input_text = None
+    input_file = None
     if uploaded_file:
-        input_text = extract_text_from_file(uploaded_file)
-        if input_text:
+        preview = preview_upload(uploaded_file)
+        if preview:
+            input_file = uploaded_file
             st.success("File uploaded successfully!")
             with st.expander("View extracted text"):
-                st.markdown(f'<div class="scroll-container">{input_text[:1000]}{"..." if len(input_text) > 1000 else ""}</div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="scroll-container">{preview[:1000]}{"..." if len(preview) > 1000 else ""}</div>', unsafe_allow_html=True)
     elif manual_text:
         input_text = manual_text
 
-    # Process single input
-    if input_text and st.button("Translate to Japanese", type="primary"):
-        sentences = split_sentences(input_text)
-        results = process_text_batch(sentences, batch_size=1)
-        if results:
-            st.markdown('<div class="scroll-container">', unsafe_allow_html=True)
-            display_results(results, device)
-            st.markdown('</div>', unsafe_allow_html=True)
+    # Process single input in the background; documents are streamed page by page
+    if (input_file or input_text) and st.button("Translate to Japanese", type="primary"):
+        sentences = stream_upload_sentences(input_file) if input_file else split_sentences(input_text)
+        process_stream_in_page(sentences)
+    render_task("document_task", device)
 
     # Batch processing section
-    render_batch_processor(extract_text_from_file, split_sentences, process_text_batch)
+    render_batch_processor(process_uploaded_files)
 
     # Footer with GitHub hyperlink
     st.markdown(
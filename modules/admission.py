@@ -0,0 +1,138 @@
+# Process-wide admission control: one token bucket shared by all sessions, with fair queueing
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from modules.config import (
+    ADMISSION_CAPACITY, ADMISSION_REFILL_SECONDS, ADMISSION_MAX_QUEUE, ADMISSION_TIMEOUT_SECONDS
+)
+from modules.metrics import metrics
+from modules.utils import TokenBucket
+
+logger = logging.getLogger("jana")
+
+
+class _Ticket:
+    __slots__ = ("tokens",)
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+
+class AdmissionController:
+    """Admits model work against a shared token bucket.
+
+    Requests that cannot be served at once wait in a bounded queue instead of being dropped.
+    Sessions take turns (round robin), so one session submitting a large batch cannot starve
+    the others; within a session requests are served in arrival order. A request is refused
+    only when the queue is full or its wait exceeds the timeout.
+    """
+    def __init__(self, capacity: int = ADMISSION_CAPACITY, refill_seconds: float = ADMISSION_REFILL_SECONDS,
+                 max_queue: int = ADMISSION_MAX_QUEUE, timeout: float = ADMISSION_TIMEOUT_SECONDS):
+        self.bucket = TokenBucket(capacity, refill_seconds)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        # session -> waiting tickets; order is the round-robin order of sessions
+        self._sessions = OrderedDict()
+        self._waiting = 0
+
+    def _is_next(self, session: str, ticket: _Ticket) -> bool:
+        head_session, tickets = next(iter(self._sessions.items()))
+        return head_session == session and tickets[0] is ticket
+
+    def _remove(self, session: str, ticket: _Ticket):
+        tickets = self._sessions.get(session)
+        if tickets is None:
+            return
+        tickets.remove(ticket)
+        if tickets:
+            # The session goes to the back of the line for its next request
+            self._sessions.move_to_end(session)
+        else:
+            del self._sessions[session]
+        self._waiting -= 1
+
+    def acquire(self, session: str, tokens: int = 1, timeout: float = None) -> bool:
+        """Block until tokens are granted to session; False if the queue is full or the wait times out"""
+        tokens = max(1, min(int(tokens), self.bucket.capacity))
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            if not self._sessions and self.bucket.acquire(tokens):
+                metrics.inc("admission_granted")
+                metrics.observe("admission_wait", 0.0)
+                return True
+            if self._waiting >= self.max_queue:
+                metrics.inc("admission_rejected")
+                return False
+
+            ticket = _Ticket(tokens)
+            self._sessions.setdefault(session, deque()).append(ticket)
+            self._waiting += 1
+            granted = False
+            try:
+                while True:
+                    remaining = start + timeout - time.monotonic()
+                    if self._is_next(session, ticket):
+                        if self.bucket.acquire(tokens):
+                            granted = True
+                            return True
+                        delay = min(remaining, self.bucket.wait_time(tokens))
+                    else:
+                        delay = remaining
+                    if remaining <= 0:
+                        metrics.inc("admission_timeouts")
+                        return False
+                    self._cond.wait(delay)
+            finally:
+                self._remove(session, ticket)
+                self._cond.notify_all()
+                metrics.observe("admission_wait", time.monotonic() - start)
+                if granted:
+                    metrics.inc("admission_granted")
+
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queue_depth": self._waiting,
+                "waiting_sessions": len(self._sessions),
+                "tokens_available": int(self.bucket.available()),
+                "capacity": self.bucket.capacity,
+                "refill_seconds": self.bucket.refill_seconds,
+            }
+
+
+class SessionLimiter:
+    """Limiter handle passed through ProcessingOptions: acquire(n) on behalf of one session"""
+    def __init__(self, controller: AdmissionController, session: str):
+        self.controller = controller
+        self.session = session
+
+    def acquire(self, tokens: int = 1) -> bool:
+        return self.controller.acquire(self.session, tokens)
+
+    def allow(self) -> bool:
+        return self.acquire(1)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Process-wide controller shared by every Streamlit session"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+                metrics.register_gauge("admission_queue_depth", _controller.queue_depth)
+    return _controller
+
+
+def session_limiter(session: str) -> SessionLimiter:
+    return SessionLimiter(get_admission_controller(), session)
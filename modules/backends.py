@@ -0,0 +1,116 @@
+# Translator inference backends: fp32 baseline, dynamic int8, bf16 and ONNX Runtime
+import os
+import logging
+from modules.config import INFERENCE_BACKENDS, MODEL_CACHE_DIR
+from modules.store import DTYPES, apply_offline_mode, find_snapshot, hub_kwargs, load_snapshot, pretrained_source
+
+logger = logging.getLogger("jana")
+
+
+def backend_cache_dir(model_name: str, backend: str) -> str:
+    """On-disk location of a converted model; versions are part of the path since pickles are not portable"""
+    import torch
+    import transformers
+    versions = f"torch{torch.__version__}-transformers{transformers.__version__}".replace("+", "_")
+    return os.path.join(MODEL_CACHE_DIR, model_name.replace("/", "--"), f"{backend}-{versions}")
+
+
+def cpu_supports_bf16() -> bool:
+    """True when the CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def _load_int8(model_name: str):
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    path = os.path.join(backend_cache_dir(model_name, "int8"), "model.pt")
+    if os.path.exists(path):
+        return torch.load(path, weights_only=False)
+
+    source, kwargs = pretrained_source(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(source, **kwargs).eval()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.save(model, path)
+    logger.info(f"Cached int8 translator at {path}")
+    return model
+
+
+def _load_bf16(model_name: str):
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    stored = find_snapshot(model_name, "bf16")
+    if stored:
+        return load_snapshot(stored)
+    path = backend_cache_dir(model_name, "bf16")
+    if os.path.isdir(path):
+        return AutoModelForSeq2SeqLM.from_pretrained(path, torch_dtype=torch.bfloat16)
+
+    source, kwargs = pretrained_source(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(source, torch_dtype=torch.bfloat16, **kwargs)
+    model.save_pretrained(path, safe_serialization=True)
+    logger.info(f"Cached bf16 translator at {path}")
+    return model
+
+
+def _load_onnx(model_name: str):
+    # Optional dependency: pip install optimum[onnxruntime]
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    path = backend_cache_dir(model_name, "onnx")
+    if os.path.isdir(path):
+        return ORTModelForSeq2SeqLM.from_pretrained(path, use_cache=True)
+
+    # Exports encoder, decoder and decoder-with-past so generation reuses the KV-cache
+    source, kwargs = pretrained_source(model_name)
+    model = ORTModelForSeq2SeqLM.from_pretrained(source, export=True, use_cache=True, **kwargs)
+    model.save_pretrained(path)
+    logger.info(f"Cached ONNX translator at {path}")
+    return model
+
+
+def load_translator(model_name: str, backend: str = "fp32", device_name: str = "cpu"):
+    """Return (tokenizer, model, backend actually used); unsupported backends fall back to fp32"""
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'")
+    # Imported here so the app can start before torch/transformers are loaded
+    apply_offline_mode()
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    # Every store snapshot carries the tokenizer
+    source, kwargs = pretrained_source(model_name, DTYPES)
+    tokenizer = AutoTokenizer.from_pretrained(source, **kwargs)
+
+    if device_name.startswith("cuda") and not torch.cuda.is_available():
+        logger.warning(f"{device_name} requested but CUDA is not available; using cpu")
+        device_name = "cpu"
+
+    if backend != "fp32" and device_name != "cpu":
+        logger.warning(f"Backend '{backend}' is CPU-only; using fp32 on {device_name}")
+        backend = "fp32"
+    if backend == "bf16" and not cpu_supports_bf16():
+        logger.warning("CPU has no native bf16 support; using fp32")
+        backend = "fp32"
+
+    try:
+        if backend == "int8":
+            return tokenizer, _load_int8(model_name), backend
+        if backend == "bf16":
+            return tokenizer, _load_bf16(model_name), backend
+        if backend == "onnx":
+            return tokenizer, _load_onnx(model_name), backend
+    except Exception:
+        logger.exception(f"Could not prepare '{backend}' backend for {model_name}; using fp32")
+
+    # Store snapshots load memory-mapped; fp16 is preferred on GPU when one was prebuilt
+    stored = find_snapshot(model_name, "fp16") if device_name.startswith("cuda") else None
+    stored = stored or find_snapshot(model_name, "fp32")
+    if stored:
+        return tokenizer, load_snapshot(stored, device_name), "fp32"
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name, **hub_kwargs())
+    return tokenizer, model.to(device_name), "fp32"
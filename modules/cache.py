@@ -0,0 +1,619 @@
+# Translation cache: SQLite (WAL) behind an in-process LRU, with write-behind inserts
+import sqlite3
+import hashlib
+import threading
+import queue
+import atexit
+import time
+import logging
+import json
+import argparse
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from modules.config import (
+    CACHE_DB, CACHE_LRU_SIZE, CACHE_WRITE_BATCH, CACHE_FLUSH_INTERVAL,
+    CACHE_MAX_ROWS, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, CACHE_MAINTENANCE_EVERY, MODEL_CONFIGS,
+    TM_MAX_CANDIDATES, TM_BUCKET_LIMIT, TM_BACKFILL_BATCH
+)
+from modules.metrics import metrics
+from modules.memory import band_keys, best_match
+
+logger = logging.getLogger("jana")
+
+# SQLite's default limit on bound parameters is 999
+_SQLITE_MAX_VARS = 900
+
+_UPSERT_SQL = """
+    INSERT INTO translations (cache_key, src_text, src_lang, model, translation, created_ts, last_hit_ts, hit_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+    ON CONFLICT(cache_key) DO UPDATE SET
+        translation = excluded.translation,
+        created_ts = excluded.created_ts,
+        last_hit_ts = excluded.last_hit_ts
+"""
+
+PROFILE_SEPARATOR = "#"
+
+_TOUCH_SQL = "UPDATE translations SET last_hit_ts = ?, hit_count = hit_count + ? WHERE cache_key = ?"
+
+# In-process counters; evictions are also persisted in cache_meta
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+    metrics.inc(f"cache_{name}", n)
+
+
+def cache_namespace(model_name: str, profile: str) -> str:
+    """Model column value for translations made with a decoding profile, e.g. 'facebook/m2m100_418M#fast'"""
+    return f"{model_name}{PROFILE_SEPARATOR}{profile}"
+
+
+def cache_key(src_text: str, src_lang: str, model_name: str) -> str:
+    """Hashed composite key for (src_text, src_lang, model)"""
+    raw = f"{model_name}\x1f{src_lang}\x1f{src_text}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CACHE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _migrate_legacy_rows(conn: sqlite3.Connection):
+    """Fill cache_key for rows written before the key existed and drop duplicates"""
+    conn.create_function("jana_cache_key", 3, cache_key)
+    conn.execute("UPDATE translations SET cache_key = jana_cache_key(src_text, src_lang, model) WHERE cache_key IS NULL")
+    # Keep the most recent translation for each key
+    conn.execute("DELETE FROM translations WHERE id NOT IN (SELECT MAX(id) FROM translations GROUP BY cache_key)")
+    logger.info("Migrated legacy translation cache rows to hashed keys")
+
+
+def init_cache_db() -> sqlite3.Connection:
+    conn = _connect()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS translations (
+            id INTEGER PRIMARY KEY,
+            src_text TEXT,
+            src_lang TEXT,
+            model TEXT,
+            translation TEXT,
+            created_ts INTEGER,
+            cache_key TEXT,
+            last_hit_ts INTEGER,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT)")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(translations)")}
+    if "cache_key" not in columns:
+        conn.execute("ALTER TABLE translations ADD COLUMN cache_key TEXT")
+    if "last_hit_ts" not in columns:
+        conn.execute("ALTER TABLE translations ADD COLUMN last_hit_ts INTEGER")
+        conn.execute("UPDATE translations SET last_hit_ts = created_ts")
+    if "hit_count" not in columns:
+        conn.execute("ALTER TABLE translations ADD COLUMN hit_count INTEGER DEFAULT 0")
+    if conn.execute("SELECT 1 FROM translations WHERE cache_key IS NULL LIMIT 1").fetchone():
+        _migrate_legacy_rows(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_translations_cache_key ON translations(cache_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_hit ON translations(last_hit_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_model ON translations(model)")
+    _init_memory_index(conn)
+    conn.commit()
+    _sync_configured_models(conn, [cfg['name'] for cfg in MODEL_CONFIGS.values() if cfg.get('name')])
+    return conn
+
+
+def _get_meta(conn: sqlite3.Connection, key: str, default=None):
+    row = conn.execute("SELECT value FROM cache_meta WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value):
+    conn.execute(
+        "INSERT INTO cache_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, json.dumps(value))
+    )
+
+
+def _sync_configured_models(conn: sqlite3.Connection, configured: List[str]):
+    """Purge entries of models that were removed from MODEL_CONFIGS since the last start"""
+    previous = _get_meta(conn, "configured_models")
+    if previous is not None:
+        for model_name in set(previous) - set(configured):
+            removed = _purge_model(conn, model_name)
+            logger.info(f"Purged {removed} cached translations of retired model {model_name}")
+    _set_meta(conn, "configured_models", sorted(configured))
+    conn.commit()
+
+
+# Translation memory index: one row per (LSH bucket, translations.id)
+def _init_memory_index(conn: sqlite3.Connection):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tm_bands'").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tm_bands (
+            band_key INTEGER,
+            row_id INTEGER,
+            PRIMARY KEY (band_key, row_id)
+        ) WITHOUT ROWID
+    """)
+    if not exists:
+        # Rows written from now on are indexed by the writer; older ones are backfilled while it is idle
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM translations").fetchone()[0]
+        _set_meta(conn, "tm_backfill", {"next_id": 0, "until_id": max_id})
+
+
+def _index_rows(conn: sqlite3.Connection, rows: Iterable[tuple]) -> int:
+    """Add (id, src_text, src_lang, model) rows to the memory index"""
+    entries = [(key, row_id) for row_id, src_text, src_lang, model in rows for key in band_keys(src_text, src_lang, model)]
+    conn.executemany("INSERT OR IGNORE INTO tm_bands (band_key, row_id) VALUES (?, ?)", entries)
+    return len(entries)
+
+
+def _index_written(conn: sqlite3.Connection, keys: List[str]):
+    for start in range(0, len(keys), _SQLITE_MAX_VARS):
+        chunk = keys[start:start + _SQLITE_MAX_VARS]
+        placeholders = ",".join("?" * len(chunk))
+        _index_rows(conn, conn.execute(
+            f"SELECT id, src_text, src_lang, model FROM translations WHERE cache_key IN ({placeholders})", chunk
+        ).fetchall())
+
+
+def _backfill_memory_index(conn: sqlite3.Connection, limit: int = TM_BACKFILL_BATCH) -> int:
+    """Index up to limit rows that predate the memory index; returns how many were indexed"""
+    state = _get_meta(conn, "tm_backfill")
+    if not state or state["next_id"] >= state["until_id"]:
+        return 0
+    rows = conn.execute(
+        "SELECT id, src_text, src_lang, model FROM translations WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+        (state["next_id"], state["until_id"], limit)
+    ).fetchall()
+    _index_rows(conn, rows)
+    state["next_id"] = rows[-1][0] if rows else state["until_id"]
+    _set_meta(conn, "tm_backfill", state)
+    conn.commit()
+    return len(rows)
+
+
+def _prune_memory_index(conn: sqlite3.Connection):
+    """Drop index entries of evicted or purged translations"""
+    conn.execute("DELETE FROM tm_bands WHERE row_id NOT IN (SELECT id FROM translations)")
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used key"""
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class WriteBehindQueue:
+    """Background thread that commits queued cache rows in groups"""
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Hit timestamps are coalesced per key instead of queued one by one
+        self._touches = {}
+        self._touch_lock = threading.Lock()
+        self._writes_since_maintenance = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="jana-cache-writer", daemon=True)
+                self._thread.start()
+
+    def put(self, row: tuple):
+        self._ensure_started()
+        self._queue.put(row)
+
+    def touch(self, key: str):
+        self._ensure_started()
+        with self._touch_lock:
+            ts, hits = self._touches.get(key, (0, 0))
+            self._touches[key] = (int(time.time()), hits + 1)
+
+    def flush(self):
+        """Block until every queued row has been committed"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)  # wake the writer so pending touches are written too
+            self._queue.join()
+
+    def _drain_touches(self) -> list:
+        with self._touch_lock:
+            touches, self._touches = self._touches, {}
+        return [(ts, hits, key) for key, (ts, hits) in touches.items()]
+
+    def _run(self):
+        conn = _connect()
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while batch and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            touches = self._drain_touches()
+            try:
+                if rows:
+                    conn.executemany(_UPSERT_SQL, rows)
+                    _index_written(conn, [row[0] for row in rows])
+                if touches:
+                    conn.executemany(_TOUCH_SQL, touches)
+                if rows or touches:
+                    conn.commit()
+            except Exception:
+                logger.exception("cache write-behind commit failed")
+                conn.rollback()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if not batch:
+                try:
+                    _backfill_memory_index(conn)
+                except Exception:
+                    logger.exception("translation memory backfill failed")
+                    conn.rollback()
+
+            self._writes_since_maintenance += len(rows)
+            if self._writes_since_maintenance >= CACHE_MAINTENANCE_EVERY:
+                self._writes_since_maintenance = 0
+                try:
+                    _enforce_limits(conn)
+                except Exception:
+                    logger.exception("cache maintenance failed")
+
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+_lru = LRUCache(CACHE_LRU_SIZE)
+_writer = WriteBehindQueue(CACHE_WRITE_BATCH, CACHE_FLUSH_INTERVAL)
+
+
+def _reader() -> sqlite3.Connection:
+    """Per-thread read connection (WAL lets readers run alongside the writer)"""
+    global _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                init_cache_db().close()
+                _initialized = True
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+
+def _expiry_cutoff() -> Optional[int]:
+    """created_ts below which entries have outlived CACHE_TTL_SECONDS, or None without a TTL"""
+    return int(time.time()) - int(CACHE_TTL_SECONDS) if CACHE_TTL_SECONDS else None
+
+
+def _fresh_clause(cutoff: Optional[int]) -> Tuple[str, tuple]:
+    # Expired rows are skipped at read time; maintenance deletes them later
+    return (" AND created_ts >= ?", (cutoff,)) if cutoff is not None else ("", ())
+
+
+def _lru_get(key: str, cutoff: Optional[int]) -> Optional[str]:
+    """LRU entries are (translation, created_ts); expired ones are dropped on sight"""
+    entry = _lru.get(key)
+    if entry is None:
+        return None
+    translation, created_ts = entry
+    if cutoff is not None and created_ts < cutoff:
+        _lru.discard(key)
+        return None
+    return translation
+
+
+def cache_lookup(src_text: str, src_lang: str, model_name: str) -> Optional[str]:
+    key = cache_key(src_text, src_lang, model_name)
+    cutoff = _expiry_cutoff()
+    with metrics.timer("cache_lookup"):
+        cached = _lru_get(key, cutoff)
+        if cached is None:
+            clause, params = _fresh_clause(cutoff)
+            row = _reader().execute(
+                f"SELECT translation, created_ts FROM translations WHERE cache_key = ?{clause}", (key, *params)
+            ).fetchone()
+            if row:
+                cached = row[0]
+                _lru.put(key, (cached, row[1] or 0))
+    if cached is None:
+        _count("misses")
+        return None
+    _count("hits")
+    _writer.touch(key)
+    return cached
+
+
+def cache_lookup_many(texts: List[str], src_lang: str, model_name: str) -> Dict[str, str]:
+    """Resolve a whole batch of texts, returning {src_text: translation} for the hits"""
+    with metrics.timer("cache_lookup"):
+        found = _lookup_many(texts, src_lang, model_name)
+    _count("hits", len(found))
+    _count("misses", len(texts) - len(found))
+    return found
+
+
+def _lookup_many(texts: List[str], src_lang: str, model_name: str) -> Dict[str, str]:
+    found = {}
+    missing = {}
+    cutoff = _expiry_cutoff()
+    clause, params = _fresh_clause(cutoff)
+    for text in texts:
+        key = cache_key(text, src_lang, model_name)
+        cached = _lru_get(key, cutoff)
+        if cached is not None:
+            found[text] = cached
+            _writer.touch(key)
+        else:
+            missing[key] = text
+
+    keys = list(missing)
+    for start in range(0, len(keys), _SQLITE_MAX_VARS):
+        chunk = keys[start:start + _SQLITE_MAX_VARS]
+        placeholders = ",".join("?" * len(chunk))
+        rows = _reader().execute(
+            f"SELECT cache_key, translation, created_ts FROM translations WHERE cache_key IN ({placeholders}){clause}",
+            (*chunk, *params)
+        ).fetchall()
+        for key, translation, created_ts in rows:
+            _lru.put(key, (translation, created_ts or 0))
+            _writer.touch(key)
+            found[missing[key]] = translation
+    return found
+
+
+def cache_fuzzy_lookup_many(texts: List[str], src_lang: str, model_name: str, threshold: float,
+                            exclude_identical: bool = True) -> List[Optional[Tuple[float, str, str]]]:
+    """Closest cached translation for each text: (score, cached source text, translation) or None.
+
+    Candidates come from the LSH buckets the text falls in (same language and cache namespace)
+    and are scored with memory.best_match; only matches scoring at least threshold are returned.
+    exclude_identical skips entries whose source is exactly the text (the exact cache covers those).
+    """
+    conn = _reader()
+    clause, params = _fresh_clause(_expiry_cutoff())
+    matches = []
+    with metrics.timer("tm_lookup"):
+        for text in texts:
+            shared = {}
+            for key in band_keys(text, src_lang, model_name):
+                for (row_id,) in conn.execute(
+                    "SELECT row_id FROM tm_bands WHERE band_key = ? LIMIT ?", (key, TM_BUCKET_LIMIT)
+                ):
+                    shared[row_id] = shared.get(row_id, 0) + 1
+            best = None
+            if shared:
+                candidates = sorted(shared, key=shared.get, reverse=True)[:TM_MAX_CANDIDATES]
+                placeholders = ",".join("?" * len(candidates))
+                rows = conn.execute(
+                    f"SELECT src_text, translation FROM translations WHERE id IN ({placeholders}){clause}",
+                    (*candidates, *params)
+                ).fetchall()
+                best = best_match(text, [row for row in rows if not (exclude_identical and row[0] == text)], threshold)
+            matches.append(best)
+    metrics.inc("tm_matches", sum(match is not None for match in matches))
+    return matches
+
+
+def cache_store(src_text: str, src_lang: str, model_name: str, translation: str):
+    key = cache_key(src_text, src_lang, model_name)
+    now = int(time.time())
+    _lru.put(key, (translation, now))
+    _reader()  # make sure the schema exists before the writer thread runs
+    _writer.put((key, src_text, src_lang, model_name, translation, now, now))
+
+
+def cache_flush():
+    _writer.flush()
+
+
+# Maintenance
+def _used_bytes(conn: sqlite3.Connection) -> int:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - free_pages) * page_size
+
+
+def _record_evictions(conn: sqlite3.Connection, n: int):
+    if n <= 0:
+        return
+    _count("evictions", n)
+    _set_meta(conn, "evictions", _get_meta(conn, "evictions", 0) + n)
+    # Evicted keys may still sit in the LRU; start it over rather than tracking them
+    _lru.clear()
+
+
+def _evict_oldest(conn: sqlite3.Connection, n: int) -> int:
+    cur = conn.execute(
+        "DELETE FROM translations WHERE id IN (SELECT id FROM translations ORDER BY last_hit_ts ASC LIMIT ?)",
+        (n,)
+    )
+    return cur.rowcount
+
+
+def _enforce_limits(conn: sqlite3.Connection) -> int:
+    evicted = 0
+    if CACHE_TTL_SECONDS:
+        cutoff = int(time.time()) - int(CACHE_TTL_SECONDS)
+        evicted += conn.execute("DELETE FROM translations WHERE created_ts < ?", (cutoff,)).rowcount
+
+    rows = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+    if CACHE_MAX_ROWS and rows > CACHE_MAX_ROWS:
+        evicted += _evict_oldest(conn, rows - CACHE_MAX_ROWS)
+        rows = CACHE_MAX_ROWS
+
+    if CACHE_MAX_BYTES and rows:
+        used = _used_bytes(conn)
+        if used > CACHE_MAX_BYTES:
+            # Estimate how many rows cover the overflow from the average row footprint
+            per_row = max(1, used // rows)
+            evicted += _evict_oldest(conn, (used - CACHE_MAX_BYTES) // per_row + 1)
+
+    if evicted:
+        _prune_memory_index(conn)
+    _record_evictions(conn, evicted)
+    conn.commit()
+    if evicted:
+        logger.info(f"Translation cache evicted {evicted} entries")
+    return evicted
+
+
+def _purge_model(conn: sqlite3.Connection, model_name: str) -> int:
+    # A model name covers its entries under every decoding profile
+    prefix = model_name + PROFILE_SEPARATOR
+    removed = conn.execute(
+        "DELETE FROM translations WHERE model = ? OR substr(model, 1, ?) = ?",
+        (model_name, len(prefix), prefix)
+    ).rowcount
+    if removed:
+        _prune_memory_index(conn)
+    _lru.clear()
+    return removed
+
+
+def cache_enforce_limits() -> int:
+    """Apply TTL and size limits now, returning the number of evicted entries"""
+    cache_flush()
+    _reader()
+    conn = _connect()
+    try:
+        return _enforce_limits(conn)
+    finally:
+        conn.close()
+
+
+def cache_purge_model(model_name: str) -> int:
+    """Drop every cached translation produced by model_name (all profiles, unless model_name names one)"""
+    cache_flush()
+    _reader()
+    conn = _connect()
+    try:
+        removed = _purge_model(conn, model_name)
+        conn.commit()
+        return removed
+    finally:
+        conn.close()
+
+
+def cache_compact():
+    """Enforce limits, checkpoint the WAL and VACUUM the file (best run while the app is idle)"""
+    cache_enforce_limits()
+    conn = _connect()
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def cache_index_memory() -> int:
+    """Finish backfilling the translation memory index now; returns the number of rows indexed"""
+    cache_flush()
+    _reader()
+    conn = _connect()
+    try:
+        total = 0
+        while True:
+            indexed = _backfill_memory_index(conn)
+            if not indexed:
+                return total
+            total += indexed
+    finally:
+        conn.close()
+
+
+def cache_stats() -> dict:
+    conn = _reader()
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["rows"] = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+    stats["bytes"] = _used_bytes(conn)
+    stats["evictions_total"] = _get_meta(conn, "evictions", 0)
+    stats["lru_entries"] = len(_lru)
+    return stats
+
+
+atexit.register(cache_flush)
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="JANA translation cache maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Print cache size and eviction counters")
+    sub.add_parser("enforce", help="Apply TTL and size limits")
+    sub.add_parser("compact", help="Enforce limits, then checkpoint and VACUUM")
+    sub.add_parser("index-memory", help="Index existing entries for translation memory lookups now")
+    purge = sub.add_parser("purge", help="Remove every entry of a model (or of one profile: MODEL#PROFILE)")
+    purge.add_argument("model")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(json.dumps(cache_stats(), indent=2))
+    elif args.command == "enforce":
+        print(f"Evicted {cache_enforce_limits()} entries")
+    elif args.command == "compact":
+        cache_compact()
+        print(json.dumps(cache_stats(), indent=2))
+    elif args.command == "index-memory":
+        print(f"Indexed {cache_index_memory()} entries")
+    elif args.command == "purge":
+        print(f"Removed {cache_purge_model(args.model)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Token-budget-aware segmentation and batch packing for the translator
+import re
+from typing import List, Tuple
+
+# Pieces ending after clause punctuation (Latin and CJK) or after a word; trailing whitespace stays attached
+CLAUSE_PIECE = re.compile(r'.*?[,;:、，；：]\s*|.+', re.S)
+WORD_PIECE = re.compile(r'\S+\s*|\s+')
+
+
+def token_lengths(texts: List[str], tokenizer) -> List[int]:
+    """Token count of each text as the translator will see it (special tokens included)"""
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=True)["input_ids"]]
+
+
+def _pack_pieces(pieces: List[str], lengths: List[int], max_tokens: int) -> List[str]:
+    """Greedily join adjacent pieces while they stay within max_tokens"""
+    packed = []
+    current, current_len = "", 0
+    for piece, length in zip(pieces, lengths):
+        if current and current_len + length > max_tokens:
+            packed.append(current)
+            current, current_len = "", 0
+        current += piece
+        current_len += length
+    if current:
+        packed.append(current)
+    return packed
+
+
+def _split_pieces(text: str, pattern) -> List[str]:
+    return pattern.findall(text)
+
+
+def split_long(text: str, tokenizer, max_tokens: int) -> List[str]:
+    """Split an over-long text at clause boundaries, then words, then characters"""
+    for pattern in (CLAUSE_PIECE, WORD_PIECE):
+        pieces = _split_pieces(text, pattern)
+        if len(pieces) > 1:
+            break
+    else:
+        # No usable boundary (e.g. unspaced CJK): cut into equal character runs
+        n_parts = -(-token_lengths([text], tokenizer)[0] // max_tokens)
+        step = max(1, -(-len(text) // n_parts))
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    lengths = token_lengths(pieces, tokenizer)
+    segments = []
+    for piece in _pack_pieces(pieces, lengths, max_tokens):
+        if len(piece) > 1 and token_lengths([piece], tokenizer)[0] > max_tokens:
+            segments.extend(split_long(piece, tokenizer, max_tokens))
+        else:
+            segments.append(piece)
+    return segments
+
+
+def plan_segments(texts: List[str], tokenizer, max_tokens: int) -> Tuple[List[str], List[int], List[int]]:
+    """Return (segments, segment token lengths, alignment) where alignment[k] is the text index of segment k"""
+    lengths = token_lengths(texts, tokenizer)
+    segments, seg_lengths, alignment = [], [], []
+    for i, (text, length) in enumerate(zip(texts, lengths)):
+        if length <= max_tokens:
+            parts, part_lengths = [text], [length]
+        else:
+            parts = [part.strip() for part in split_long(text, tokenizer, max_tokens)]
+            parts = [part for part in parts if part]
+            part_lengths = token_lengths(parts, tokenizer)
+        segments.extend(parts)
+        seg_lengths.extend(part_lengths)
+        alignment.extend([i] * len(parts))
+    return segments, seg_lengths, alignment
+
+
+def pack_batches(lengths: List[int], token_budget: int, max_batch_size: int) -> List[List[int]]:
+    """Group segment indices, shortest first, so each padded batch stays within token_budget"""
+    batches = []
+    current, current_max = [], 0
+    for idx in sorted(range(len(lengths)), key=lambda k: lengths[k]):
+        new_max = max(current_max, lengths[idx])
+        if current and (new_max * (len(current) + 1) > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, new_max = [], lengths[idx]
+        current.append(idx)
+        current_max = new_max
+    if current:
+        batches.append(current)
+    return batches
+
+
+def merge_segments(outputs: List[str], alignment: List[int], n_texts: int) -> List[str]:
+    """Join translated segments back into one string per original text"""
+    merged = [""] * n_texts
+    for output, i in zip(outputs, alignment):
+        merged[i] += output
+    return merged
@@ -1,6 +1,5 @@
 # Configuration constants
 import os
-import streamlit as st
 
 LANGUAGE_CODE_MAPPING = {
     "en": "en",
@@ -21,5 +20,120 @@ MODEL_CONFIGS = {
     }
 }
 
+# Translation routes: dedicated models per source language, tried in order before the
+# multilingual model above (which also serves every language without a working route).
+# Off by default: routed languages are translated by a different model, downloaded on first
+# use unless prebuilt (python -m modules.store prebuild --routes)
+TRANSLATION_ROUTES = {
+    'en': ['staka/fugumt-en-ja'],   # Marian en->ja, several times faster than m2m100 on CPU
+}
+TRANSLATION_ROUTING = False
+
 LOG_FILE = "jana_app.log"
 CACHE_DB = "translation_cache.sqlite"
+
+# Number of sentences sent through the translator per generate call
+TRANSLATION_BATCH_SIZE = 16
+
+# Translation cache tuning
+CACHE_LRU_SIZE = 50000        # entries kept in memory in front of SQLite
+CACHE_WRITE_BATCH = 256       # rows committed per write-behind transaction
+CACHE_FLUSH_INTERVAL = 0.5    # seconds the writer waits to fill a batch
+
+# Translation cache limits (None disables a limit)
+CACHE_MAX_ROWS = 500000
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_TTL_SECONDS = None      # e.g. 30 * 24 * 3600 to expire entries after 30 days
+CACHE_MAINTENANCE_EVERY = 5000  # written rows between automatic limit checks
+
+# Repeated sentences (same dedup key) reuse one result; results kept per document stream
+DEDUP_MEMO_SIZE = 10000
+
+# Translation memory: near-duplicate lookups over the cache (MinHash/LSH on character n-grams)
+TM_NGRAM = 3
+TM_PERMUTATIONS = 32
+TM_BANDS = 8                  # LSH bands of TM_PERMUTATIONS / TM_BANDS rows each
+TM_MIN_CHARS = 8              # shorter sentences are neither indexed nor matched
+TM_MAX_CANDIDATES = 20        # candidates scored per sentence, most shared buckets first
+TM_VERIFY = 3                 # top candidates (by n-gram overlap) given the full edit-based score
+TM_BUCKET_LIMIT = 200         # rows read per bucket, bounding lookups on very common buckets
+TM_SUGGEST_THRESHOLD = 0.75   # lowest score shown as a suggestion
+TM_REUSE_THRESHOLD = None     # e.g. 0.95 reuses close matches instead of running the model
+TM_BACKFILL_BATCH = 1000      # existing rows indexed per idle writer cycle
+
+# Streaming ingestion
+STREAM_QUEUE_SIZE = 1024      # sentences buffered between extraction and translation
+STREAM_CHUNK_SIZE = 64        # sentences processed per streamed result chunk
+
+# Worker processes used to extract text from uploaded files in parallel
+EXTRACTION_WORKERS = min(4, os.cpu_count() or 1)
+
+# Translator input shaping (tokens as counted by the loaded tokenizer)
+SEGMENT_MAX_TOKENS = 200      # longer sentences are split at clause boundaries
+BATCH_TOKEN_BUDGET = 4096     # padded tokens per generate call (batch rows x longest row)
+
+# Translator inference backends (converted models are cached under MODEL_CACHE_DIR)
+INFERENCE_BACKENDS = {
+    'fp32': 'PyTorch fp32 (baseline)',
+    'int8': 'PyTorch dynamic int8 (CPU)',
+    'bf16': 'PyTorch bf16 (CPUs with native bf16)',
+    'onnx': 'ONNX Runtime with KV-cache (needs optimum[onnxruntime])',
+}
+DEFAULT_INFERENCE_BACKEND = 'fp32'
+MODEL_CACHE_DIR = "model_cache"
+
+# Local model store: snapshots written by `python -m modules.store prebuild`, used before the hub
+MODEL_STORE_DIR = "model_store"
+MODEL_STORE_VERIFY = "size"       # check snapshots on load by "size" (fast) or "sha256" (reads every file)
+OFFLINE_MODE = False              # never use the network (also enabled by JANA_OFFLINE=1)
+FASTTEXT_MODEL_URL = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz"
+
+# Decoding profiles (generate kwargs plus a UI label); the profile is part of the cache namespace
+DECODING_PROFILES = {
+    'fast': {'label': 'Fast (greedy)', 'num_beams': 1, 'no_repeat_ngram_size': 3},
+    'balanced': {'label': 'Balanced (2 beams)', 'num_beams': 2, 'no_repeat_ngram_size': 3, 'early_stopping': True},
+    'quality': {'label': 'Quality (5 beams)', 'num_beams': 5, 'no_repeat_ngram_size': 3, 'early_stopping': True},
+}
+DEFAULT_DECODING_PROFILE = 'quality'
+# Output budget per generate call: max_new_tokens = ceil(longest input tokens x ratio) + offset
+GENERATION_LENGTH_RATIO = 2.0
+GENERATION_LENGTH_OFFSET = 16
+
+# Shared inference service (micro-batching across sessions)
+SERVING_MAX_BATCH_SIZE = 32   # segments per generate call across all waiting requests
+SERVING_MAX_WAIT_MS = 10      # how long the worker waits for more requests to join a batch
+
+# CPU translator worker processes (each loads its own model copy); None/0 runs generate in-process,
+# "auto" picks the worker/thread split by calibration (cached in MODEL_CACHE_DIR)
+WORKER_POOL_SIZE = None
+WORKER_THREADS = None             # torch threads per worker (default: cores // workers)
+WORKER_AFFINITY = False           # pin each worker to its own cores (Linux)
+WORKER_CALIBRATION_SENTENCES = 64
+
+# Server-wide admission control: one token per sentence sent to the model (cache hits are free)
+ADMISSION_CAPACITY = 600          # burst size in tokens
+ADMISSION_REFILL_SECONDS = 60     # time to refill the whole bucket
+ADMISSION_MAX_QUEUE = 256         # waiting requests before new ones are refused
+ADMISSION_TIMEOUT_SECONDS = 30    # longest a request waits for its tokens
+
+# Resumable batch jobs: inputs, per-chunk checkpoints and results live in their own SQLite file
+JOBS_DB = "jana_jobs.sqlite"
+JOB_CHUNK_SIZE = 256              # sentences per checkpoint
+JOB_RETRY_SECONDS = 5             # pause before re-running a chunk that hit the admission limit
+
+# Interactive processing runs as in-memory background tasks polled by the page
+TASK_WORKERS = 2                  # tasks running at once across all sessions
+TASK_RETENTION_SECONDS = 3600     # finished tasks (and their results) are dropped after this
+TASK_PROGRESS_INTERVAL = 1.0      # progress is published at most this often (seconds) ...
+TASK_PROGRESS_STEP = 0.05         # ... or when it moved by this fraction of the total
+TASK_POLL_SECONDS = 1.0           # how often the page refreshes a running task
+
+# Result tables in the page are shown this many rows at a time
+RESULT_PAGE_SIZES = (100, 500, 2000)
+
+# Free cached CUDA blocks only when reserved memory is above this fraction of the device
+GPU_CACHE_RELEASE_FRACTION = 0.85
+
+# Metrics endpoint (/metrics Prometheus text, /metrics.json); None keeps it off
+METRICS_PORT = None
+METRICS_HOST = "127.0.0.1"
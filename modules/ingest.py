@@ -0,0 +1,139 @@
+# Streaming document ingestion: pages/paragraphs -> sentences -> bounded queue
+import re
+import time
+import queue
+import threading
+import logging
+from io import BytesIO, StringIO
+from typing import Iterable, Iterator, List, Tuple
+import pypdf
+import docx2txt
+from modules.config import STREAM_QUEUE_SIZE
+from modules.utils import SENTENCE_BOUNDARY
+from modules.metrics import metrics
+
+logger = logging.getLogger("jana")
+
+# Characters of plain text handed to the splitter at a time
+_TEXT_BLOCK_CHARS = 64 * 1024
+
+_DONE = object()
+
+
+def _iter_text_blocks(text_stream) -> Iterator[str]:
+    while True:
+        block = text_stream.read(_TEXT_BLOCK_CHARS)
+        if not block:
+            return
+        yield block
+
+
+def iter_text_chunks(source, mime_type: str) -> Iterator[str]:
+    """Yield consecutive pieces of a document's text; concatenated they form the full text"""
+    if mime_type == "text/plain":
+        if isinstance(source, str):
+            with open(source, encoding="utf-8") as f:
+                yield from _iter_text_blocks(f)
+        else:
+            data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+            yield from _iter_text_blocks(StringIO(data.decode("utf-8")))
+    elif mime_type == "application/pdf":
+        reader = pypdf.PdfReader(source)
+        previous_ends_with_space = True
+        for page in reader.pages:
+            # Same whitespace collapsing as extract_text, applied one page at a time
+            text = re.sub(r'\s+', ' ', (page.extract_text() or "") + "\n")
+            if previous_ends_with_space:
+                text = text.lstrip()
+            if text:
+                previous_ends_with_space = text.endswith(" ")
+                yield text
+    elif mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        # docx2txt has no incremental API; split its output into paragraphs
+        for paragraph in docx2txt.process(source).splitlines(keepends=True):
+            yield paragraph
+    else:
+        raise ValueError(f"Unsupported file type: {mime_type}")
+
+
+def iter_sentences(chunks: Iterable[str]) -> Iterator[str]:
+    """Split text incrementally; the trailing fragment of each chunk is carried into the next"""
+    carry = ""
+    for chunk in chunks:
+        parts = SENTENCE_BOUNDARY.split(carry + chunk)
+        carry = parts.pop()
+        for part in parts:
+            part = part.strip()
+            if len(part) > 1:
+                yield part
+    carry = carry.strip()
+    if len(carry) > 1:
+        yield carry
+
+
+def stream_sentences(source, mime_type: str, maxsize: int = STREAM_QUEUE_SIZE) -> Iterator[str]:
+    """Extract and split on a background thread, handing sentences over through a bounded queue"""
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        busy = 0.0  # extraction time, excluding time blocked on a full queue
+        try:
+            t0 = time.perf_counter()
+            for sentence in iter_sentences(iter_text_chunks(source, mime_type)):
+                busy += time.perf_counter() - t0
+                if not _put(sentence):
+                    return
+                t0 = time.perf_counter()
+            busy += time.perf_counter() - t0
+            metrics.observe("extraction", busy)
+            _put(_DONE)
+        except Exception as e:
+            logger.exception("stream_sentences extraction failed")
+            _put(e)
+
+    producer = threading.Thread(target=_produce, name="jana-ingest", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Unblocks the producer if the consumer stops early
+        stop.set()
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def extract_sentences(mime_type: str, data: bytes) -> List[str]:
+    """Extract and split a whole document held in memory (picklable entry point for worker processes)"""
+    return list(iter_sentences(iter_text_chunks(BytesIO(data), mime_type)))
+
+
+def timed_extract_sentences(mime_type: str, data: bytes) -> Tuple[List[str], float]:
+    """extract_sentences plus its duration, for callers that record metrics outside the worker process"""
+    start = time.perf_counter()
+    sentences = extract_sentences(mime_type, data)
+    return sentences, time.perf_counter() - start
@@ -0,0 +1,546 @@
+# Resumable batch jobs: inputs and per-chunk checkpoints in SQLite, run by a background thread
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+from dataclasses import asdict, replace
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, List, Optional, Tuple
+from modules.config import (
+    JOBS_DB, JOB_CHUNK_SIZE, JOB_RETRY_SECONDS, EXTRACTION_WORKERS, LOG_FILE, MODEL_CONFIGS,
+    INFERENCE_BACKENDS, DEFAULT_INFERENCE_BACKEND, DECODING_PROFILES, DEFAULT_DECODING_PROFILE, DEDUP_MEMO_SIZE
+)
+from modules.ingest import timed_extract_sentences
+from modules.metrics import metrics, log_event
+from modules.cache import LRUCache
+from modules.results import ResultStore
+
+logger = logging.getLogger("jana")
+
+# queued -> extracting -> running -> done | failed | cancelled; a job whose owner process is gone is "interrupted"
+ACTIVE_STATES = ("queued", "extracting", "running")
+FINAL_STATES = ("done", "failed", "cancelled")
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(JOBS_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            created_ts REAL,
+            updated_ts REAL,
+            status TEXT,
+            owner TEXT,
+            options TEXT,
+            files TEXT,
+            file_errors TEXT,
+            total_chunks INTEGER,
+            done_chunks INTEGER DEFAULT 0,
+            sentences INTEGER,
+            error TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_files (
+            job_id TEXT,
+            file_index INTEGER,
+            name TEXT,
+            mime_type TEXT,
+            data BLOB,
+            PRIMARY KEY (job_id, file_index)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_chunks (
+            job_id TEXT,
+            chunk_index INTEGER,
+            sentences TEXT,
+            results TEXT,
+            done_ts REAL,
+            PRIMARY KEY (job_id, chunk_index)
+        )
+    """)
+    return conn
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """Whether the process that claimed a job is still running (owners on other hosts count as alive)"""
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def _options_to_json(options) -> str:
+    # The limiter is a live object holding a lock, so it is dropped before asdict copies the
+    # fields; resumed jobs get a fresh one
+    fields = asdict(replace(options, limiter=None))
+    fields.pop("limiter")
+    return json.dumps(fields)
+
+
+def _options_from_json(job_id: str, text: str):
+    from modules.processing import ProcessingOptions
+    from modules.admission import session_limiter
+    options = ProcessingOptions(**json.loads(text))
+    # Jobs take their turn in the admission queue like any other session
+    options.limiter = session_limiter(f"job-{job_id}")
+    return options
+
+
+def create_job(files: List[Tuple[str, str, bytes]], options) -> str:
+    """Persist (name, mime_type, data) inputs and options as a queued job; returns the job id"""
+    job_id = uuid.uuid4().hex[:12]
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, created_ts, updated_ts, status, owner, options, files) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, now, now, _OWNER, _options_to_json(options), json.dumps([name for name, _, _ in files]))
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, file_index, name, mime_type, data) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, name, mime_type, data) for i, (name, mime_type, data) in enumerate(files)]
+            )
+    finally:
+        conn.close()
+    log_event("job_created", job=job_id, files=len(files))
+    return job_id
+
+
+def _row_status(row) -> dict:
+    job_id, created_ts, updated_ts, status, owner, files, file_errors, total_chunks, done_chunks, sentences, error = row
+    if status in ACTIVE_STATES and owner and not _owner_alive(owner):
+        status = "interrupted"
+    return {
+        "id": job_id,
+        "status": status,
+        "created_ts": created_ts,
+        "updated_ts": updated_ts,
+        "files": json.loads(files or "[]"),
+        "file_errors": json.loads(file_errors or "{}"),
+        "total_chunks": total_chunks,
+        "done_chunks": done_chunks or 0,
+        "sentences": sentences,
+        "progress": (done_chunks or 0) / total_chunks if total_chunks else 0.0,
+        "error": error,
+    }
+
+
+_STATUS_COLUMNS = "id, created_ts, updated_ts, status, owner, files, file_errors, total_chunks, done_chunks, sentences, error"
+
+
+def job_status(job_id: str) -> Optional[dict]:
+    conn = _connect()
+    try:
+        row = conn.execute(f"SELECT {_STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _row_status(row) if row else None
+
+
+def list_jobs(limit: int = 20) -> List[dict]:
+    """Most recent jobs first"""
+    conn = _connect()
+    try:
+        rows = conn.execute(f"SELECT {_STATUS_COLUMNS} FROM jobs ORDER BY created_ts DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [_row_status(row) for row in rows]
+
+
+def job_results(job_id: str) -> ResultStore:
+    """Rows of every finished chunk in input order (partial while the job is running)"""
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "SELECT results FROM job_chunks WHERE job_id = ? AND results IS NOT NULL ORDER BY chunk_index", (job_id,)
+        )
+        # One chunk at a time: only the columnar copy is kept
+        results = ResultStore()
+        for (chunk,) in cursor:
+            results.append(json.loads(chunk))
+    finally:
+        conn.close()
+    return results
+
+
+def cancel_job(job_id: str) -> bool:
+    """Ask a job to stop after its current chunk; finished chunks are kept"""
+    conn = _connect()
+    try:
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = 'cancelled', updated_ts = ? WHERE id = ? AND status IN ({','.join('?' * len(ACTIVE_STATES))})",
+                (time.time(), job_id, *ACTIVE_STATES)
+            )
+    finally:
+        conn.close()
+    return cursor.rowcount > 0
+
+
+def delete_job(job_id: str):
+    conn = _connect()
+    try:
+        with conn:
+            for table, column in (("job_chunks", "job_id"), ("job_files", "job_id"), ("jobs", "id")):
+                conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (job_id,))
+    finally:
+        conn.close()
+
+
+def _claim(conn: sqlite3.Connection, job_id: str) -> Optional[str]:
+    """Take ownership of a job unless a live process holds it; returns its previous status"""
+    row = conn.execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"Unknown job {job_id}")
+    status, owner = row
+    if status == "done":
+        return None
+    if owner and owner != _OWNER and status in ACTIVE_STATES and _owner_alive(owner):
+        raise RuntimeError(f"Job {job_id} is running in process {owner}")
+    with conn:
+        # Compare-and-set on the observed owner, so two resumers cannot both win
+        cursor = conn.execute(
+            "UPDATE jobs SET owner = ?, status = 'queued', error = NULL, updated_ts = ? WHERE id = ? AND owner IS ?",
+            (_OWNER, time.time(), job_id, owner)
+        )
+    if cursor.rowcount == 0:
+        raise RuntimeError(f"Job {job_id} was claimed by another process")
+    return status
+
+
+def _set_status(conn: sqlite3.Connection, job_id: str, status: str, error: str = None):
+    with conn:
+        conn.execute("UPDATE jobs SET status = ?, error = ?, updated_ts = ? WHERE id = ?", (status, error, time.time(), job_id))
+
+
+def _advance(conn: sqlite3.Connection, job_id: str, status: str, expected: tuple) -> bool:
+    """Move a job to status only if it is still in one of the expected states (not cancelled meanwhile)"""
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE jobs SET status = ?, updated_ts = ? WHERE id = ? AND status IN ({','.join('?' * len(expected))})",
+            (status, time.time(), job_id, *expected)
+        )
+    return cursor.rowcount > 0
+
+
+def _plan_chunks(conn: sqlite3.Connection, job_id: str, chunk_size: int, max_workers: int):
+    """Extract the stored files and write the chunk plan; the file blobs are dropped afterwards"""
+    files = conn.execute(
+        "SELECT name, mime_type, data FROM job_files WHERE job_id = ? ORDER BY file_index", (job_id,)
+    ).fetchall()
+    sentences, errors = [], {}
+    # spawn keeps worker processes clear of locks held by this process's threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, max_workers), mp_context=context) as pool:
+        futures = [pool.submit(timed_extract_sentences, mime_type, bytes(data)) for _, mime_type, data in files]
+        for (name, _, _), future in zip(files, futures):
+            try:
+                file_sentences, seconds = future.result()
+                metrics.observe("extraction", seconds)
+                sentences.extend((name, sentence) for sentence in file_sentences)
+            except BrokenProcessPool:
+                # Not the file's fault: fail the job without a plan so a resume extracts again
+                raise
+            except Exception as e:
+                logger.exception(f"Job {job_id}: extraction of {name} failed")
+                errors[name] = str(e)
+
+    chunks = [sentences[i:i + chunk_size] for i in range(0, len(sentences), chunk_size)]
+    with conn:
+        conn.execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+        conn.executemany(
+            "INSERT INTO job_chunks (job_id, chunk_index, sentences) VALUES (?, ?, ?)",
+            [(job_id, i, json.dumps(chunk, ensure_ascii=False)) for i, chunk in enumerate(chunks)]
+        )
+        conn.execute(
+            "UPDATE jobs SET total_chunks = ?, done_chunks = 0, sentences = ?, file_errors = ?, updated_ts = ? WHERE id = ?",
+            (len(chunks), len(sentences), json.dumps(errors), time.time(), job_id)
+        )
+        conn.execute("UPDATE job_files SET data = NULL WHERE job_id = ?", (job_id,))
+    log_event("job_planned", job=job_id, sentences=len(sentences), chunks=len(chunks), failed_files=len(errors))
+
+
+def _cancelled(conn: sqlite3.Connection, job_id: str) -> bool:
+    return conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] == "cancelled"
+
+
+def _rate_limited(results: List[dict]) -> bool:
+    return any(str(result.get("Standard Japanese", "")).startswith("[Rate limit") for result in results)
+
+
+def run_job(job_id: str, progress: Callable[[int, int], None] = None, chunk_size: int = JOB_CHUNK_SIZE,
+            max_workers: int = EXTRACTION_WORKERS) -> dict:
+    """Run (or resume) a job in the calling thread and return its final status.
+
+    Resuming is idempotent: files are extracted once, and chunks whose results were checkpointed
+    are skipped. Models must be configured; they are loaded on first use. progress is an optional
+    callable(done_chunks, total_chunks).
+    """
+    from modules.processing import process_sentences
+
+    conn = _connect()
+    try:
+        if _claim(conn, job_id) is None:
+            return job_status(job_id)
+        options_json, total_chunks = conn.execute("SELECT options, total_chunks FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        options = _options_from_json(job_id, options_json)
+        try:
+            if total_chunks is None:
+                if not _advance(conn, job_id, "extracting", ("queued",)):
+                    return job_status(job_id)
+                _plan_chunks(conn, job_id, chunk_size, max_workers)
+            if not _advance(conn, job_id, "running", ("queued", "extracting")):
+                log_event("job_cancelled", job=job_id, chunk=None)
+                return job_status(job_id)
+
+            pending = conn.execute(
+                "SELECT chunk_index, sentences FROM job_chunks WHERE job_id = ? AND results IS NULL ORDER BY chunk_index", (job_id,)
+            ).fetchall()
+            total = conn.execute("SELECT total_chunks FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            memo = LRUCache(DEDUP_MEMO_SIZE)
+            for chunk_index, chunk_json in pending:
+                if _cancelled(conn, job_id):
+                    log_event("job_cancelled", job=job_id, chunk=chunk_index)
+                    return job_status(job_id)
+
+                chunk = json.loads(chunk_json)
+                with metrics.timer("job_chunk"):
+                    results = process_sentences([sentence for _, sentence in chunk], options, memo=memo)
+                    # A background job waits its turn rather than checkpointing rejected rows
+                    while _rate_limited(results):
+                        time.sleep(JOB_RETRY_SECONDS)
+                        if _cancelled(conn, job_id):
+                            return job_status(job_id)
+                        results = process_sentences([sentence for _, sentence in chunk], options, memo=memo)
+                for (name, _), result in zip(chunk, results):
+                    result["Source File"] = name
+
+                with conn:
+                    cursor = conn.execute(
+                        "UPDATE job_chunks SET results = ?, done_ts = ? WHERE job_id = ? AND chunk_index = ? AND results IS NULL",
+                        (json.dumps(results, ensure_ascii=False), time.time(), job_id, chunk_index)
+                    )
+                    conn.execute(
+                        "UPDATE jobs SET done_chunks = done_chunks + ?, updated_ts = ? WHERE id = ?",
+                        (cursor.rowcount, time.time(), job_id)
+                    )
+                metrics.inc("job_chunks_done")
+                done = conn.execute("SELECT done_chunks FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+                log_event("job_chunk", job=job_id, chunk=chunk_index, rows=len(results), done=done, total=total)
+                if progress:
+                    progress(done, total)
+
+            _set_status(conn, job_id, "done")
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            _set_status(conn, job_id, "failed", str(e))
+    finally:
+        conn.close()
+    return job_status(job_id)
+
+
+class JobRunner:
+    """Runs submitted jobs one after another on a daemon thread that outlives any Streamlit script run"""
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self.current = None
+        self._thread = threading.Thread(target=self._worker, name="jana-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, job_id: str) -> bool:
+        """Queue a new or interrupted job; False if it is already queued or running here"""
+        with self._lock:
+            if job_id in self._queued or job_id == self.current:
+                return False
+            self._queued.add(job_id)
+        self._queue.put(job_id)
+        return True
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                self._queued.discard(job_id)
+                self.current = job_id
+            try:
+                run_job(job_id)
+            except Exception:
+                logger.exception(f"Job {job_id} could not be started")
+            finally:
+                with self._lock:
+                    self.current = None
+
+    def pending(self) -> int:
+        return self._queue.qsize() + (self.current is not None)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Process-wide runner shared by every Streamlit session"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+                metrics.register_gauge("jobs_pending", _runner.pending)
+    return _runner
+
+
+def submit_job(files: List[Tuple[str, str, bytes]], options) -> str:
+    job_id = create_job(files, options)
+    get_job_runner().submit(job_id)
+    return job_id
+
+
+def write_results(results: ResultStore, path: str, output_format: str = "jsonl"):
+    f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    try:
+        if output_format == "csv":
+            f.write(results.to_csv().decode("utf-8"))
+        else:
+            for row in results:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def _print_status(status: dict):
+    total = status["total_chunks"] if status["total_chunks"] is not None else "?"
+    print(f"{status['id']}  {status['status']:<11} {status['done_chunks']}/{total} chunks  "
+          f"{status['sentences'] or 0} sentences  {', '.join(status['files'])}")
+    for name, error in status["file_errors"].items():
+        print(f"    {name}: {error}")
+    if status["error"]:
+        print(f"    error: {status['error']}")
+
+
+def _load_models(args, model_name: str = None) -> Tuple[bool, Optional[str]]:
+    from modules.models import load_model_components
+    from modules.utils import cuda_available
+    device = args.device or ("cuda" if cuda_available() else "cpu")
+    models = load_model_components(args.model, device_name=device, custom_model_name=model_name or args.custom_model,
+                                   backend=args.backend, furigana=getattr(args, "furigana", False))
+    for message in models["warnings"]:
+        print(f"warning: {message}", file=sys.stderr)
+    for message in models["errors"]:
+        print(f"error: {message}", file=sys.stderr)
+    return not models["errors"], models.get("translator_name")
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="JANA resumable batch jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def _model_args(p):
+        p.add_argument("--model", default=next(iter(MODEL_CONFIGS)), choices=list(MODEL_CONFIGS), help="Model configuration")
+        p.add_argument("--custom-model", help="HuggingFace model id overriding --model")
+        p.add_argument("--device", help="Torch device (default: cuda when available)")
+        p.add_argument("--backend", default=DEFAULT_INFERENCE_BACKEND, choices=list(INFERENCE_BACKENDS))
+
+    submit = sub.add_parser("submit", help="Create a job from TXT/PDF/DOCX files and run it in the foreground")
+    submit.add_argument("inputs", nargs="+")
+    submit.add_argument("--furigana", action="store_true")
+    submit.add_argument("--profile", default=DEFAULT_DECODING_PROFILE, choices=list(DECODING_PROFILES))
+    _model_args(submit)
+    resume = sub.add_parser("resume", help="Continue an interrupted or failed job, skipping finished chunks")
+    resume.add_argument("job_id")
+    _model_args(resume)
+    sub.add_parser("list", help="Show recent jobs")
+    status = sub.add_parser("status", help="Show one job")
+    status.add_argument("job_id")
+    cancel = sub.add_parser("cancel", help="Stop a job after its current chunk")
+    cancel.add_argument("job_id")
+    export = sub.add_parser("export", help="Write the results finished so far")
+    export.add_argument("job_id")
+    export.add_argument("-o", "--output", default="-")
+    export.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    args = parser.parse_args(argv)
+
+    if args.command in ("submit", "resume"):
+        logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    def _progress(done, total):
+        print(f"[{done}/{total}] chunks checkpointed", file=sys.stderr)
+
+    if args.command == "submit":
+        from modules.processing import ProcessingOptions
+        from modules.admission import session_limiter
+        from modules.utils import mime_type_for_path
+        ok, model_name = _load_models(args)
+        if not ok:
+            return 1
+        files = []
+        for path in args.inputs:
+            with open(path, "rb") as f:
+                files.append((os.path.basename(path), mime_type_for_path(path), f.read()))
+        # Built like the UI's options, limiter included, so this path covers the same serialization
+        options = ProcessingOptions(furigana=args.furigana, model_name=model_name, profile=args.profile,
+                                    limiter=session_limiter("jobs-cli"))
+        job_id = create_job(files, options)
+        print(f"Job {job_id}", file=sys.stderr)
+        _print_status(run_job(job_id, progress=_progress))
+    elif args.command == "resume":
+        status = job_status(args.job_id)
+        if status is None:
+            print(f"error: unknown job {args.job_id}", file=sys.stderr)
+            return 1
+        conn = _connect()
+        try:
+            options = json.loads(conn.execute("SELECT options FROM jobs WHERE id = ?", (args.job_id,)).fetchone()[0])
+        finally:
+            conn.close()
+        args.furigana = options.get("furigana", False)
+        ok, _ = _load_models(args, options.get("model_name"))
+        if not ok:
+            return 1
+        _print_status(run_job(args.job_id, progress=_progress))
+    elif args.command == "list":
+        for status in list_jobs():
+            _print_status(status)
+    elif args.command == "status":
+        status = job_status(args.job_id)
+        if status is None:
+            print(f"error: unknown job {args.job_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(status, indent=2, ensure_ascii=False))
+    elif args.command == "cancel":
+        print("Cancelled" if cancel_job(args.job_id) else "Job is not active")
+    elif args.command == "export":
+        results = job_results(args.job_id)
+        write_results(results, args.output, args.format)
+        print(f"Wrote {len(results)} rows", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
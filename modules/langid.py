@@ -0,0 +1,70 @@
+# Language identification: one fastText call per batch, with a Unicode-script fallback
+import re
+from typing import List, Tuple
+from modules.config import LANGUAGE_CODE_MAPPING
+
+# Mapping of Unicode ranges for language fallback (order breaks ties)
+LANGUAGE_UNICODE_RANGES = {
+    'en': r'[A-Za-z]',
+    'hi': r'[\u0900-\u097F]',
+    'ja': r'[\u3040-\u30FF\u4E00-\u9FFF]',
+    'ko': r'[\uAC00-\uD7AF]',
+    'fr': r'[A-Za-zÀ-ÿ]',
+    'es': r'[A-Za-zÀ-ÿ]',
+    'it': r'[A-Za-zÀ-ÿ]',
+    'pt': r'[A-Za-zÀ-ÿ]',
+    'ru': r'[\u0400-\u04FF]',
+}
+
+CONFIDENCE_THRESHOLD = 0.5
+FALLBACK_CONFIDENCE = 0.6
+FALLBACK_LANG = 'en'
+
+
+def _compile_script_pattern():
+    # Languages sharing a range can never be told apart by script, so only the first keeps a group.
+    # Alternation order means ASCII letters count towards 'en' and only accented letters towards 'fr'.
+    seen = set()
+    parts = []
+    for lc, regex in LANGUAGE_UNICODE_RANGES.items():
+        if regex in seen:
+            continue
+        seen.add(regex)
+        parts.append(f"(?P<{lc}>{regex}+)")
+    return re.compile("|".join(parts))
+
+
+_SCRIPT_PATTERN = _compile_script_pattern()
+
+
+def classify_script(text: str) -> str:
+    """Return the language whose script covers the most characters of text"""
+    counts = {}
+    for m in _SCRIPT_PATTERN.finditer(text):
+        counts[m.lastgroup] = counts.get(m.lastgroup, 0) + m.end() - m.start()
+    if not counts:
+        return FALLBACK_LANG
+    return max(LANGUAGE_UNICODE_RANGES, key=lambda lc: counts.get(lc, 0))
+
+
+def detect_languages(sentences: List[str], lid_model) -> List[Tuple[str, float]]:
+    """Detect (lang_code, confidence) for cleaned, single-line sentences with one fastText call"""
+    if not sentences:
+        return []
+    labels, probs = lid_model.predict(list(sentences), k=1)
+
+    detected = []
+    for text, label, prob in zip(sentences, labels, probs):
+        lang_code = label[0].replace('__label__', '') if len(label) else ''
+        conf = float(prob[0]) if len(prob) else 0.0
+
+        # Confidence threshold fallback
+        if conf < CONFIDENCE_THRESHOLD or lang_code not in LANGUAGE_CODE_MAPPING:
+            lang_code = classify_script(text)
+            conf = FALLBACK_CONFIDENCE
+        detected.append((lang_code, conf))
+    return detected
+
+
+def detect_language(sentence: str, lid_model) -> Tuple[str, float]:
+    return detect_languages([sentence], lid_model)[0]
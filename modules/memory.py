@@ -0,0 +1,85 @@
+# Translation memory primitives: MinHash signatures over character n-grams, banded for LSH lookups
+import re
+import zlib
+import random
+import hashlib
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Iterable, List, Optional, Tuple
+from modules.config import TM_NGRAM, TM_PERMUTATIONS, TM_BANDS, TM_MIN_CHARS, TM_VERIFY
+
+# Fixed seed: bucket keys are persisted, so every process must use the same hash functions
+_rng = random.Random(1402)
+# Each hash function is the shingle hash XOR a random mask (min over map() keeps the loop in C)
+_MASKS = [_rng.getrandbits(32) for _ in range(TM_PERMUTATIONS)]
+_ROWS_PER_BAND = TM_PERMUTATIONS // TM_BANDS
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Form compared by the memory: NFKC, case-folded, whitespace collapsed"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).casefold().strip()
+
+
+def shingles(text: str) -> set:
+    """Character n-grams of the normalized text"""
+    padded = f" {normalize(text)} "
+    return {padded[i:i + TM_NGRAM] for i in range(max(1, len(padded) - TM_NGRAM + 1))}
+
+
+def minhash(text: str) -> List[int]:
+    """MinHash signature of the text's character n-grams"""
+    # crc32 rather than hash(): str hashes are salted per process
+    hashed = [zlib.crc32(gram.encode("utf-8")) for gram in shingles(text)]
+    return [min(map(mask.__xor__, hashed)) for mask in _MASKS]
+
+
+def band_keys(text: str, src_lang: str, model_name: str) -> List[int]:
+    """LSH bucket ids for text; texts sharing any bucket are candidate near-duplicates.
+
+    Keys include the language and cache namespace, so a lookup only ever sees translations
+    made from the same language by the same model and profile. Very short texts get no keys.
+    """
+    if len(normalize(text)) < TM_MIN_CHARS:
+        return []
+    signature = minhash(text)
+    keys = []
+    for band in range(TM_BANDS):
+        values = signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]
+        raw = f"{model_name}\x1f{src_lang}\x1f{band}\x1f{','.join(map(str, values))}"
+        # Signed 64-bit so it fits an SQLite INTEGER
+        keys.append(int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest(), "big", signed=True))
+    return keys
+
+
+def similarity(a: str, b: str, floor: float = 0.0) -> float:
+    """Match score in [0, 1] between two sentences (edit-based, on the normalized text).
+
+    Candidates whose upper bound is below floor return that bound without the full comparison.
+    """
+    matcher = SequenceMatcher(None, normalize(a), normalize(b), autojunk=False)
+    bound = matcher.quick_ratio()
+    if bound < floor:
+        return bound
+    return matcher.ratio()
+
+
+def best_match(text: str, candidates: Iterable[Tuple[str, str]], threshold: float) -> Optional[Tuple[float, str, str]]:
+    """Best (score, source, translation) among (source, translation) candidates scoring at least threshold.
+
+    Candidates are ranked by n-gram overlap first, so only the TM_VERIFY closest get the
+    (slower) edit-based comparison.
+    """
+    query = shingles(text)
+    ranked = []
+    for source, translation in candidates:
+        other = shingles(source)
+        ranked.append((len(query & other) / len(query | other), source, translation))
+    ranked.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    best = None
+    for _, source, translation in ranked[:TM_VERIFY]:
+        score = similarity(text, source, floor=max(threshold, best[0] if best else 0.0))
+        if score >= threshold and (best is None or score > best[0]):
+            best = (score, source, translation)
+    return best
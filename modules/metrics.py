@@ -0,0 +1,168 @@
+# Lightweight in-process metrics: stage timers, counters, JSON log events and an optional HTTP endpoint
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("jana")
+
+# Upper bounds (seconds) of the latency histogram buckets
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class _Timer:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(TIMER_BUCKETS)
+
+
+class Metrics:
+    """Process-wide counters, stage timers and gauges (callables sampled on read)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timers: Dict[str, _Timer] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, n: int = 1):
+        if n:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            timer = self._timers.get(stage)
+            if timer is None:
+                timer = self._timers[stage] = _Timer()
+            timer.count += 1
+            timer.total += seconds
+            timer.max = max(timer.max, seconds)
+            for k, bound in enumerate(TIMER_BUCKETS):
+                if seconds <= bound:
+                    timer.buckets[k] += 1
+                    break
+
+    @contextmanager
+    def timer(self, stage: str, into: Optional[dict] = None):
+        """Time a block as one observation of stage; into optionally accumulates seconds per stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(stage, elapsed)
+            if into is not None:
+                into[stage] = into.get(stage, 0.0) + elapsed
+
+    def register_gauge(self, name: str, fn: Callable[[], float]):
+        with self._lock:
+            self._gauges[name] = fn
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {
+                stage: {
+                    "count": t.count,
+                    "total_s": round(t.total, 6),
+                    "mean_ms": round(1000 * t.total / t.count, 3) if t.count else 0.0,
+                    "max_ms": round(1000 * t.max, 3),
+                    "buckets": list(t.buckets),
+                }
+                for stage, t in self._timers.items()
+            }
+            gauges = dict(self._gauges)
+        values = {}
+        for name, fn in gauges.items():
+            try:
+                values[name] = fn()
+            except Exception:
+                logger.exception(f"metrics gauge {name} failed")
+        return {"counters": counters, "timers": timers, "gauges": values}
+
+    def prometheus(self) -> str:
+        """Snapshot in the Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = []
+        for name, value in sorted(snap["counters"].items()):
+            lines += [f"# TYPE jana_{name}_total counter", f"jana_{name}_total {value}"]
+        for name, value in sorted(snap["gauges"].items()):
+            lines += [f"# TYPE jana_{name} gauge", f"jana_{name} {value}"]
+        if snap["timers"]:
+            lines.append("# TYPE jana_stage_seconds histogram")
+        for stage, t in sorted(snap["timers"].items()):
+            cumulative = 0
+            for bound, n in zip(TIMER_BUCKETS, t["buckets"]):
+                cumulative += n
+                lines.append(f'jana_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'jana_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {t["count"]}')
+            lines.append(f'jana_stage_seconds_sum{{stage="{stage}"}} {t["total_s"]}')
+            lines.append(f'jana_stage_seconds_count{{stage="{stage}"}} {t["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+
+metrics = Metrics()
+
+
+def log_event(event: str, **fields):
+    """Write one structured log line: a JSON object with the event name and fields"""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
+
+
+def format_timings(timings: dict) -> str:
+    """Per-result timing column text, e.g. 'lid 0.05 · translate 12.30' (milliseconds)"""
+    return " · ".join(f"{stage} {1000 * seconds:.2f}" for stage, seconds in timings.items())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+        elif self.path.rstrip("/") == "/metrics.json":
+            body, content_type = json.dumps(metrics.snapshot()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /metrics.json on a daemon thread; later calls are no-ops"""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="jana-metrics", daemon=True).start()
+        logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+        return _server
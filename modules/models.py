@@ -1,92 +1,285 @@
-import streamlit as st
-import fasttext
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-from sudachipy import dictionary
-import pykakasi
-import torch
-from modules.config import MODEL_CONFIGS
-from modules.utils import download_fasttext_model
-
-# Global model references
-lid_model = None
-translator_model = None
-translator_tokenizer = None
-sudachi_tokenizer_obj = None
-kakasi_instance = None
-
-
-@st.cache_resource
-def load_models(model_size='light', device_name: str = "cpu", custom_model_name: str = None):
-    """Load all required models"""
-    progress_bar = st.progress(0, text="Loading models...")
-    models = {}
-
-    # Load FastText
-    progress_bar.progress(10, text="Loading language detection model...")
-    try:
-        model_path = download_fasttext_model()
-        if model_path:
-            models['lid_model'] = fasttext.load_model(model_path)
-        else:
-            st.error("Could not load fasttext model")
-            models['lid_model'] = None
-    except Exception as e:
-        st.error(f"Could not load fasttext model: {e}")
-        models['lid_model'] = None
-
-    # Load translation model
-    progress_bar.progress(40, text="Loading translation model...")
-    model_config = MODEL_CONFIGS.get(model_size, {})
-    model_name = custom_model_name or model_config.get('name')
-    if not model_name:
-        st.error(f"Translation model configuration for '{model_size}' not found in MODEL_CONFIGS.")
-        models['translator_tokenizer'] = None
-        models['translator_model'] = None
-        models['translator_name'] = None
-    else:
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules.config import MODEL_CONFIGS, DEFAULT_INFERENCE_BACKEND
+from modules.utils import download_fasttext_model, rss_mb
+
+logger = logging.getLogger("jana")
+
+# Heavy libraries (torch, transformers, fasttext, sudachipy, pykakasi) are imported inside the
+# loaders, so the app can render while the models load on background threads.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="jana-load")
+
+
+class LazyComponent:
+    """A model loaded at most once, either on first use or ahead of time on the loader pool.
+
+    Load time and RSS growth are recorded per component; when components load in parallel the
+    RSS figures overlap, so treat them as approximate.
+    """
+    def __init__(self, name: str, loader):
+        self.name = name
+        self._loader = loader
+        self._future = None
+        self._lock = threading.Lock()
+        self.seconds = None
+        self.rss_mb = None
+
+    def _load(self):
+        rss_before = rss_mb()
+        start = time.perf_counter()
         try:
-            tokenizer = AutoTokenizer.from_pretrained(model_name)
-            model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-
-            models['translator_tokenizer'] = tokenizer
-            models['translator_model'] = model.to(device_name)
-            models['translator_name'] = model_name
-        except Exception as e:
-            st.error(f"Could not load translation model '{model_name}': {e}")
-            models['translator_tokenizer'] = None
-            models['translator_model'] = None
-            models['translator_name'] = None
-
-    # Load Sudachi
-    progress_bar.progress(70, text="Loading morphological analyzer...")
-    try:
-        models['sudachi_tokenizer_obj'] = dictionary.Dictionary().create()
-    except Exception as e:
-        st.error(f"Could not initialize Sudachi: {e}")
-        models['sudachi_tokenizer_obj'] = None
+            return self._loader()
+        finally:
+            self.seconds = time.perf_counter() - start
+            self.rss_mb = rss_mb() - rss_before
+            logger.info(f"Loaded {self.name} in {self.seconds:.2f}s (RSS {self.rss_mb:+.0f} MB)")
+
+    def prefetch(self):
+        """Start loading in the background if nothing has started it yet"""
+        with self._lock:
+            if self._future is None:
+                self._future = _executor.submit(self._load)
+            return self._future
+
+    def get(self):
+        """Return the loaded object, waiting for (or starting) the load; load errors are re-raised"""
+        return self.prefetch().result()
+
+    def status(self) -> dict:
+        future = self._future
+        if future is None:
+            state = "pending"
+        elif not future.done():
+            state = "loading"
+        elif future.exception() is not None:
+            state = "failed"
+        else:
+            state = "ready"
+        return {
+            "component": self.name,
+            "state": state,
+            "seconds": self.seconds,
+            "rss_mb": self.rss_mb,
+            "error": str(future.exception()) if state == "failed" else None,
+        }
+
+
+def _load_lid():
+    import fasttext
+    model_path = download_fasttext_model()
+    if not model_path:
+        raise RuntimeError("Could not load fasttext model")
+    return fasttext.load_model(model_path)
+
+
+def _load_sudachi():
+    from sudachipy import dictionary
+    return dictionary.Dictionary().create()
+
+
+def _load_kakasi():
+    import pykakasi
+    return pykakasi.kakasi()
+
+
+def _translator_loader(model_name: str, backend: str, device_name: str):
+    def _load():
+        if not model_name:
+            raise ValueError("No translation model configured")
+        from modules.backends import load_translator
+        return load_translator(model_name, backend, device_name)
+    return _load
+
+
+_lid = LazyComponent("language detection (fastText)", _load_lid)
+_sudachi = LazyComponent("morphological analyzer (Sudachi)", _load_sudachi)
+_kakasi = LazyComponent("furigana generator (PyKakasi)", _load_kakasi)
+
+_translators = {}
+_active_translator = None
+# Dedicated language-pair translators (translation routes), loaded on first use
+_route_translators = {}
+_config_lock = threading.RLock()
+
+# Objects installed with set_models take precedence over the lazy components
+_overrides = {}
+
+
+DEFAULT_MODEL_SIZE = next(iter(MODEL_CONFIGS))
+
+
+def configure_models(model_size: str = DEFAULT_MODEL_SIZE, device_name: str = "cpu", custom_model_name: str = None,
+                     backend: str = DEFAULT_INFERENCE_BACKEND) -> str:
+    """Select the translator to use from now on and return its model name; nothing is loaded here.
 
-    # Load PyKakasi
-    progress_bar.progress(90, text="Loading furigana generator...")
+    Switching to another translator releases the previous one.
+    """
+    global _active_translator
+    if custom_model_name is None and model_size not in MODEL_CONFIGS:
+        raise KeyError(f"Unknown model size {model_size!r}; choose one of {', '.join(MODEL_CONFIGS)}")
+    model_name = custom_model_name or MODEL_CONFIGS[model_size]['name']
+    key = (model_name, backend, device_name)
+    with _config_lock:
+        if key not in _translators:
+            _translators.clear()
+            _translators[key] = LazyComponent(f"translator ({model_name}, {backend})",
+                                              _translator_loader(model_name, backend, device_name))
+        _active_translator = key
+    return model_name
+
+
+def _translator_component() -> LazyComponent:
+    with _config_lock:
+        if _active_translator is None:
+            configure_models()
+        return _translators[_active_translator]
+
+
+def _components(furigana: bool = True):
+    components = [_lid, _translator_component(), _sudachi]
+    if furigana:
+        components.append(_kakasi)
+    return components
+
+
+def prefetch_models(furigana: bool = False):
+    """Start loading every component in parallel without waiting; PyKakasi only when furigana is on"""
+    return [component.prefetch() for component in _components(furigana)]
+
+
+def wait_for_models(furigana: bool = False, on_loaded=None) -> dict:
+    """Block until the components are loaded; returns {component: error message} for failures.
+
+    on_loaded is an optional callable(done, total, component_name) called as each one finishes.
+    PyKakasi is optional, so its failure is logged but not reported here.
+    """
+    components = _components(furigana)
+    futures = {component.prefetch(): component for component in components}
+    pending, finished = set(futures), 0
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            finished += 1
+            if on_loaded:
+                on_loaded(finished, len(futures), futures[future].name)
+
+    errors = {}
+    for future, component in futures.items():
+        if future.exception() is not None:
+            logger.error(f"Could not load {component.name}: {future.exception()}")
+            if component is not _kakasi:
+                errors[component.name] = str(future.exception())
+    return errors
+
+
+def load_report() -> list:
+    """Load state, seconds and RSS growth of every component"""
+    report = [_lid.status(), _sudachi.status(), _kakasi.status()]
+    with _config_lock:
+        report[1:1] = [component.status() for component in list(_translators.values()) + list(_route_translators.values())]
+    return report
+
+
+def active_backend() -> str:
+    """Inference backend of the loaded translator (the requested one may have fallen back to fp32)"""
+    component = _translator_component()
+    if component.status()["state"] != "ready":
+        return _active_translator[1]
+    return component.get()[2]
+
+
+def active_translator():
+    """(model_name, backend, device) of the configured translator, or None when set_models installed one"""
+    if 'translator' in _overrides:
+        return None
+    with _config_lock:
+        if _active_translator is None:
+            configure_models()
+        return _active_translator
+
+
+def get_lid_model():
+    if 'lid' in _overrides:
+        return _overrides['lid']
+    return _lid.get()
+
+
+def get_translator_model():
+    """Return (model, tokenizer) of the active translator"""
+    if 'translator' in _overrides:
+        return _overrides['translator'], _overrides['tokenizer']
+    tokenizer, model, _ = _translator_component().get()
+    return model, tokenizer
+
+
+def get_route_translator(model_name: str):
+    """Return (model, tokenizer) of a route's dedicated translator, loading it with the active backend and device"""
+    with _config_lock:
+        if _active_translator is None:
+            configure_models()
+        _, backend, device_name = _active_translator
+        # Routes follow the backend/device switches of the main translator
+        for key in [key for key in _route_translators if key[1:] != (backend, device_name)]:
+            del _route_translators[key]
+        key = (model_name, backend, device_name)
+        component = _route_translators.get(key)
+        if component is None:
+            component = _route_translators[key] = LazyComponent(f"route translator ({model_name}, {backend})",
+                                                                _translator_loader(model_name, backend, device_name))
+    tokenizer, model, _ = component.get()
+    return model, tokenizer
+
+
+def get_sudachi():
+    if 'sudachi' in _overrides:
+        return _overrides['sudachi']
+    return _sudachi.get()
+
+
+def get_kakasi():
+    """PyKakasi instance, or None when it cannot be loaded (furigana is optional)"""
+    if 'kakasi' in _overrides:
+        return _overrides['kakasi']
     try:
-        models['kakasi'] = pykakasi.kakasi()
-    except Exception as e:
-        st.warning(f"Could not initialize kakasi for furigana: {e}")
-        models['kakasi'] = None
+        return _kakasi.get()
+    except Exception:
+        return None
+
+
+def load_model_components(model_size: str = DEFAULT_MODEL_SIZE, device_name: str = "cpu", custom_model_name: str = None, progress=None,
+                          backend: str = DEFAULT_INFERENCE_BACKEND, furigana: bool = True):
+    """Load all required models in parallel without any UI and make them active.
+
+    progress is an optional callable(percent, text). Load failures are logged and
+    collected under models['errors'] so callers can surface them their own way.
+    """
+    progress = progress or (lambda pct, text: None)
+    progress(0, "Loading models...")
+    model_name = configure_models(model_size, device_name, custom_model_name, backend)
+    errors = wait_for_models(
+        furigana,
+        on_loaded=lambda done, total, name: progress(int(100 * done / total), f"Loaded {name}")
+    )
 
-    progress_bar.progress(100, text="Models loaded (with warnings if any).")
+    models = {'errors': list(errors.values()), 'warnings': [], 'translator_name': model_name}
+    if furigana and _kakasi.status()["state"] == "failed":
+        models['warnings'].append(f"Could not initialize kakasi for furigana: {_kakasi.status()['error']}")
+    if not errors:
+        models['translator_backend'] = active_backend()
+        if models['translator_backend'] != backend:
+            models['warnings'].append(f"Inference backend '{backend}' unavailable, using '{models['translator_backend']}' (see log)")
+    models['load_report'] = load_report()
     return models
 
 
 def get_models():
-    """Return global model references"""
-    return lid_model, translator_model, translator_tokenizer, sudachi_tokenizer_obj, kakasi_instance
+    """Return model references, loading any that are not loaded yet"""
+    model, tokenizer = get_translator_model()
+    return get_lid_model(), model, tokenizer, get_sudachi(), get_kakasi()
 
 
 def set_models(lid, translator, tokenizer, sudachi, kakasi):
-    """Set global model references"""
-    global lid_model, translator_model, translator_tokenizer, sudachi_tokenizer_obj, kakasi_instance
-    lid_model = lid
-    translator_model = translator
-    translator_tokenizer = tokenizer
-    sudachi_tokenizer_obj = sudachi
-    kakasi_instance = kakasi
+    """Install model objects directly, bypassing the lazy loaders"""
+    _overrides.update(lid=lid, translator=translator, tokenizer=tokenizer, sudachi=sudachi, kakasi=kakasi)
@@ -0,0 +1,153 @@
+# Table-driven text normalization: language rules declared as data and compiled once
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+Rule = Union[str, Tuple[str, str]]
+
+# Raw model output, by source language ("*" for every other language)
+OUTPUT_RULES: Dict[str, Tuple[Rule, ...]] = {
+    "hi": ("nfc", "collapse_whitespace"),
+    "ja": ("drop_spaces", "strip"),
+    "ko": ("strip",),
+    "*": ("collapse_whitespace",),
+}
+
+# Clean-up applied to every Japanese translation
+JAPANESE_RULES: Tuple[Rule, ...] = ("delete_controls", "collapse_whitespace", "fullwidth_punctuation", "drop_not_japanese_marker")
+
+# Per-language cleaners (postprocessing.CLEANERS)
+CLEANER_RULES: Dict[str, Tuple[Rule, ...]] = {
+    "en": ("collapse_whitespace",),
+    "ko": (("space_between_scripts", "\uAC00-\uD7AF"), "collapse_whitespace"),
+    "fr": (("drop_space_before", "?!:;"), "collapse_whitespace"),
+    "es": ("collapse_whitespace",),
+    "it": ("collapse_whitespace",),
+    "pt": ("collapse_whitespace",),
+    "ru": (("space_between_scripts", "\u0400-\u04FF"), "collapse_whitespace"),
+    "ja": JAPANESE_RULES,
+    "hi": (("space_between_scripts", "\u0900-\u097F"), "collapse_whitespace"),
+}
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x1f\x7f]")
+_FULLWIDTH = ((" ?", "？"), (" !", "！"), (" :", "："))
+_NOT_JAPANESE_MARKER = re.compile(r"^\[NOT JAPANESE OUTPUT\]\s*")
+_JAPANESE_CHARS = re.compile(r"[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]")
+
+
+def _space_between_scripts(script: str) -> Callable[[str], str]:
+    # One lookaround pass marks both Latin->script and script->Latin boundaries
+    pattern = re.compile(f"(?<=[a-zA-Z])(?=[{script}])|(?<=[{script}])(?=[a-zA-Z])")
+    return lambda text: pattern.sub(" ", text)
+
+
+def _drop_space_before(chars: str) -> Callable[[str], str]:
+    pattern = re.compile(rf"\s+([{re.escape(chars)}])")
+    return lambda text: pattern.sub(r"\1", text)
+
+
+def _collapse_whitespace(text: str) -> str:
+    # Same as re.sub(r"\s+", " ", text).strip(): str.split and \s share the Unicode whitespace set
+    return " ".join(text.split())
+
+
+def _fullwidth_punctuation(text: str) -> str:
+    if " " not in text:
+        return text
+    for old, new in _FULLWIDTH:
+        text = text.replace(old, new)
+    return text
+
+
+def _delete_controls_then_collapse(text: str) -> str:
+    # Fused "delete_controls", "collapse_whitespace" on already collapsed text: only
+    # a deletion can create new whitespace runs
+    deleted = _CONTROL_CHARS.sub("", text)
+    return text if len(deleted) == len(text) else _collapse_whitespace(deleted)
+
+
+_STEPS: Dict[str, Callable[[str], str]] = {
+    "nfc": lambda text: unicodedata.normalize("NFC", text),
+    "strip": str.strip,
+    "collapse_whitespace": _collapse_whitespace,
+    "drop_spaces": lambda text: text.replace(" ", ""),
+    "delete_controls": lambda text: _CONTROL_CHARS.sub("", text),
+    "fullwidth_punctuation": _fullwidth_punctuation,
+    "drop_not_japanese_marker": lambda text: _NOT_JAPANESE_MARKER.sub("", text),
+}
+
+_PARAMETRIZED_STEPS: Dict[str, Callable[[str], Callable[[str], str]]] = {
+    "space_between_scripts": _space_between_scripts,
+    "drop_space_before": _drop_space_before,
+}
+
+
+# Rule runs replaced by a cheaper equivalent step when compiling
+_FUSIONS = {
+    ("collapse_whitespace", "delete_controls", "collapse_whitespace"): ("collapse_whitespace", _delete_controls_then_collapse),
+}
+
+
+def _compile(rules: Sequence[Rule]) -> Tuple[Callable[[str], str], ...]:
+    steps = []
+    i = 0
+    while i < len(rules):
+        for run, fused in _FUSIONS.items():
+            if tuple(rules[i:i + len(run)]) == run:
+                steps.extend(_STEPS[rule] if isinstance(rule, str) else rule for rule in fused)
+                i += len(run)
+                break
+        else:
+            rule = rules[i]
+            if isinstance(rule, tuple):
+                name, argument = rule
+                steps.append(_PARAMETRIZED_STEPS[name](argument))
+            else:
+                steps.append(_STEPS[rule])
+            i += 1
+    return tuple(steps)
+
+
+class Normalizer:
+    """A sequence of rules compiled into step functions; call it on a string or map() it over a batch"""
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = tuple(rules)
+        self._steps = _compile(self.rules)
+
+    def __call__(self, text: str) -> str:
+        for step in self._steps:
+            text = step(text)
+        return text
+
+    def map(self, texts: Sequence[str]) -> List[str]:
+        """Normalize a batch, one pass per step over the whole list"""
+        texts = list(texts)
+        for step in self._steps:
+            texts = [step(text) for text in texts]
+        return texts
+
+
+@lru_cache(maxsize=None)
+def output_normalizer(src_lang: str) -> Normalizer:
+    """Normalization of a raw translation from src_lang, including the Japanese clean-up"""
+    return Normalizer(OUTPUT_RULES.get(src_lang, OUTPUT_RULES["*"]) + JAPANESE_RULES)
+
+
+@lru_cache(maxsize=None)
+def cleaner(lang_code: str) -> Normalizer:
+    """Language cleaner (no-op for languages without rules)"""
+    return Normalizer(CLEANER_RULES.get(lang_code, ()))
+
+
+japanese_normalizer = Normalizer(JAPANESE_RULES)
+
+
+def is_japanese(text: str) -> bool:
+    """Whether text contains any kana or kanji"""
+    return bool(text) and _JAPANESE_CHARS.search(text) is not None
+
+
+def is_japanese_many(texts: Sequence[str]) -> List[bool]:
+    search = _JAPANESE_CHARS.search
+    return [bool(text) and search(text) is not None for text in texts]
@@ -1,135 +1,438 @@
-import streamlit as st
 import re
-import torch  
-from typing import List  
-from sudachipy import SplitMode
-from modules.models import get_models
-from modules.translation import translate_text
-from modules.utils import generate_furigana, _sudachi_to_string, is_japanese
-from modules.config import MODEL_CONFIGS, LANGUAGE_CODE_MAPPING
-
-# Mapping of Unicode ranges for language fallback
-LANGUAGE_UNICODE_RANGES = {
-    'en': r'[A-Za-z]',
-    'hi': r'[\u0900-\u097F]',
-    'ja': r'[\u3040-\u30FF\u4E00-\u9FFF]',
-    'ko': r'[\uAC00-\uD7AF]',
-    'fr': r'[A-Za-zÀ-ÿ]',
-    'es': r'[A-Za-zÀ-ÿ]',
-    'it': r'[A-Za-zÀ-ÿ]',
-    'pt': r'[A-Za-zÀ-ÿ]',
-    'ru': r'[\u0400-\u04FF]',
-}
-
-CONFIDENCE_THRESHOLD = 0.5
-
-def process_sentence(sentence: str) -> dict:
-    """Process a single sentence"""
-    lid_model, translator_model, translator_tokenizer, sudachi_tokenizer_obj, _ = get_models()
-    
-    try:
-        clean_sentence = sentence.replace("\n", " ").strip()
-        if not clean_sentence:
-            return None
+import time
+import logging
+import unicodedata
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from modules.models import get_lid_model, get_sudachi
+from modules.translation import translate_text, translate_batch, routed_namespace
+from modules.utils import generate_furigana, _sudachi_to_string, is_japanese, release_gpu_cache
+from modules.config import MODEL_CONFIGS, TRANSLATION_BATCH_SIZE, STREAM_CHUNK_SIZE, EXTRACTION_WORKERS, DEDUP_MEMO_SIZE
+from modules.config import DEFAULT_DECODING_PROFILE, TM_SUGGEST_THRESHOLD, TM_REUSE_THRESHOLD, TRANSLATION_ROUTING
+from modules.ingest import iter_batches, timed_extract_sentences
+from modules.metrics import metrics, log_event, format_timings
+from modules.cache import LRUCache, cache_fuzzy_lookup_many
+from modules.langid import detect_language, detect_languages, LANGUAGE_UNICODE_RANGES, CONFIDENCE_THRESHOLD
+
+logger = logging.getLogger("jana")
+
+DEFAULT_MODEL_NAME = MODEL_CONFIGS.get('m2m418', {}).get('name', 'facebook/m2m100_418M')
+
+
+@dataclass
+class ProcessingOptions:
+    """Explicit settings for the UI-free processing API"""
+    furigana: bool = False
+    debug: bool = False
+    model_name: Optional[str] = None   # multilingual translator name, also the cache namespace
+    src_lang: Optional[str] = None     # force a source language instead of detection
+    batch_size: int = TRANSLATION_BATCH_SIZE
+    limiter: Optional[object] = None   # optional object with acquire(n), e.g. an admission SessionLimiter
+    timings: bool = False              # add a per-result "Timing (ms)" column
+    profile: str = DEFAULT_DECODING_PROFILE  # DECODING_PROFILES key, also part of the cache namespace
+    tm_suggestions: bool = False       # add the closest translation-memory match to each translated row
+    tm_reuse: Optional[float] = TM_REUSE_THRESHOLD  # reuse matches scoring at least this instead of the model
+    routing: bool = TRANSLATION_ROUTING  # dedicated per-language models from TRANSLATION_ROUTES
+
+    @property
+    def uses_memory(self) -> bool:
+        return self.tm_suggestions or bool(self.tm_reuse)
+
+    @property
+    def cache_model_name(self) -> str:
+        return self.model_name or DEFAULT_MODEL_NAME
+
+
+RESULT_COLUMNS = ["Original Text", "Detected Language", "Confidence", "Standard Japanese", "Furigana", "Morphological Analysis"]
+TIMING_COLUMNS = ["Timing (ms)"]
+MEMORY_COLUMNS = ["TM Match", "TM Translation", "TM Score"]
+
+
+def result_columns(options: ProcessingOptions = None) -> List[str]:
+    """Every column a result row can have under options, in output order (error rows have fewer)"""
+    options = options or ProcessingOptions()
+    return RESULT_COLUMNS + (TIMING_COLUMNS if options.timings else []) + (MEMORY_COLUMNS if options.uses_memory else [])
+
+
+def _error_result(sentence: str, e: Exception) -> dict:
+    return {
+        "Original Text": sentence,
+        "Detected Language": "Error",
+        "Confidence": 0.0,
+        "Standard Japanese": f"Error: {e}",
+        "Furigana": "",
+        "Morphological Analysis": ""
+    }
+
+def _with_timings(result: dict, timings: Optional[dict]) -> dict:
+    if timings is not None:
+        result["Timing (ms)"] = format_timings(timings)
+    return result
+
+def _with_memory(result: dict, match: Optional[tuple], reused: bool) -> dict:
+    """Translation-memory columns: closest cached source, its translation and the match score"""
+    score, source, translation = match or (None, "", "")
+    result["TM Match"] = source
+    result["TM Translation"] = translation
+    result["TM Score"] = "" if score is None else f"{score:.2f}" + (" (reused)" if reused else "")
+    return result
 
-        # Language detection
-        predictions = lid_model.predict(clean_sentence, k=1)
-        lang_code = predictions[0][0].replace('__label__', '')
-        conf = float(predictions[1][0])
-
-        # Confidence threshold fallback
-        if conf < CONFIDENCE_THRESHOLD or lang_code not in LANGUAGE_CODE_MAPPING:
-            for lc, regex in LANGUAGE_UNICODE_RANGES.items():
-                if re.search(regex, clean_sentence):
-                    lang_code = lc
-                    conf = 0.6  # default fallback confidence
-                    break
-            else:
-                lang_code = 'en'
-                conf = 0.6
-
-        if st.session_state.get('debug_mode', False):
-            st.write(f"[DEBUG] Sentence: {clean_sentence}  Detected: {lang_code} ({conf:.2f})")
+def _analyze(text: str, furigana: bool, timings: Optional[dict]) -> Tuple[str, str]:
+    """Sudachi morphemes and (optionally) furigana for Japanese text"""
+    sudachi_tokenizer_obj = get_sudachi()
+    from sudachipy import SplitMode
+    with metrics.timer("sudachi", into=timings):
+        tokenized_output = _sudachi_to_string(sudachi_tokenizer_obj.tokenize(text, SplitMode.C))
+    furigana_text = ""
+    if furigana:
+        with metrics.timer("furigana", into=timings):
+            furigana_text = generate_furigana(text)
+    return tokenized_output, furigana_text
 
+def build_result(sentence: str, clean_sentence: str, lang_code: str, conf: float, jp_translation: str = None, furigana: bool = False,
+                 timings: Optional[dict] = None) -> dict:
+    """Build the result row for a sentence once its language (and translation) are known.
+
+    timings, when given, holds seconds per stage spent on this sentence so far; the Sudachi and
+    furigana stages are added and the row gets a "Timing (ms)" column.
+    """
+    try:
         if lang_code == 'ja':
-            morphemes = sudachi_tokenizer_obj.tokenize(clean_sentence, SplitMode.C)
-            tokenized_output = _sudachi_to_string(morphemes)
-            furigana = generate_furigana(clean_sentence) if st.session_state.get('generate_furigana', False) else ""
-            return {
+            tokenized_output, furigana_text = _analyze(clean_sentence, furigana, timings)
+            return _with_timings({
                 "Original Text": sentence,
                 "Detected Language": "Japanese",
-                "Confidence": f"{conf:.2f}",
+                "Confidence": round(float(conf), 2),
                 "Standard Japanese": clean_sentence,
-                "Furigana": furigana,
+                "Furigana": furigana_text,
                 "Morphological Analysis": tokenized_output
-            }
-        else:
-            model_name_for_cache = st.session_state.get('translator_name',MODEL_CONFIGS.get('light', {}).get('name', 'facebook/m2m100_418M'))
-            jp_translation = translate_text(clean_sentence, lang_code, model_name_for_cache)
-
-            # Error handling
-            if jp_translation.startswith("[Translation error:") or jp_translation.startswith("[Rate limit"):
-                return {
-                    "Original Text": sentence,
-                    "Detected Language": lang_code,
-                    "Confidence": f"{conf:.2f}",
-                    "Standard Japanese": jp_translation,
-                    "Furigana": "",
-                    "Morphological Analysis": ""
-                }
-
-            morphemes = sudachi_tokenizer_obj.tokenize(jp_translation, SplitMode.C)
-            tokenized_output = _sudachi_to_string(morphemes)
-            furigana = generate_furigana(jp_translation) if st.session_state.get('generate_furigana', False) else ""
-
-            if not is_japanese(jp_translation):
-                jp_translation = "[NOT JAPANESE OUTPUT] " + jp_translation
-
-            return {
+            }, timings)
+
+        # Error handling
+        if jp_translation.startswith("[Translation error:") or jp_translation.startswith("[Rate limit"):
+            return _with_timings({
                 "Original Text": sentence,
                 "Detected Language": lang_code,
-                "Confidence": f"{conf:.2f}",
+                "Confidence": round(float(conf), 2),
                 "Standard Japanese": jp_translation,
-                "Furigana": furigana,
-                "Morphological Analysis": tokenized_output
-            }
+                "Furigana": "",
+                "Morphological Analysis": ""
+            }, timings)
 
-    except Exception as e:
-        return {
+        tokenized_output, furigana_text = _analyze(jp_translation, furigana, timings)
+
+        if not is_japanese(jp_translation):
+            jp_translation = "[NOT JAPANESE OUTPUT] " + jp_translation
+        if jp_translation.startswith("[NOT JAPANESE OUTPUT]"):
+            metrics.inc("not_japanese")
+
+        return _with_timings({
             "Original Text": sentence,
-            "Detected Language": "Error",
-            "Confidence": "0.00",
-            "Standard Japanese": f"Error: {e}",
-            "Furigana": "",
-            "Morphological Analysis": ""
-        }
-
-def process_text_batch(sentences: List[str], batch_size: int = 1) -> List[dict]:
-    """Process text in batches"""
+            "Detected Language": lang_code,
+            "Confidence": round(float(conf), 2),
+            "Standard Japanese": jp_translation,
+            "Furigana": furigana_text,
+            "Morphological Analysis": tokenized_output
+        }, timings)
+
+    except Exception as e:
+        return _error_result(sentence, e)
+
+def _clean(sentence: str) -> str:
+    return sentence.replace("\n", " ").strip()
+
+def _debug(options: ProcessingOptions, on_debug, message: str):
+    if options.debug:
+        logger.info(message)
+        if on_debug:
+            on_debug(message)
+
+def process_sentence(sentence: str, options: ProcessingOptions = None, on_debug: Callable[[str], None] = None) -> dict:
+    """Process a single sentence"""
+    options = options or ProcessingOptions()
+    timings = {}
+    try:
+        clean_sentence = _clean(sentence)
+        if not clean_sentence:
+            return None
+
+        if options.src_lang:
+            lang_code, conf = options.src_lang, 1.0
+        else:
+            lid_model = get_lid_model()
+            with metrics.timer("lid", into=timings):
+                lang_code, conf = detect_language(clean_sentence, lid_model)
+        _debug(options, on_debug, f"[DEBUG] Sentence: {clean_sentence}  Detected: {lang_code} ({conf:.2f})")
+
+        jp_translation = None
+        if lang_code != 'ja':
+            with metrics.timer("translate_text", into=timings):
+                jp_translation = translate_text(clean_sentence, lang_code, options.cache_model_name, options.limiter, options.profile,
+                                               options.routing)
+        result = build_result(sentence, clean_sentence, lang_code, conf, jp_translation, options.furigana,
+                              timings if options.timings else None)
+        log_event("sentence", lang=lang_code, chars=len(clean_sentence),
+                  ms={stage: round(1000 * seconds, 3) for stage, seconds in timings.items()})
+        return result
+
+    except Exception as e:
+        return _error_result(sentence, e)
+
+# Leading list markers and trailing full stops/commas that do not change how a sentence is processed
+_TRIVIAL_EDGES = re.compile(r'^[\s\-–—•·・*]+|[\s.,;:。、，；：]+$')
+_WHITESPACE = re.compile(r'\s+')
+
+def dedup_key(sentence: str) -> str:
+    """Key under which repeated sentences share one result: NFC, collapsed whitespace, trivial punctuation dropped"""
+    text = _WHITESPACE.sub(" ", unicodedata.normalize("NFC", sentence)).strip()
+    return _TRIVIAL_EDGES.sub("", text) or text
+
+def _memoizable(result: dict) -> bool:
+    # Errors and rate-limit rejections are transient, so they are not reused
+    jp = result.get("Standard Japanese", "")
+    return result.get("Detected Language") != "Error" and not jp.startswith(("[Translation error:", "[Rate limit"))
+
+def process_sentences(
+    sentences: List[str],
+    options: ProcessingOptions = None,
+    progress: Callable[[int, int, str], None] = None,
+    on_debug: Callable[[str], None] = None,
+    memo: Optional[LRUCache] = None,
+) -> List[dict]:
+    """Process sentences in batches, running each distinct sentence (by dedup_key) only once.
+
+    Results are fanned back out to every occurrence with its own "Original Text", in input order.
+    memo optionally carries results across calls (e.g. the chunks of one document).
+    progress is an optional callable(done, total, message) invoked after every translated batch.
+    """
+    options = options or ProcessingOptions()
+    keys = [dedup_key(sentence) if _clean(sentence) else None for sentence in sentences]
+
+    templates = {}
+    unique = []
+    for i, key in enumerate(keys):
+        if key is None or key in templates:
+            continue
+        template = memo.get(key) if memo is not None else None
+        templates[key] = template
+        if template is None:
+            unique.append(i)
+
+    for i, result in zip(unique, _process_unique([sentences[i] for i in unique], options, progress, on_debug)):
+        templates[keys[i]] = result
+        if memo is not None and _memoizable(result):
+            memo.put(keys[i], dict(result))
+
+    results = []
+    first_rows = set(unique)
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        if i in first_rows:
+            results.append(templates[key])
+            continue
+        row = dict(templates[key])
+        row["Original Text"] = sentences[i]
+        if options.timings:
+            row["Timing (ms)"] = "deduplicated"
+        results.append(row)
+
+    rows = len(results)
+    metrics.inc("sentences_in", rows)
+    metrics.inc("sentences_deduplicated", rows - len(unique))
+    if rows:
+        log_event("dedup", rows=rows, processed=len(unique), ratio=round(1 - len(unique) / rows, 4))
+    return results
+
+def dedup_ratio() -> float:
+    """Share of sentences served from another occurrence's result since the process started"""
+    counters = metrics.snapshot()["counters"]
+    total = counters.get("sentences_in", 0)
+    return counters.get("sentences_deduplicated", 0) / total if total else 0.0
+
+def _process_unique(
+    sentences: List[str],
+    options: ProcessingOptions,
+    progress: Callable[[int, int, str], None] = None,
+    on_debug: Callable[[str], None] = None,
+) -> List[dict]:
+    """Detect languages first, then translate each language group in padded batches (one result per sentence)"""
     results = []
     total_sentences = len(sentences)
     if total_sentences == 0:
         return results
 
-    progress_bar = st.progress(0, text="Processing...")
-    status_text = st.empty()
+    batch_size = max(1, int(options.batch_size))
+    started = time.perf_counter()
+    # Per-sentence seconds by stage; batched stages are shared out evenly over their sentences
+    stage_totals = {}
+    row_timings = [{} for _ in range(total_sentences)] if options.timings else None
+
+    def _share(idxs, stage, seconds):
+        stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+        if row_timings is not None and idxs:
+            for i in idxs:
+                row_timings[i][stage] = row_timings[i].get(stage, 0.0) + seconds / len(idxs)
 
+    # Language detection for every sentence in one fastText call
+    rows = [None] * total_sentences
+    groups = {}
+    cleaned = [(i, _clean(sentence)) for i, sentence in enumerate(sentences)]
+    cleaned = [(i, clean_sentence) for i, clean_sentence in cleaned if clean_sentence]
+    try:
+        if options.src_lang:
+            detected = [(options.src_lang, 1.0)] * len(cleaned)
+        else:
+            lid_model = get_lid_model()
+            t0 = time.perf_counter()
+            with metrics.timer("lid"):
+                detected = detect_languages([clean_sentence for _, clean_sentence in cleaned], lid_model)
+            _share([i for i, _ in cleaned], "lid", time.perf_counter() - t0)
+    except Exception as e:
+        for i, _ in cleaned:
+            rows[i] = _error_result(sentences[i], e)
+        detected = []
+
+    for (i, clean_sentence), (lang_code, conf) in zip(cleaned, detected):
+        _debug(options, on_debug, f"[DEBUG] Sentence: {clean_sentence}  Detected: {lang_code} ({conf:.2f})")
+        rows[i] = (clean_sentence, lang_code, conf)
+        if lang_code != 'ja':
+            groups.setdefault(lang_code, []).append(i)
+
+    # Batched translation per source language
+    translations = {}
+    memory_matches = {}
+    reused = set()
+    pending_total = sum(len(idxs) for idxs in groups.values())
+    done = 0
+    for lang_code, idxs in groups.items():
+        idxs.sort(key=lambda i: len(rows[i][0]))
+        for start in range(0, len(idxs), batch_size):
+            chunk = idxs[start:start + batch_size]
+            t0 = time.perf_counter()
+            matches = {}
+            with metrics.timer("translate_batch"):
+                outputs = translate_batch([rows[i][0] for i in chunk], lang_code, options.cache_model_name, batch_size, options.limiter,
+                                          options.profile, options.tm_reuse, matches, options.routing)
+            _share(chunk, "translate", time.perf_counter() - t0)
+            translations.update(zip(chunk, outputs))
+            for k, match in matches.items():
+                memory_matches[chunk[k]] = match
+                reused.add(chunk[k])
+            done += len(chunk)
+            if progress:
+                progress(done, pending_total, f"Translated {lang_code} batch ({len(chunk)} sentences)")
+
+            # Free cached GPU memory only under memory pressure
+            release_gpu_cache()
+
+    # Suggestions for the rows the model translated
+    if options.tm_suggestions:
+        for lang_code, idxs in groups.items():
+            idxs = [i for i in idxs if i not in reused]
+            _, namespace = routed_namespace(lang_code, options.cache_model_name, options.profile, options.routing)
+            t0 = time.perf_counter()
+            matches = cache_fuzzy_lookup_many([rows[i][0] for i in idxs], lang_code, namespace, TM_SUGGEST_THRESHOLD)
+            _share(idxs, "tm", time.perf_counter() - t0)
+            memory_matches.update((i, match) for i, match in zip(idxs, matches) if match is not None)
+        metrics.inc("tm_suggested", len(memory_matches) - len(reused))
+
+    # Reassemble in input order
     for i, sentence in enumerate(sentences):
-        progress = (i + 1) / total_sentences
-        progress_bar.progress(progress, text=f"Processed {i+1}/{total_sentences} sentences")
-        status_text.text(f"Processing sentence {i+1}/{total_sentences}")
+        row = rows[i]
+        if row is None:
+            continue
+        if isinstance(row, dict):
+            result = row
+        else:
+            clean_sentence, lang_code, conf = row
+            t0 = time.perf_counter()
+            result = build_result(sentence, clean_sentence, lang_code, conf, translations.get(i), options.furigana,
+                                  row_timings[i] if row_timings is not None else None)
+            stage_totals["analysis"] = stage_totals.get("analysis", 0.0) + time.perf_counter() - t0
+        if options.uses_memory:
+            _with_memory(result, memory_matches.get(i), i in reused)
+        results.append(result)
 
-        result = process_sentence(sentence)
-        if result:
-            results.append(result)
+    log_event("sentence_batch", sentences=total_sentences,
+              languages={lang_code: len(idxs) for lang_code, idxs in groups.items()},
+              ms={stage: round(1000 * seconds, 3) for stage, seconds in stage_totals.items()},
+              total_ms=round(1000 * (time.perf_counter() - started), 3))
+    return results
+
+def process_stream(
+    sentences: Iterable[str],
+    options: ProcessingOptions = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    on_debug: Callable[[str], None] = None,
+) -> Iterator[List[dict]]:
+    """Process a sentence stream chunk by chunk, yielding each chunk's results as soon as they are ready"""
+    memo = LRUCache(DEDUP_MEMO_SIZE)
+    for chunk in iter_batches(sentences, chunk_size):
+        yield process_sentences(chunk, options, on_debug=on_debug, memo=memo)
+
+def process_files(
+    files: List[Tuple[str, str, bytes]],
+    options: ProcessingOptions = None,
+    max_workers: int = EXTRACTION_WORKERS,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    progress: Callable[[int, int, int], None] = None,
+    on_debug: Callable[[str], None] = None,
+) -> Tuple[List[dict], Dict[str, str]]:
+    """Extract (name, mime_type, data) files in a process pool and translate them through one shared queue.
+
+    Sentences from whichever files finish extracting first are packed into cross-file chunks, so the
+    translator stays busy while slower files are still being parsed. Results are tagged with
+    "Source File" and returned in upload order, together with {name: error} for files that failed.
+    progress is an optional callable(files_extracted, total_files, sentences_processed).
+    """
+    # Keyed by upload index: two uploads may share a name
+    results_by_file = [[] for _ in files]
+    errors = {}
+    pending = []
+    processed = 0
+    memo = LRUCache(DEDUP_MEMO_SIZE)
+
+    def _run(chunk):
+        nonlocal processed
+        chunk_results = process_sentences([sentence for _, sentence in chunk], options, on_debug=on_debug, memo=memo)
+        # Extracted sentences are already stripped and non-empty, so rows line up one to one
+        for (index, _), result in zip(chunk, chunk_results):
+            result["Source File"] = files[index][0]
+            results_by_file[index].append(result)
+        processed += len(chunk)
 
-        # Release GPU memory if needed
-        if torch.cuda.is_available():
+    # spawn keeps worker processes clear of locks held by this process's threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, max_workers), mp_context=context) as pool:
+        futures = {pool.submit(timed_extract_sentences, mime_type, data): index for index, (_, mime_type, data) in enumerate(files)}
+        for extracted, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            name = files[index][0]
             try:
-                torch.cuda.empty_cache()
-            except Exception:
-                pass
+                file_sentences, seconds = future.result()
+                # Timed inside the worker process, so it is recorded here
+                metrics.observe("extraction", seconds)
+                log_event("file_extracted", file=name, sentences=len(file_sentences), ms=round(1000 * seconds, 3))
+                pending.extend((index, sentence) for sentence in file_sentences)
+            except Exception as e:
+                logger.exception(f"Extraction of {name} failed")
+                errors[name] = str(e)
 
-    progress_bar.empty()
-    status_text.empty()
-    return results
+            while len(pending) >= chunk_size:
+                chunk, pending = pending[:chunk_size], pending[chunk_size:]
+                _run(chunk)
+            if progress:
+                progress(extracted, len(files), processed)
+
+    if pending:
+        _run(pending)
+        if progress:
+            progress(len(files), len(files), processed)
+
+    results = []
+    for file_results in results_by_file:
+        results.extend(file_results)
+    return results, errors
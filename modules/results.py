@@ -0,0 +1,109 @@
+# Columnar result storage: result rows appended in chunks as Arrow record batches
+import threading
+from typing import Iterator, List, Optional
+import pyarrow as pa
+import pyarrow.csv
+
+# Columns with few distinct values are dictionary-encoded; the rest are strings
+CATEGORICAL_COLUMNS = ("Detected Language", "Source File")
+FLOAT_COLUMNS = ("Confidence",)
+LEADING_COLUMNS = ("Source File",)
+
+
+def _float_or_none(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _column(name: str, values: list) -> pa.Array:
+    if name in FLOAT_COLUMNS:
+        return pa.array([_float_or_none(v) for v in values], pa.float64())
+    strings = pa.array([None if v is None else str(v) for v in values], pa.string())
+    if name in CATEGORICAL_COLUMNS:
+        return strings.dictionary_encode()
+    return strings
+
+
+class ResultStore:
+    """Result rows kept column by column instead of one dict per sentence.
+
+    Each append() becomes one Arrow record batch: confidences as float64, language codes and
+    file names dictionary-encoded, text in contiguous string buffers. Slices, pages and
+    DataFrames share those buffers rather than copying them. Iterating yields plain row
+    dicts for code that still wants them.
+    """
+    def __init__(self):
+        self._batches: List[pa.RecordBatch] = []
+        self._rows = 0
+        self._table = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows: List[dict]) -> "ResultStore":
+        store = cls()
+        store.append(rows)
+        return store
+
+    def append(self, rows: List[dict]):
+        """Add a chunk of result dicts (columns may differ between chunks; missing values are null)"""
+        if not rows:
+            return
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        batch = pa.RecordBatch.from_arrays([_column(name, [row.get(name) for row in rows]) for name in names], names=names)
+        with self._lock:
+            self._batches.append(batch)
+            self._rows += len(rows)
+            self._table = None
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def table(self) -> pa.Table:
+        """All rows as one table; the batches become its chunks without being copied"""
+        with self._lock:
+            if self._table is None:
+                if self._batches:
+                    tables = [pa.Table.from_batches([batch]) for batch in self._batches]
+                    table = pa.concat_tables(tables, promote_options="default")
+                    leading = [name for name in LEADING_COLUMNS if name in table.column_names]
+                    self._table = table.select(leading + [name for name in table.column_names if name not in leading])
+                else:
+                    self._table = pa.table({})
+            return self._table
+
+    @property
+    def columns(self) -> List[str]:
+        return self.table().column_names
+
+    @property
+    def nbytes(self) -> int:
+        return self.table().nbytes
+
+    def page(self, start: int, size: int) -> pa.Table:
+        return self.table().slice(start, size)
+
+    def to_dataframe(self, start: int = 0, stop: int = None):
+        """pandas DataFrame over the Arrow buffers (ArrowDtype columns, no copy)"""
+        import pandas as pd
+        stop = len(self) if stop is None else stop
+        return self.table().slice(start, max(0, stop - start)).to_pandas(types_mapper=pd.ArrowDtype)
+
+    def rows(self, start: int = 0, stop: int = None) -> List[dict]:
+        stop = len(self) if stop is None else stop
+        return self.table().slice(start, max(0, stop - start)).to_pylist()
+
+    def __iter__(self) -> Iterator[dict]:
+        for batch in self.table().to_batches():
+            yield from batch.to_pylist()
+
+    def to_csv(self) -> bytes:
+        """CSV of every row, written batch by batch by Arrow's CSV writer"""
+        table = self.table()
+        # Dictionary columns are written as their values
+        schema = pa.schema([pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in table.schema])
+        sink = pa.BufferOutputStream()
+        with pyarrow.csv.CSVWriter(sink, schema) as writer:
+            for batch in table.to_batches():
+                writer.write_batch(batch.cast(schema))
+        return sink.getvalue().to_pybytes()
@@ -0,0 +1,168 @@
+# Shared inference service: one worker thread owns model.generate and micro-batches requests from all sessions
+import math
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import List
+from modules.config import SERVING_MAX_BATCH_SIZE, SERVING_MAX_WAIT_MS, BATCH_TOKEN_BUDGET
+from modules.chunking import pack_batches
+from modules.metrics import metrics
+from modules.workers import get_worker_pool
+
+logger = logging.getLogger("jana")
+
+
+class _Request:
+    __slots__ = ("translator", "segments", "lengths", "batch_size", "future")
+
+    def __init__(self, translator, segments, lengths, batch_size):
+        self.translator = translator
+        self.segments = segments
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.future = Future()
+
+
+class InferenceService:
+    """Collects translation requests into micro-batches and runs them on a single worker thread.
+
+    A request is a list of segments for one translator (a pool entry bound to model, language pair
+    and decoding setup). Requests that arrive within max_wait_ms and share a translator are packed
+    together, so concurrent sessions share generate calls instead of contending for the model.
+    """
+    def __init__(self, max_batch_size: int = SERVING_MAX_BATCH_SIZE, max_wait_ms: float = SERVING_MAX_WAIT_MS,
+                 token_budget: int = BATCH_TOKEN_BUDGET):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.token_budget = token_budget
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "segments": 0, "generate_calls": 0, "merged_windows": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="jana-inference", daemon=True)
+                self._thread.start()
+
+    def submit(self, translator, segments: List[str], lengths: List[int], batch_size: int = None) -> Future:
+        """Queue segments for translation; the future resolves to one output (str or Exception) per segment"""
+        request = _Request(translator, segments, lengths, batch_size or self.max_batch_size)
+        if not segments:
+            request.future.set_result([])
+            return request.future
+        self._ensure_started()
+        self._queue.put(request)
+        return request.future
+
+    def translate(self, translator, segments: List[str], lengths: List[int], batch_size: int = None) -> list:
+        return self.submit(translator, segments, lengths, batch_size).result()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
+
+    def _collect(self) -> List[_Request]:
+        requests = [self._queue.get()]
+        pending_segments = len(requests[0].segments)
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while pending_segments < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            pending_segments += len(request.segments)
+        return requests
+
+    def _run_group(self, translator, requests: List[_Request]):
+        # Flatten every request's segments, remembering where each output belongs
+        segments, lengths, owners = [], [], []
+        for request in requests:
+            segments.extend(request.segments)
+            lengths.extend(request.lengths)
+            owners.extend((request, k) for k in range(len(request.segments)))
+        outputs = [None] * len(segments)
+        batch_size = min(self.max_batch_size, max(r.batch_size for r in requests))
+
+        # With CPU worker processes, split the group so every worker gets a batch
+        pool = get_worker_pool() if hasattr(translator, "decoding") else None
+        if pool is not None and translator.model_name not in (None, pool.key[0]):
+            pool = None  # workers only hold the multilingual model, not route models
+        if pool is not None:
+            batch_size = min(batch_size, max(1, math.ceil(len(segments) / pool.workers)))
+        batches = pack_batches(lengths, self.token_budget, batch_size)
+
+        if pool is not None:
+            with metrics.timer("generate"):
+                pooled = pool.translate(translator, [[segments[k] for k in batch] for batch in batches])
+        for i, batch in enumerate(batches):
+            if pool is not None:
+                batch_outputs = pooled[i]
+                if isinstance(batch_outputs, Exception):
+                    logger.error(f"inference batch failed in a worker: {batch_outputs}")
+                    batch_outputs = [batch_outputs] * len(batch)
+            else:
+                try:
+                    with metrics.timer("generate"):
+                        batch_outputs = translator([segments[k] for k in batch])
+                except Exception as e:
+                    logger.exception("inference batch failed")
+                    batch_outputs = [e] * len(batch)
+            for k, output in zip(batch, batch_outputs):
+                outputs[k] = output
+            with self._stats_lock:
+                self._stats["generate_calls"] += 1
+
+        results = {id(request): [None] * len(request.segments) for request in requests}
+        for (request, k), output in zip(owners, outputs):
+            results[id(request)][k] = output
+        for request in requests:
+            request.future.set_result(results[id(request)])
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            with self._stats_lock:
+                self._stats["requests"] += len(requests)
+                self._stats["segments"] += sum(len(r.segments) for r in requests)
+                if len(requests) > 1:
+                    self._stats["merged_windows"] += 1
+
+            groups = {}
+            for request in requests:
+                groups.setdefault(id(request.translator), (request.translator, []))[1].append(request)
+            for translator, group in groups.values():
+                try:
+                    self._run_group(translator, group)
+                except Exception as e:
+                    logger.exception("inference service group failed")
+                    for request in group:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_inference_service() -> InferenceService:
+    """Process-wide service shared by every Streamlit session and CLI call"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = InferenceService()
+                metrics.register_gauge("inference_queue_depth", lambda: _service.stats()["queue_depth"])
+    return _service
@@ -0,0 +1,268 @@
+# Local model store: prebuilt translator/fastText snapshots with checksums, loaded memory-mapped and offline
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import urllib.request
+from typing import Dict, List, Optional
+from modules.config import (
+    MODEL_STORE_DIR, MODEL_STORE_VERIFY, OFFLINE_MODE, FASTTEXT_MODEL_URL, MODEL_CONFIGS, TRANSLATION_ROUTES
+)
+
+logger = logging.getLogger("jana")
+
+MANIFEST = "manifest.json"
+WEIGHTS = "model.safetensors"
+LID_FILE = "lid.176.ftz"
+DTYPES = ("fp32", "fp16", "bf16")
+
+
+def offline_mode() -> bool:
+    """Whether the network must not be used (OFFLINE_MODE or JANA_OFFLINE=1)"""
+    return OFFLINE_MODE or os.environ.get("JANA_OFFLINE", "") not in ("", "0")
+
+
+def apply_offline_mode():
+    """Make the HuggingFace libraries refuse network access; call before transformers is imported"""
+    if offline_mode():
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+
+def snapshot_dir(model_name: str, dtype: str = "fp32") -> str:
+    return os.path.join(MODEL_STORE_DIR, model_name.replace("/", "--"), dtype)
+
+
+def lid_dir() -> str:
+    return os.path.join(MODEL_STORE_DIR, "fasttext")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(path: str, **meta):
+    """Record size and sha256 of every file in a snapshot directory"""
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            relative = os.path.relpath(full, path)
+            if relative == MANIFEST:
+                continue
+            files[relative] = {"size": os.path.getsize(full), "sha256": _sha256(full)}
+    manifest = dict(meta, created=time.strftime("%Y-%m-%dT%H:%M:%S"), files=files)
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def verify(path: str, full: bool = MODEL_STORE_VERIFY == "sha256") -> List[str]:
+    """Problems found in a snapshot (missing manifest or files, size or checksum mismatch); [] when intact"""
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        return [f"no readable manifest: {e}"]
+    problems = []
+    for relative, expected in manifest["files"].items():
+        full_path = os.path.join(path, relative)
+        if not os.path.exists(full_path):
+            problems.append(f"{relative}: missing")
+        elif os.path.getsize(full_path) != expected["size"]:
+            problems.append(f"{relative}: size {os.path.getsize(full_path)} != {expected['size']}")
+        elif full and _sha256(full_path) != expected["sha256"]:
+            problems.append(f"{relative}: checksum mismatch")
+    return problems
+
+
+def find_snapshot(model_name: str, dtype: str = "fp32") -> Optional[str]:
+    """Directory of an intact snapshot of model_name in dtype, or None"""
+    path = snapshot_dir(model_name, dtype)
+    if not os.path.isdir(path):
+        return None
+    problems = verify(path)
+    if problems:
+        logger.warning(f"Ignoring model store snapshot {path}: {'; '.join(problems)}")
+        return None
+    return path
+
+
+def lid_model_path() -> Optional[str]:
+    """fastText model from the store when it has an intact copy"""
+    path = lid_dir()
+    if os.path.isdir(path) and not verify(path):
+        return os.path.join(path, LID_FILE)
+    return None
+
+
+def hub_kwargs() -> dict:
+    """from_pretrained kwargs for hub model ids: local files only in offline mode"""
+    return {"local_files_only": True} if offline_mode() else {}
+
+
+def _torch_dtype(dtype: str):
+    import torch
+    return {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}[dtype]
+
+
+def mapped_state_dict(path: str) -> Dict[str, object]:
+    """Tensors of a safetensors file as views of one private file mapping.
+
+    Pages stay in the page cache and are shared by every process mapping the same file; a
+    write would only copy the touched page (MAP_PRIVATE), so the store is never modified.
+    Tensors whose offset is not aligned to their element size are left out (the caller keeps
+    its own copy of those).
+    """
+    import torch
+    dtypes = {"F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16, "I64": torch.int64,
+              "I32": torch.int32, "I8": torch.int8, "U8": torch.uint8, "BOOL": torch.bool}
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+    size = os.path.getsize(path)
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=size)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__" or info["dtype"] not in dtypes:
+            continue
+        dtype = dtypes[info["dtype"]]
+        begin, _ = info["data_offsets"]
+        offset = data_start + begin
+        element = torch.empty((), dtype=dtype).element_size()
+        if offset % element:
+            continue
+        tensor = torch.empty(0, dtype=dtype)
+        tensor.set_(storage, offset // element, tuple(info["shape"]))
+        tensors[name] = tensor
+    return tensors
+
+
+def share_weights(model, weights_path: str) -> int:
+    """Point the model's parameters at the mapped snapshot file; returns how many were replaced"""
+    mapped = mapped_state_dict(weights_path)
+    replaced = 0
+    for name, parameter in model.named_parameters():
+        tensor = mapped.get(name)
+        if tensor is not None and tensor.shape == parameter.shape and tensor.dtype == parameter.dtype:
+            parameter.data = tensor
+            replaced += 1
+    return replaced
+
+
+def load_snapshot(path: str, device_name: str = "cpu"):
+    """Model from a store snapshot; on CPU its weights are memory-mapped from the snapshot file"""
+    from transformers import AutoModelForSeq2SeqLM
+    with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+        dtype = json.load(f)["dtype"]
+    model = AutoModelForSeq2SeqLM.from_pretrained(path, local_files_only=True, torch_dtype=_torch_dtype(dtype),
+                                                  low_cpu_mem_usage=True).eval()
+    weights = os.path.join(path, WEIGHTS)
+    if device_name == "cpu" and os.path.exists(weights):
+        replaced = share_weights(model, weights)
+        logger.info(f"Memory-mapped {replaced} tensors from {weights}")
+    return model.to(device_name)
+
+
+def pretrained_source(model_name: str, dtypes=("fp32",)):
+    """(path or id, from_pretrained kwargs) for model_name: the first snapshot in dtypes, else the hub"""
+    for dtype in dtypes:
+        snapshot = find_snapshot(model_name, dtype)
+        if snapshot:
+            return snapshot, {"local_files_only": True}
+    return model_name, hub_kwargs()
+
+
+def prebuild(model_name: str, dtypes=("fp32",), lid: bool = True) -> List[str]:
+    """Download model_name once and write a snapshot per dtype (plus the fastText model) into the store"""
+    if offline_mode():
+        raise RuntimeError("prebuild needs the network; unset JANA_OFFLINE / OFFLINE_MODE")
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    import torch
+    import transformers
+    written = []
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    for dtype in dtypes:
+        path = snapshot_dir(model_name, dtype)
+        os.makedirs(path, exist_ok=True)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name, torch_dtype=_torch_dtype(dtype))
+        # One shard, so a single mapping covers every tensor
+        model.save_pretrained(path, safe_serialization=True, max_shard_size="100GB")
+        tokenizer.save_pretrained(path)
+        write_manifest(path, model=model_name, dtype=dtype,
+                       versions=f"torch{torch.__version__}-transformers{transformers.__version__}")
+        logger.info(f"Wrote {dtype} snapshot of {model_name} to {path}")
+        written.append(path)
+        del model
+
+    if lid:
+        path = lid_dir()
+        os.makedirs(path, exist_ok=True)
+        target = os.path.join(path, LID_FILE)
+        if os.path.exists(LID_FILE):
+            with open(LID_FILE, "rb") as src, open(target, "wb") as dst:
+                dst.write(src.read())
+        else:
+            urllib.request.urlretrieve(FASTTEXT_MODEL_URL, target)
+        write_manifest(path, model="fasttext-lid.176")
+        written.append(path)
+    return written
+
+
+def list_snapshots() -> List[dict]:
+    snapshots = []
+    for root, _, names in os.walk(MODEL_STORE_DIR):
+        if MANIFEST in names:
+            with open(os.path.join(root, MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+            size = sum(entry["size"] for entry in manifest["files"].values())
+            snapshots.append({"path": root, "model": manifest.get("model"), "dtype": manifest.get("dtype", "-"),
+                              "size_mb": size / 1e6, "created": manifest.get("created")})
+    return snapshots
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prebuild and check the local model store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("prebuild", help="Snapshot the translator and fastText model into the store")
+    build.add_argument("--model", default=next(iter(MODEL_CONFIGS.values()))['name'], help="HuggingFace model id")
+    build.add_argument("--dtype", nargs="+", default=["fp32"], choices=DTYPES, help="Weight precisions to write")
+    build.add_argument("--no-lid", action="store_true", help="Skip the fastText model")
+    build.add_argument("--routes", action="store_true", help="Also snapshot the TRANSLATION_ROUTES models")
+    check = sub.add_parser("verify", help="Check every snapshot's files against its manifest")
+    check.add_argument("--quick", action="store_true", help="Compare sizes only")
+    sub.add_parser("list", help="List snapshots")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if args.command == "prebuild":
+        for path in prebuild(args.model, args.dtype, lid=not args.no_lid):
+            print(path)
+        if args.routes:
+            for model_name in dict.fromkeys(name for names in TRANSLATION_ROUTES.values() for name in names):
+                for path in prebuild(model_name, args.dtype, lid=False):
+                    print(path)
+    elif args.command == "verify":
+        failed = 0
+        for snapshot in list_snapshots():
+            problems = verify(snapshot["path"], full=not args.quick)
+            failed += bool(problems)
+            print(f"{snapshot['path']}: {'; '.join(problems) or 'ok'}")
+        return 1 if failed else 0
+    else:
+        for snapshot in list_snapshots():
+            print(f"{snapshot['path']}  {snapshot['model']}  {snapshot['dtype']}  {snapshot['size_mb']:.0f} MB  {snapshot['created']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
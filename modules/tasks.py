@@ -0,0 +1,145 @@
+# In-memory background tasks for interactive processing: the page polls a handle instead of running the work
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from modules.config import TASK_WORKERS, TASK_RETENTION_SECONDS, TASK_PROGRESS_INTERVAL, TASK_PROGRESS_STEP
+from modules.metrics import metrics
+from modules.utils import release_gpu_cache
+from modules.results import ResultStore
+
+logger = logging.getLogger("jana")
+
+RUNNING_STATES = ("queued", "running")
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task when its handle was cancelled"""
+
+
+class TaskHandle:
+    """Progress, partial results and outcome of one background task; safe to read from any thread.
+
+    The task reports through update(), append() and message(). Progress is published at most
+    every TASK_PROGRESS_INTERVAL seconds or TASK_PROGRESS_STEP of the total, so a per-sentence
+    callback costs an attribute check, and readers see a recent, consistent snapshot.
+    """
+    def __init__(self, kind: str, label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.label = label
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.error = None
+        self.results = ResultStore()
+        self.errors: Dict[str, str] = {}
+        self.messages: List[str] = []
+        self._done = 0
+        self._total = 0
+        self._text = ""
+        self._published = (0, 0, "")
+        self._published_at = 0.0
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, done: int, total: int, text: str = "", force: bool = False):
+        """Record progress; published only when the interval or step has passed"""
+        self._done, self._total, self._text = done, total, text
+        now = time.monotonic()
+        step = (done - self._published[0]) / total if total else 1.0
+        if force or (total and done >= total) or now - self._published_at >= TASK_PROGRESS_INTERVAL or step >= TASK_PROGRESS_STEP:
+            self._publish(now)
+        if self._cancel.is_set():
+            raise TaskCancelled()
+
+    def _publish(self, now: float):
+        with self._lock:
+            self._published = (self._done, self._total, self._text)
+            self._published_at = now
+
+    def append(self, results: List[dict]):
+        self.results.append(results)
+
+    def message(self, text: str):
+        with self._lock:
+            self.messages.append(text)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            done, total, text = self._published
+            return {
+                "id": self.id, "kind": self.kind, "label": self.label, "status": self.status,
+                "done": done, "total": total, "text": text,
+                "progress": min(1.0, done / total) if total else 0.0,
+                "rows": len(self.results), "error": self.error,
+                "elapsed": (self.finished or time.time()) - self.created,
+            }
+
+
+_executor = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix="jana-task")
+_tasks: Dict[str, TaskHandle] = {}
+_tasks_lock = threading.Lock()
+
+
+def _prune():
+    cutoff = time.time() - TASK_RETENTION_SECONDS
+    with _tasks_lock:
+        for task_id in [t.id for t in _tasks.values() if t.finished and t.finished < cutoff]:
+            del _tasks[task_id]
+
+
+def _run(handle: TaskHandle, fn: Callable, args, kwargs):
+    if handle.cancelled:
+        handle.status, handle.finished = "cancelled", time.time()
+        return
+    handle.status = "running"
+    try:
+        with metrics.timer("task"):
+            fn(handle, *args, **kwargs)
+        handle.status = "cancelled" if handle.cancelled else "done"
+    except TaskCancelled:
+        handle.status = "cancelled"
+    except Exception as e:
+        logger.exception(f"Background task {handle.id} ({handle.kind}) failed")
+        handle.error = str(e)
+        handle.status = "failed"
+    finally:
+        handle._publish(time.monotonic())
+        handle.finished = time.time()
+        release_gpu_cache()
+        metrics.inc(f"tasks_{handle.status}")
+
+
+def start_task(kind: str, fn: Callable, *args, label: str = "", **kwargs) -> TaskHandle:
+    """Run fn(handle, *args, **kwargs) on the task executor and return its handle at once"""
+    _prune()
+    handle = TaskHandle(kind, label)
+    with _tasks_lock:
+        _tasks[handle.id] = handle
+    _executor.submit(_run, handle, fn, args, kwargs)
+    return handle
+
+
+def get_task(task_id: Optional[str]) -> Optional[TaskHandle]:
+    if not task_id:
+        return None
+    with _tasks_lock:
+        return _tasks.get(task_id)
+
+
+def running_tasks() -> int:
+    with _tasks_lock:
+        return sum(1 for t in _tasks.values() if t.status in RUNNING_STATES)
+
+
+metrics.register_gauge("tasks_running", running_tasks)
@@ -1,111 +1,317 @@
-from transformers import pipeline
-import torch
-from modules.config import LANGUAGE_CODE_MAPPING
-from modules.utils import cache_lookup, cache_store, get_rate_limiter, is_japanese, post_process_japanese
-from modules.models import get_models
-import re
-import unicodedata
-
-def normalize_hindi(text: str) -> str:
-    text = unicodedata.normalize("NFC", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-def normalize_japanese(text: str) -> str:
-    text = text.replace(" ", "")
-    return text.strip()
-
-def normalize_korean(text: str) -> str:
-    return text.strip()
-
-def normalize_french(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-def normalize_spanish(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-def normalize_italian(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-def normalize_portuguese(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-def normalize_russian(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-def normalize_generic(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip()
-
-def translate_text(text: str, src_lang_code: str = "auto", model_name_for_cache: str = None) -> str:
-    """Translate text to Japanese using JANA-Light"""
-    lid_model, translator_model, translator_tokenizer, _, _ = get_models()
-    
-    limiter = get_rate_limiter()
-    if not limiter.allow():
-        return "[Rate limit exceeded: slow down]"
+import math
+import time
+import threading
+import logging
+from modules.config import LANGUAGE_CODE_MAPPING, DECODING_PROFILES, DEFAULT_DECODING_PROFILE, TRANSLATION_ROUTES
+from modules.config import GENERATION_LENGTH_RATIO, GENERATION_LENGTH_OFFSET
+from modules.cache import cache_lookup, cache_lookup_many, cache_store, cache_namespace, cache_fuzzy_lookup_many
+from modules.normalization import output_normalizer, is_japanese_many
+from modules.models import get_lid_model, get_translator_model, get_route_translator, active_translator
+from modules.langid import detect_language
+from modules.chunking import plan_segments, merge_segments
+from modules.serving import get_inference_service
+from modules.metrics import metrics
+from modules.config import SEGMENT_MAX_TOKENS, TRANSLATION_BATCH_SIZE
+from typing import List, Optional
+
+logger = logging.getLogger("jana")
+
+TARGET_LANG = "ja"
+
+def _finalize_translation(result: str, src_lang_hf: str) -> str:
+    return _finalize_many([result], src_lang_hf)[0]
+
+def _finalize_many(results: List[str], src_lang_hf: str) -> List[str]:
+    """Language-specific normalization and Japanese clean-up of raw model outputs, flagging non-Japanese ones"""
+    results = output_normalizer(src_lang_hf).map(results)
+    return [result if japanese else "[NOT JAPANESE OUTPUT] " + result
+            for result, japanese in zip(results, is_japanese_many(results))]
+
+# Tokenizers are shared between wrappers and carry src_lang as mutable state
+_tokenizer_lock = threading.Lock()
+
+class GenerateWrapper:
+    """Direct model.generate wrapper bound to one language pair and decoding setup"""
+    def __init__(self, model, tokenizer, src_lang: str, tgt_lang: str, decoding: dict, model_name: str = None):
+        self.model = model
+        self.model_name = model_name
+        self.tokenizer = tokenizer
+        self.src_lang = src_lang
+        self.tgt_lang = tgt_lang
+        self.decoding = dict(decoding)
+        self.gen_kwargs = dict(decoding)
+        # Never ask for more positions than the model was trained with
+        self.context = getattr(getattr(model, "config", None), "max_position_embeddings", None)
+        if hasattr(tokenizer, "get_lang_id"):
+            # M2M100 selects the output language through the first decoder token
+            self.gen_kwargs["forced_bos_token_id"] = tokenizer.get_lang_id(tgt_lang)
+
+    def __call__(self, texts: List[str]) -> List[str]:
+        """Run one padded generate pass over a list of texts sharing a source language"""
+        import torch
+        with _tokenizer_lock:
+            self.tokenizer.src_lang = self.src_lang
+            encoded = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+        encoded = {k: v.to(self.model.device) for k, v in encoded.items()}
+
+        # Output budget proportional to the longest input, so short labels stop early
+        max_new_tokens = math.ceil(encoded["input_ids"].shape[1] * GENERATION_LENGTH_RATIO) + GENERATION_LENGTH_OFFSET
+        if self.context:
+            max_new_tokens = min(max_new_tokens, self.context)
+
+        with torch.inference_mode():
+            generated = self.model.generate(**encoded, **self.gen_kwargs, max_new_tokens=max_new_tokens)
+        return self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+_ALL_SLOTS = object()
+
+class TranslatorPool:
+    """Lazily built generate wrappers keyed by (model, src_lang, tgt_lang, device, decoding params)"""
+    def __init__(self):
+        self._entries = {}
+        self._models = {}
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def get(self, model, tokenizer, model_name: str, src_lang: str, tgt_lang: str = TARGET_LANG, route: bool = False,
+            **decoding) -> GenerateWrapper:
+        # Route models keep their own slot; the multilingual model is one slot whatever its name
+        slot = model_name if route else None
+        with self._lock:
+            if self._models.get(slot) is not model:
+                # Model switch: wrappers hold references to the old weights
+                self._clear_locked(slot)
+                self._models[slot] = model
+
+            key = (slot, model_name, src_lang, tgt_lang, str(model.device), tuple(sorted(decoding.items())))
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = GenerateWrapper(model, tokenizer, src_lang, tgt_lang, decoding, model_name)
+                self._entries[key] = entry
+                self.built += 1
+                logger.info(f"Built translator for {model_name} {src_lang}->{tgt_lang} on {model.device}")
+            else:
+                self.reused += 1
+            return entry
+
+    def _clear_locked(self, slot=_ALL_SLOTS):
+        keys = [key for key in self._entries if slot is _ALL_SLOTS or key[0] == slot]
+        for key in keys:
+            del self._entries[key]
+        self.evicted += len(keys)
+        if slot is _ALL_SLOTS:
+            self._models.clear()
+        else:
+            self._models.pop(slot, None)
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "built": self.built,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+translator_pool = TranslatorPool()
+
+class TranslationRouter:
+    """Chooses the translator model for each source language.
+
+    routes maps a language to dedicated models tried in order; languages without a route, and
+    those whose route models all failed to load, use the multilingual model. Route models load
+    on their first batch, and a failed load is remembered so later batches go straight to the
+    fallback. Latency is recorded per (language, model) route.
+    """
+    def __init__(self, routes: dict = TRANSLATION_ROUTES):
+        self.routes = {lang: tuple(models) for lang, models in routes.items()}
+        self._failed = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def route(self, src_lang_hf: str, default_model: str, enabled: bool = True) -> str:
+        """Model name that translates src_lang_hf (default_model when no dedicated model applies)"""
+        # Models installed with set_models replace the whole translator setup, routes included
+        if not enabled or active_translator() is None:
+            return default_model
+        for model_name in self.routes.get(src_lang_hf, ()):
+            if model_name in self._failed:
+                continue
+            try:
+                get_route_translator(model_name)
+                return model_name
+            except Exception as e:
+                logger.warning(f"Route {src_lang_hf}->{TARGET_LANG} via {model_name} unavailable, falling back: {e}")
+                with self._lock:
+                    self._failed[model_name] = str(e)
+        return default_model
+
+    def is_route_model(self, model_name: str) -> bool:
+        return model_name not in self._failed and any(model_name in models for models in self.routes.values())
+
+    def model(self, model_name: str):
+        """(model, tokenizer) for a name returned by route()"""
+        if self.is_route_model(model_name):
+            return get_route_translator(model_name)
+        return get_translator_model()
 
-    cached = cache_lookup(text, src_lang_code, model_name_for_cache)
+    def record(self, src_lang_hf: str, model_name: str, texts: int, seconds: float):
+        with self._lock:
+            stats = self._stats.setdefault((src_lang_hf, model_name), {"calls": 0, "sentences": 0, "seconds": 0.0})
+            stats["calls"] += 1
+            stats["sentences"] += texts
+            stats["seconds"] += seconds
+        metrics.observe(f"route_{src_lang_hf}", seconds)
+
+    def stats(self) -> list:
+        """Per-route calls, sentences and latency, plus the route models that failed to load"""
+        with self._lock:
+            rows = [
+                {"route": f"{src}->{TARGET_LANG}", "model": model_name, "calls": s["calls"], "sentences": s["sentences"],
+                 "ms_per_sentence": round(1000 * s["seconds"] / s["sentences"], 3) if s["sentences"] else 0.0}
+                for (src, model_name), s in sorted(self._stats.items())
+            ]
+            rows += [{"route": "failed", "model": model_name, "error": error} for model_name, error in self._failed.items()]
+        return rows
+
+router = TranslationRouter()
+
+def decoding_kwargs(profile: str = DEFAULT_DECODING_PROFILE) -> dict:
+    """generate kwargs of a decoding profile"""
+    if profile not in DECODING_PROFILES:
+        raise ValueError(f"Unknown decoding profile '{profile}'")
+    return {k: v for k, v in DECODING_PROFILES[profile].items() if k != "label"}
+
+def get_translator(src_lang_hf: str, model_name: str, profile: str = DEFAULT_DECODING_PROFILE) -> GenerateWrapper:
+    translator_model, translator_tokenizer = router.model(model_name)
+    return translator_pool.get(translator_model, translator_tokenizer, model_name, src_lang_hf,
+                               route=router.is_route_model(model_name), **decoding_kwargs(profile))
+
+def routed_namespace(src_lang_code: str, model_name: str, profile: str = DEFAULT_DECODING_PROFILE, routing: bool = True):
+    """(model name, cache namespace) that translate src_lang_code; every route has its own namespace"""
+    src_lang_hf = LANGUAGE_CODE_MAPPING.get(src_lang_code, src_lang_code)
+    model_name = router.route(src_lang_hf, model_name or "facebook/m2m100_418M", routing)
+    return model_name, cache_namespace(model_name, profile)
+
+def translate_text(text: str, src_lang_code: str = "auto", model_name_for_cache: str = None, limiter=None,
+                   profile: str = DEFAULT_DECODING_PROFILE, routing: bool = True) -> str:
+    """Translate text to Japanese using JANA-Light.
+
+    limiter is an optional object with acquire(n) (TokenBucket, admission SessionLimiter); tokens are
+    only taken for cache misses. profile is a DECODING_PROFILES key. With routing, languages that
+    have a dedicated model in TRANSLATION_ROUTES use it instead of model_name_for_cache.
+    """
+    # Detect before the cache lookup so entries are keyed by the real source language
+    if src_lang_code == "auto":
+        src_lang_code, _ = detect_language(text, get_lid_model())
+    model_name, namespace = routed_namespace(src_lang_code, model_name_for_cache, profile, routing)
+
+    cached = cache_lookup(text, src_lang_code, namespace)
     if cached:
         return cached
 
-    if src_lang_code == "auto":
-        predictions = lid_model.predict(text, k=1)
-        src_lang_code = predictions[0][0].replace("__label__", "")
-        conf = float(predictions[1][0])
-        if conf < 0.5:
-            src_lang_code = "en"  # fallback to English if uncertain
-    else:
-        conf = 1.0
+    if limiter is not None and not limiter.acquire(1):
+        metrics.inc("rate_limited")
+        return "[Rate limit exceeded: slow down]"
 
     # Map to HF model language code (only base language, no script suffix)
     src_lang_hf = LANGUAGE_CODE_MAPPING.get(src_lang_code, src_lang_code)
-    
-    # Ensure a valid lightweight model name is always set
-    model_name_for_cache = model_name_for_cache or "facebook/m2m100_418M"
 
-    try:
-        translator = pipeline(
-            "translation",
-            model=translator_model,
-            tokenizer=translator_tokenizer,
-            src_lang=src_lang_hf,
-            tgt_lang="ja",
-            device=0 if torch.cuda.is_available() else -1,
-            max_length=2048,
-            num_beams=5,
-            no_repeat_ngram_size=3
-        )
-
-        result = translator(text)[0]['translation_text']
-
-        # Apply language-specific post-processing
-        if src_lang_hf == "hi":
-            result = normalize_hindi(result)
-        elif src_lang_hf == "ja":
-            result = normalize_japanese(result)
-        elif src_lang_hf == "ko":
-            result = normalize_korean(result)
-        elif src_lang_hf == "fr":
-            result = normalize_french(result)
-        elif src_lang_hf == "es":
-            result = normalize_spanish(result)
-        elif src_lang_hf == "it":
-            result = normalize_italian(result)
-        elif src_lang_hf == "pt":
-            result = normalize_portuguese(result)
-        elif src_lang_hf == "ru":
-            result = normalize_russian(result)
+    output = _translate_uncached([text], src_lang_hf, model_name, TRANSLATION_BATCH_SIZE, profile)[0]
+    if isinstance(output, Exception):
+        return f"[Translation error: {str(output)}]"
+
+    result = _finalize_translation(output, src_lang_hf)
+    cache_store(text, src_lang_code, namespace, result)
+    return result
+
+def translate_batch(texts: List[str], src_lang_code: str, model_name_for_cache: str = None, batch_size: int = 16, limiter=None,
+                    profile: str = DEFAULT_DECODING_PROFILE, reuse_threshold: Optional[float] = None,
+                    tm_matches: Optional[dict] = None, routing: bool = True) -> List[str]:
+    """Translate texts that share a detected source language, returning results in input order.
+
+    With reuse_threshold, cache misses whose closest translation-memory match scores at least
+    that much reuse its translation instead of running the model; tm_matches, when given, is
+    filled with {index: (score, matched source, translation)} for those texts.
+    """
+    model_name, namespace = routed_namespace(src_lang_code, model_name_for_cache, profile, routing)
+    src_lang_hf = LANGUAGE_CODE_MAPPING.get(src_lang_code, src_lang_code)
+    batch_size = max(1, int(batch_size))
+
+    results = [None] * len(texts)
+    cached = cache_lookup_many(texts, src_lang_code, namespace)
+    pending = []
+    for i, text in enumerate(texts):
+        if cached.get(text):
+            results[i] = cached[text]
         else:
-            result = normalize_generic(result)
+            pending.append(i)
 
-        # Existing Japanese post-processing
-        result = post_process_japanese(result)
+    if pending and reuse_threshold:
+        matches = cache_fuzzy_lookup_many([texts[i] for i in pending], src_lang_code, namespace, reuse_threshold)
+        remaining = []
+        for i, match in zip(pending, matches):
+            if match is None:
+                remaining.append(i)
+                continue
+            results[i] = match[2]
+            if tm_matches is not None:
+                tm_matches[i] = match
+        metrics.inc("tm_reused", len(pending) - len(remaining))
+        pending = remaining
 
-        if not is_japanese(result):
-            result = "[NOT JAPANESE OUTPUT] " + result
+    # Only the texts that need the model take tokens
+    if pending and limiter is not None and not limiter.acquire(len(pending)):
+        metrics.inc("rate_limited", len(pending))
+        for i in pending:
+            results[i] = "[Rate limit exceeded: slow down]"
+        return results
 
-        cache_store(text, src_lang_code, model_name_for_cache, result)
-        return result
+    outputs = _translate_uncached([texts[i] for i in pending], src_lang_hf, model_name, batch_size, profile)
+    translated = [(i, output) for i, output in zip(pending, outputs) if not isinstance(output, Exception)]
+    for i, output in zip(pending, outputs):
+        if isinstance(output, Exception):
+            results[i] = f"[Translation error: {str(output)}]"
+    finalized = _finalize_many([output for _, output in translated], src_lang_hf)
+    for (i, _), result in zip(translated, finalized):
+        cache_store(texts[i], src_lang_code, namespace, result)
+        results[i] = result
 
+    return results
+
+def _translate_uncached(texts: List[str], src_lang_hf: str, model_name: str, batch_size: int,
+                        profile: str = DEFAULT_DECODING_PROFILE) -> list:
+    """Segment texts to the token budget, translate them through the inference service and merge segments back.
+
+    Returns one raw translation per text, or the Exception that prevented it.
+    """
+    if not texts:
+        return []
+    try:
+        translator = get_translator(src_lang_hf, model_name, profile)
+        segments, lengths, alignment = plan_segments(texts, translator.tokenizer, SEGMENT_MAX_TOKENS)
     except Exception as e:
-        return f"[Translation error: {str(e)}]"
+        return [e] * len(texts)
+
+    # The shared service packs these segments together with other sessions' requests
+    start = time.perf_counter()
+    with metrics.timer("translate"):
+        segment_outputs = get_inference_service().translate(translator, segments, lengths, batch_size)
+    router.record(src_lang_hf, model_name, len(texts), time.perf_counter() - start)
+    metrics.inc("segments_translated", len(segments))
+    outputs = []
+    failed = {}
+    for k, output in enumerate(segment_outputs):
+        if isinstance(output, Exception):
+            failed[alignment[k]] = output
+            output = ""
+        outputs.append(output)
+
+    merged = merge_segments(outputs, alignment, len(texts))
+    return [failed.get(i, output) for i, output in enumerate(merged)]
@@ -1,8 +1,160 @@
+import io
+import uuid
 import streamlit as st
 import pandas as pd
-import torch 
-from modules.config import MODEL_CONFIGS, LANGUAGE_CODE_MAPPING
-from modules.utils import TokenBucket
+from modules.config import (
+    MODEL_CONFIGS, LANGUAGE_CODE_MAPPING, TRANSLATION_BATCH_SIZE, INFERENCE_BACKENDS, DEFAULT_INFERENCE_BACKEND,
+    DECODING_PROFILES, DEFAULT_DECODING_PROFILE, TM_REUSE_THRESHOLD, TASK_POLL_SECONDS, TRANSLATION_ROUTES,
+    TRANSLATION_ROUTING, RESULT_PAGE_SIZES
+)
+from modules.utils import cuda_available
+from modules.admission import session_limiter, get_admission_controller
+from modules.translation import translator_pool, router
+from modules.cache import cache_stats
+from modules.serving import get_inference_service
+from modules.metrics import metrics
+from modules.models import wait_for_models, load_report, active_backend
+from modules.processing import ProcessingOptions, process_stream, process_files, dedup_ratio
+from modules.ingest import iter_text_chunks, stream_sentences
+from modules.jobs import submit_job, list_jobs, job_status, job_results, cancel_job, get_job_runner, ACTIVE_STATES
+from modules.tasks import start_task, get_task, RUNNING_STATES
+from modules.results import ResultStore
+
+# Streamlit clients of the UI-free core API
+
+def render_model_status():
+    """Sidebar panel with each model component's load state, time and memory"""
+    with st.sidebar.expander("Model loading"):
+        for row in load_report():
+            if row["state"] == "ready":
+                st.write(f"✅ {row['component']}: {row['seconds']:.1f}s, {row['rss_mb']:+.0f} MB")
+            elif row["state"] == "failed":
+                st.write(f"❌ {row['component']}: {row['error']}")
+            else:
+                st.write(f"⏳ {row['component']}: {row['state']}")
+
+def get_rate_limiter():
+    """This session's handle on the server-wide admission controller (created once per session)"""
+    if "rate_limiter" not in st.session_state:
+        st.session_state.rate_limiter = session_limiter(uuid.uuid4().hex)
+    return st.session_state.rate_limiter
+
+def processing_options_from_session() -> ProcessingOptions:
+    manual_lang = st.session_state.get('manual_lang', 'AUTO')
+    return ProcessingOptions(
+        furigana=st.session_state.get('generate_furigana', False),
+        debug=st.session_state.get('debug_mode', False),
+        model_name=st.session_state.get('translator_name'),
+        src_lang=None if manual_lang == 'AUTO' else manual_lang.lower(),
+        batch_size=int(st.session_state.get('batch_size', TRANSLATION_BATCH_SIZE)),
+        limiter=get_rate_limiter(),
+        timings=st.session_state.get('show_timings', False),
+        profile=st.session_state.get('decoding_profile', DEFAULT_DECODING_PROFILE),
+        tm_suggestions=st.session_state.get('tm_suggestions', False),
+        routing=st.session_state.get('use_routes', TRANSLATION_ROUTING),
+        tm_reuse=st.session_state.get('tm_reuse_threshold') if st.session_state.get('tm_reuse', False) else None,
+    )
+
+def _wait_for_models(options: ProcessingOptions):
+    errors = wait_for_models(options.furigana)
+    if errors:
+        raise RuntimeError("; ".join(f"could not load {name}: {message}" for name, message in errors.items()))
+
+def _document_task(handle, sentences, options: ProcessingOptions):
+    """Task body: translate a sentence stream chunk by chunk into the handle (no Streamlit calls here)"""
+    handle.update(0, 0, "Loading models...")
+    _wait_for_models(options)
+    for chunk_results in process_stream(sentences, options, on_debug=handle.message):
+        handle.append(chunk_results)
+        handle.update(len(handle.results), 0, f"Processed {len(handle.results)} sentences...")
+
+def _files_task(handle, files, options: ProcessingOptions):
+    handle.update(0, len(files), "Loading models...")
+    _wait_for_models(options)
+
+    def _progress(extracted, total_files, processed):
+        handle.update(extracted, total_files, f"Extracted {extracted}/{total_files} files, processed {processed} sentences")
+
+    results, errors = process_files(files, options, progress=_progress, on_debug=handle.message)
+    handle.errors.update(errors)
+    handle.append(results)
+
+def process_stream_in_page(sentences):
+    """Translate a sentence stream in the background; render_task("document_task") shows it"""
+    handle = start_task("document", _document_task, sentences, processing_options_from_session())
+    st.session_state.document_task = handle.id
+    return handle
+
+def process_uploaded_files(uploaded_files):
+    """Extract and translate uploads in the background; render_task("batch_task") shows them"""
+    files = [(f.name, f.type, f.getvalue()) for f in uploaded_files]
+    handle = start_task("files", _files_task, files, processing_options_from_session(), label=f"{len(files)} files")
+    st.session_state.batch_task = handle.id
+    return handle
+
+def _task_panel(key: str, device):
+    handle = get_task(st.session_state.get(key))
+    if handle is None:
+        return
+    status = handle.snapshot()
+    if status["status"] in RUNNING_STATES:
+        if status["total"]:
+            st.progress(status["progress"], text=status["text"])
+        else:
+            st.caption(status["text"] or "Starting...")
+        if st.button("Cancel", key=f"{key}_cancel"):
+            handle.cancel()
+        # Rows and debug output arrive chunk by chunk; show what is there so far
+        for message in list(handle.messages):
+            st.write(message)
+        if handle.results:
+            render_result_pages(handle.results, f"{key}_{handle.id}")
+        return
+    if st.session_state.get(f"{key}_finished") != handle.id:
+        # First look at the finished task: rerun the page once so the panel stops polling
+        st.session_state[f"{key}_finished"] = handle.id
+        st.rerun()
+
+    for message in handle.messages:
+        st.write(message)
+    for name, error in handle.errors.items():
+        st.error(f"Could not process {name}: {error}")
+    if status["error"]:
+        st.error(f"Processing stopped after {status['rows']} sentences: {status['error']}")
+    elif status["status"] == "cancelled":
+        st.warning(f"Cancelled after {status['rows']} sentences")
+    if handle.results:
+        if handle.kind == "files":
+            st.success(f"Processed {len(handle.results)} sentences from {handle.label}")
+        display_results(handle.results, device, f"{key}_{handle.id}")
+
+def render_task(key: str, device):
+    """Progress of the session's background task under key, then its results.
+
+    The work runs on the task executor, so widget interactions rerun the page without
+    stopping it. While it runs only this panel reruns, every TASK_POLL_SECONDS.
+    """
+    handle = get_task(st.session_state.get(key))
+    running = handle is not None and handle.status in RUNNING_STATES
+    st.fragment(_task_panel, run_every=TASK_POLL_SECONDS if running else None)(key, device)
+
+def stream_upload_sentences(uploaded_file):
+    # A copy of the bytes: the upload object belongs to the script run, the stream is read by a task
+    return stream_sentences(io.BytesIO(uploaded_file.getvalue()), uploaded_file.type)
+
+def preview_upload(uploaded_file, limit: int = 1000):
+    """Return the first `limit` characters of an upload without extracting the whole document"""
+    preview = ""
+    try:
+        uploaded_file.seek(0)
+        for chunk in iter_text_chunks(uploaded_file, uploaded_file.type):
+            preview += chunk
+            if len(preview) > limit:
+                break
+    except Exception as e:
+        st.error(f"Error extracting text: {e}")
+        return None
+    return preview
 
 def render_info_section():
     with st.expander("About JANA", expanded=True):
@@ -43,35 +195,77 @@ def render_sidebar():
         help="Provide a HuggingFace model id if you want to try a different translator"
     )
 
+    st.sidebar.selectbox(
+        "Inference backend",
+        options=list(INFERENCE_BACKENDS.keys()),
+        index=list(INFERENCE_BACKENDS.keys()).index(DEFAULT_INFERENCE_BACKEND),
+        format_func=lambda x: INFERENCE_BACKENDS[x],
+        key="inference_backend",
+        help="Optimized CPU backends are converted once and cached on disk"
+    )
+
+    st.sidebar.selectbox(
+        "Decoding profile",
+        options=list(DECODING_PROFILES.keys()),
+        index=list(DECODING_PROFILES.keys()).index(DEFAULT_DECODING_PROFILE),
+        format_func=lambda x: DECODING_PROFILES[x]['label'],
+        key="decoding_profile",
+        help="Fewer beams are several times faster; each profile has its own cache entries"
+    )
+
+    routed = ", ".join(f"{lang}: {models[0]}" for lang, models in TRANSLATION_ROUTES.items() if models)
+    st.sidebar.checkbox(
+        "Dedicated language-pair models",
+        value=TRANSLATION_ROUTING,
+        key="use_routes",
+        disabled=not routed,
+        help=f"Smaller per-language models where configured ({routed or 'none'}); other languages use the selected model"
+    )
+
     lang_options = ['AUTO'] + [lang.upper() for lang in LANGUAGE_CODE_MAPPING.keys()]
     manual_lang = st.sidebar.selectbox(
         "Override Language Detection",
         options=lang_options,
         index=0,
+        key="manual_lang",
         help="Force a specific source language instead of auto-detection"
     )
 
-    st.sidebar.markdown("**Rate limiting (per-session)**")
-    rate_capacity = st.sidebar.number_input("Requests per window", min_value=1, max_value=1000, value=30)
-    rate_window = st.sidebar.number_input("Window (seconds)", min_value=1, max_value=3600, value=60)
-    st.session_state.rate_limiter = TokenBucket(capacity=int(rate_capacity), refill_seconds=int(rate_window))
+    admission = get_admission_controller().stats()
+    st.sidebar.markdown("**Server load (shared by all sessions)**")
+    st.sidebar.caption(
+        f"{admission['capacity']} sentences per {admission['refill_seconds']}s, "
+        f"{admission['tokens_available']} available now, {admission['queue_depth']} requests waiting"
+    )
 
     use_gpu = False
-    try:
-        if torch.cuda.is_available():
-            use_gpu = st.sidebar.checkbox("Use available GPU for translation", value=True)
-        else:
-            st.sidebar.checkbox("Use GPU (not available)", value=False, disabled=True)
-    except Exception as e:
-        st.sidebar.warning(f"torch not usable: {e}")
-        use_gpu = False
+    if cuda_available():
+        use_gpu = st.sidebar.checkbox("Use available GPU for translation", value=True)
+    else:
+        st.sidebar.checkbox("Use GPU (not available)", value=False, disabled=True)
+
+    st.sidebar.number_input(
+        "Translation batch size",
+        min_value=1,
+        max_value=128,
+        value=TRANSLATION_BATCH_SIZE,
+        key="batch_size",
+        help="Sentences per generate call (larger batches use more memory)"
+    )
 
     st.sidebar.checkbox("Generate Furigana", key="generate_furigana", help="Add furigana readings to Japanese text")
     st.sidebar.checkbox("Debug mode", key="debug_mode", help="Show extra debug information")
+    st.sidebar.checkbox("Show per-result timings", key="show_timings", help="Add a column with the time each stage took per sentence")
+    st.sidebar.checkbox("Translation memory suggestions", key="tm_suggestions",
+                        help="Show the closest earlier translation of a similar sentence, with its match score")
+    if st.sidebar.checkbox("Reuse close matches", value=TM_REUSE_THRESHOLD is not None, key="tm_reuse",
+                           help="Take the earlier translation instead of running the model when the match is close enough"):
+        st.sidebar.slider("Reuse matches scoring at least", min_value=0.80, max_value=0.99,
+                          value=TM_REUSE_THRESHOLD or 0.95, step=0.01, key="tm_reuse_threshold")
 
     return model_option, custom_model.strip() or None, manual_lang, use_gpu
 
-def render_batch_processor(extract_text_from_file, split_sentences, process_text_batch):
+def render_batch_processor(process_uploaded_files):
     st.markdown("### Batch File Processing")
     st.markdown('<div class="batch-processor">', unsafe_allow_html=True)
 
@@ -82,50 +276,154 @@ def render_batch_processor(extract_text_from_file, split_sentences, process_text
         key="batch_uploader"
     )
 
-    if uploaded_files and st.button("Process Batch Files", type="secondary"):
-        results = []
-        for uploaded_file in uploaded_files:
-            with st.spinner(f"Processing {uploaded_file.name}..."):
-                text = extract_text_from_file(uploaded_file)
-                if text:
-                    sentences = split_sentences(text)
-                    file_results = process_text_batch(sentences, st.session_state.manual_lang, 1)
-                    for result in file_results:
-                        result["Source File"] = uploaded_file.name
-                    results.extend(file_results)
+    as_job = st.checkbox(
+        "Run as a background job",
+        key="batch_as_job",
+        help="Checkpointed on the server: survives a closed browser tab and resumes after a crash"
+    )
 
-        if results:
-            st.success(f"Processed {len(results)} sentences from {len(uploaded_files)} files")
-            display_results(results, "GPU" if st.session_state.get('use_gpu', False) else "CPU")
+    if uploaded_files and st.button("Process Batch Files", type="secondary"):
+        if as_job:
+            files = [(f.name, f.type, f.getvalue()) for f in uploaded_files]
+            job_id = submit_job(files, processing_options_from_session())
+            # Kept in the URL so a reconnecting browser finds the job again
+            st.query_params["job"] = job_id
+            st.success(f"Started job {job_id}")
+        else:
+            process_uploaded_files(uploaded_files)
 
+    render_task("batch_task", "GPU" if st.session_state.get('use_gpu', False) else "CPU")
+    render_jobs_panel()
     st.markdown('</div>', unsafe_allow_html=True)
 
-def display_results(results: list, device):
-    st.header("Translation Results")
-    df = pd.DataFrame(results)
-    if "Source File" in df.columns:
-        cols = ["Source File"] + [col for col in df.columns if col != "Source File"]
-        df = df[cols]
+def _job_label(status: dict) -> str:
+    total = status["total_chunks"] if status["total_chunks"] is not None else "?"
+    return f"{status['id']} · {status['status']} · {status['done_chunks']}/{total} chunks · {', '.join(status['files'])[:60]}"
 
-    if "Morphological Analysis" in df.columns:
-        df["Morphological Analysis"] = df["Morphological Analysis"].astype(str)
+def _render_job(job_id: str):
+    status = job_status(job_id)
+    if status is None:
+        st.warning(f"Job {job_id} no longer exists")
+        return
+    st.progress(status["progress"], text=f"{status['status']}: {status['done_chunks']}/{status['total_chunks'] or '?'} chunks, "
+                                         f"{status['sentences'] or 0} sentences")
+    for name, error in status["file_errors"].items():
+        st.error(f"Could not extract {name}: {error}")
+    if status["error"]:
+        st.error(f"Job failed: {status['error']}")
 
-    st.dataframe(df, width="stretch")
+    cols = st.columns(3)
+    if status["status"] in ACTIVE_STATES:
+        if cols[0].button("Cancel job", key=f"cancel_{job_id}"):
+            cancel_job(job_id)
+    elif status["status"] != "done":
+        if cols[0].button("Resume job", key=f"resume_{job_id}", help="Finished chunks are kept and skipped"):
+            get_job_runner().submit(job_id)
+    results = job_results(job_id)
+    if results:
+        label = "CSV" if status["status"] == "done" else f"partial CSV ({len(results)} rows)"
+        with cols[1]:
+            render_csv_download(results, f"jana_job_{job_id}.csv", f"job_{job_id}", label)
+        if cols[2].checkbox("Show results", key=f"show_{job_id}"):
+            render_result_pages(results, f"job_{job_id}")
 
-    csv = df.to_csv(index=False)
-    st.download_button("Download CSV", csv, "jana_phase1_results.csv", "text/csv")
+def _jobs_panel():
+    jobs = list_jobs()
+    if not jobs:
+        return
+    st.markdown("#### Background jobs")
+    ids = [job["id"] for job in jobs]
+    labels = {job["id"]: _job_label(job) for job in jobs}
+    selected = st.query_params.get("job")
+    job_id = st.selectbox("Job", ids, index=ids.index(selected) if selected in ids else 0,
+                          format_func=labels.get, key="selected_job")
+    _render_job(job_id)
+
+def render_jobs_panel():
+    """Job list with progress and partial downloads; refreshes itself while a job is active"""
+    active = any(job["status"] in ACTIVE_STATES for job in list_jobs())
+    # Only the panel reruns on the timer, not the whole page
+    st.fragment(_jobs_panel, run_every=3 if active else None)()
+
+def render_result_pages(results: ResultStore, key: str):
+    """One page of a result store at a time, so large jobs never render as a single table"""
+    page_size = RESULT_PAGE_SIZES[0]
+    start = 0
+    if len(results) > page_size:
+        cols = st.columns(2)
+        page_size = cols[0].selectbox("Rows per page", RESULT_PAGE_SIZES, key=f"{key}_page_size")
+        pages = -(-len(results) // page_size)
+        if st.session_state.get(f"{key}_page", 1) > pages:
+            st.session_state[f"{key}_page"] = pages
+        page = cols[1].number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+        start = (page - 1) * page_size
+    # The Arrow slice goes to the frontend as is; nothing is copied into a DataFrame
+    st.dataframe(results.page(start, page_size), width="stretch",
+                 column_config={"Confidence": st.column_config.NumberColumn(format="%.2f")})
+    st.caption(f"Rows {start + 1}-{min(start + page_size, len(results))} of {len(results)} "
+               f"({results.nbytes / 1e6:.1f} MB in memory)")
+
+def render_csv_download(results: ResultStore, file_name: str, key: str, label: str = "CSV"):
+    """Build the CSV only when asked for, then offer it for download"""
+    # One prepared CSV per session: preparing another one releases the previous bytes
+    prepared = st.session_state.get("prepared_csv")
+    if prepared is None or prepared[:2] != (key, len(results)):
+        if not st.button(f"Prepare {label}", key=f"{key}_prepare"):
+            return
+        prepared = st.session_state.prepared_csv = (key, len(results), results.to_csv())
+    st.download_button(f"Download {label}", prepared[2], file_name, "text/csv", key=f"{key}_download")
+
+def display_results(results, device, key: str = "results"):
+    """Paged result table, CSV download and technical details; results is a ResultStore or a list of rows"""
+    st.header("Translation Results")
+    if not isinstance(results, ResultStore):
+        results = ResultStore.from_rows(results)
+    render_result_pages(results, key)
+    render_csv_download(results, "jana_phase1_results.csv", key)
 
     with st.expander("Technical Details"):
         st.write("**Models & runtime:**")
         st.write(f"- Translator: `{st.session_state.get('translator_name', 'not_loaded')}`")
         st.write(f"- Device: `{device}`")
+        st.write(f"- Inference backend: `{active_backend()}`")
+        st.write(f"- Decoding profile: `{st.session_state.get('decoding_profile', DEFAULT_DECODING_PROFILE)}`")
         st.write(f"- FastText `lid.176.ftz` (local)")
         st.write("- SudachiPy")
         if st.session_state.get('generate_furigana', False):
             st.write("- PyKakasi (for furigana)")
+        for row in load_report():
+            if row["state"] == "ready":
+                st.write(f"- Loaded {row['component']} in {row['seconds']:.1f}s ({row['rss_mb']:+.0f} MB)")
         st.write("**Processing Stats:**")
         st.write(f"- Sentences processed: {len(results)}")
+        service = get_inference_service().stats()
+        st.write(f"- Inference service: {service['requests']} requests in {service['generate_calls']} generate calls, queue depth {service['queue_depth']}")
+        pool_stats = translator_pool.stats()
+        cache = cache_stats()
+        st.write(f"- Cache: {cache['rows']} rows, {cache['bytes'] / 1e6:.1f} MB, hit rate {cache['hit_rate']:.0%}, {cache['evictions_total']} evicted")
+        st.write(f"- Translator pool: {pool_stats['built']} built, {pool_stats['reused']} reused, {pool_stats['entries']} active")
+        for route in router.stats():
+            if route["route"] == "failed":
+                st.write(f"- Route model `{route['model']}` unavailable (using the fallback): {route['error']}")
+            else:
+                st.write(f"- Route {route['route']} via `{route['model']}`: {route['sentences']} sentences, "
+                         f"{route['ms_per_sentence']:.1f} ms/sentence")
+        snapshot = metrics.snapshot()
+        counters = snapshot["counters"]
+        st.write(f"- Rate-limited: {counters.get('rate_limited', 0)}, not Japanese: {counters.get('not_japanese', 0)}")
+        wait = snapshot["timers"].get("admission_wait")
+        if wait:
+            st.write(f"- Admission: {counters.get('admission_granted', 0)} granted, mean wait {wait['mean_ms']:.0f} ms, "
+                     f"max {wait['max_ms']:.0f} ms, {counters.get('admission_timeouts', 0)} timed out, "
+                     f"{counters.get('admission_rejected', 0)} refused (queue full)")
+        st.write(f"- Translation memory: {counters.get('tm_reused', 0)} reused, {counters.get('tm_suggested', 0)} suggestions")
+        st.write(f"- Deduplicated: {counters.get('sentences_deduplicated', 0)} of {counters.get('sentences_in', 0)} sentences ({dedup_ratio():.0%})")
+        st.write("**Stage timings (this process):**")
+        st.dataframe(pd.DataFrame([
+            {"Stage": stage, "Calls": t["count"], "Mean (ms)": t["mean_ms"], "Max (ms)": t["max_ms"], "Total (s)": round(t["total_s"], 3)}
+            for stage, t in snapshot["timers"].items()
+        ]), width="stretch")
         st.write("**Logs:**")
         st.write(f"- Log file: `jana_app.log` (server-side)")
         if results:
-            st.json(results[0])
+            st.json(results.rows(0, 1)[0])
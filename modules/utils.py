@@ -1,120 +1,159 @@
-import streamlit as st
-import sqlite3
 import time
-from collections import deque
 import re
 from io import StringIO
 import pypdf
 import docx2txt
 import urllib.request
 import os
+import sys
 import logging
 from typing import List
-from modules.config import CACHE_DB
+from modules.config import GPU_CACHE_RELEASE_FRACTION, FASTTEXT_MODEL_URL
 
 # Initialize logging
 logger = logging.getLogger("jana")
 
-# Cache DB functions
-def init_cache_db():
-    conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS translations (
-            id INTEGER PRIMARY KEY,
-            src_text TEXT,
-            src_lang TEXT,
-            model TEXT,
-            translation TEXT,
-            created_ts INTEGER
-        )
-    """)
-    conn.commit()
-    return conn
-
-cache_conn = init_cache_db()
-
-def cache_lookup(src_text: str, src_lang: str, model_name: str):
-    cur = cache_conn.cursor()
-    cur.execute(
-        "SELECT translation FROM translations WHERE src_text = ? AND src_lang = ? AND model = ? LIMIT 1",
-        (src_text, src_lang, model_name)
-    )
-    row = cur.fetchone()
-    return row[0] if row else None
-
-def cache_store(src_text: str, src_lang: str, model_name: str, translation: str):
-    cur = cache_conn.cursor()
-    cur.execute(
-        "INSERT INTO translations (src_text, src_lang, model, translation, created_ts) VALUES (?, ?, ?, ?, ?)",
-        (src_text, src_lang, model_name, translation, int(time.time()))
-    )
-    cache_conn.commit()
+# Cache DB functions (kept importable from here for existing callers)
+from modules.metrics import metrics
+from modules.cache import init_cache_db, cache_lookup, cache_lookup_many, cache_store, cache_flush
+from modules.normalization import japanese_normalizer, is_japanese
+from modules.store import lid_model_path, offline_mode
 
 # Rate limiting
 class TokenBucket:
-    def __init__(self, capacity: int, refill_seconds: int):
+    """O(1) token bucket: holds up to capacity tokens, refilled continuously at capacity per refill_seconds"""
+    def __init__(self, capacity: int, refill_seconds: float):
         self.capacity = capacity
         self.refill_seconds = refill_seconds
-        self.timestamps = deque()
-
-    def allow(self) -> bool:
-        now = time.time()
-        while self.timestamps and now - self.timestamps[0] > self.refill_seconds:
-            self.timestamps.popleft()
-        if len(self.timestamps) < self.capacity:
-            self.timestamps.append(now)
+        self.rate = capacity / refill_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n: int = 1) -> bool:
+        """Take n tokens if available; never blocks"""
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
             return True
         return False
 
-def get_rate_limiter():
-    if "rate_limiter" not in st.session_state:
-        st.session_state.rate_limiter = TokenBucket(capacity=30, refill_seconds=60)
-    return st.session_state.rate_limiter
+    def allow(self) -> bool:
+        return self.acquire(1)
+
+    def available(self) -> float:
+        """Tokens in the bucket now, including the refill since the last acquire"""
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, n: int = 1) -> float:
+        """Seconds until n tokens will be available"""
+        self._refill()
+        return max(0.0, (n - self.tokens) / self.rate)
+
+def rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        # Peak RSS (KB on Linux) is the best portable fallback
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+def cuda_available() -> bool:
+    """Whether a CUDA GPU can be used, without importing torch just to ask"""
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        return torch.cuda.is_available()
+    return os.path.exists("/proc/driver/nvidia/version") or os.environ.get("CUDA_VISIBLE_DEVICES", "") not in ("", "-1")
+
+def release_gpu_cache(fraction: float = GPU_CACHE_RELEASE_FRACTION) -> bool:
+    """Return cached CUDA blocks to the driver when reserved memory is above fraction of the device.
+
+    empty_cache forces a sync and the allocator has to re-reserve afterwards, so it only runs
+    under memory pressure. Returns whether the cache was released.
+    """
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return False
+    try:
+        device = torch.cuda.current_device()
+        total = torch.cuda.get_device_properties(device).total_memory
+        if torch.cuda.memory_reserved(device) < fraction * total:
+            return False
+        torch.cuda.empty_cache()
+    except Exception:
+        return False
+    metrics.inc("gpu_cache_releases")
+    return True
 
 # Text processing utilities
 def download_fasttext_model():
-    model_url = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz"
-    model_path = "lid.176.ftz"
+    model_path = lid_model_path() or "lid.176.ftz"
     if not os.path.exists(model_path):
-        with st.spinner("Downloading language detection model..."):
-            try:
-                urllib.request.urlretrieve(model_url, model_path)
-                st.success("Downloaded language detection model successfully!")
-            except Exception as e:
-                st.error(f"Failed to download FastText model: {e}")
-                logger.exception("download_fasttext_model failed")
-                return None
+        if offline_mode():
+            logger.error("lid.176.ftz is missing and offline mode is on (python -m modules.store prebuild fetches it)")
+            return None
+        logger.info("Downloading language detection model...")
+        try:
+            urllib.request.urlretrieve(FASTTEXT_MODEL_URL, model_path)
+            logger.info("Downloaded language detection model successfully")
+        except Exception:
+            logger.exception("download_fasttext_model failed")
+            return None
     return model_path
 
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?。！？])\s+')
+
 def split_sentences(text: str) -> List[str]:
-    sentences = re.split(r'(?<=[.!?。！？])\s+', text)
+    sentences = SENTENCE_BOUNDARY.split(text)
     return [s.strip() for s in sentences if s.strip() and len(s.strip()) > 1]
 
+MIME_TYPES = {
+    ".txt": "text/plain",
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+def mime_type_for_path(path: str) -> str:
+    return MIME_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+def extract_text(source, mime_type: str) -> str:
+    """Extract text from a file path or binary file object; raises on unsupported or unreadable input"""
+    if mime_type == "text/plain":
+        if isinstance(source, str):
+            with open(source, encoding="utf-8") as f:
+                return f.read()
+        data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+        return StringIO(data.decode("utf-8")).read()
+    elif mime_type == "application/pdf":
+        reader = pypdf.PdfReader(source)
+        text = "\n".join([page.extract_text() or "" for page in reader.pages])
+        text = re.sub(r'\s+', ' ', text)
+        return text
+    elif mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        return docx2txt.process(source)
+    raise ValueError(f"Unsupported file type: {mime_type}")
+
 def extract_text_from_file(uploaded_file):
+    """Extract text from an uploaded file, returning None on failure"""
     try:
-        if uploaded_file.type == "text/plain":
-            return StringIO(uploaded_file.getvalue().decode("utf-8")).read()
-        elif uploaded_file.type == "application/pdf":
-            reader = pypdf.PdfReader(uploaded_file)
-            text = "\n".join([page.extract_text() or "" for page in reader.pages])
-            text = re.sub(r'\s+', ' ', text)
-            return text
-        elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            return docx2txt.process(uploaded_file)
-        else:
-            st.error(f"Unsupported file type: {uploaded_file.type}")
-            return None
-    except Exception as e:
-        st.error(f"Error extracting text: {e}")
+        with metrics.timer("extraction"):
+            return extract_text(uploaded_file, uploaded_file.type)
+    except Exception:
         logger.exception("extract_text_from_file failed")
         return None
 
-def generate_furigana(text: str) -> str:
-    # ✅ Lazy import to prevent circular import
-    from modules.models import get_models
-
-    _, _, _, _, kakasi_instance = get_models()
+def generate_furigana(text: str, kakasi_instance=None) -> str:
+    if kakasi_instance is None:
+        # ✅ Lazy import to prevent circular import; PyKakasi itself loads on first use
+        from modules.models import get_kakasi
+        kakasi_instance = get_kakasi()
     try:
         if not kakasi_instance:
             return text
@@ -126,24 +165,14 @@ def generate_furigana(text: str) -> str:
             else:
                 furigana_text += f"{item['orig']}[{item['hira']}]"
         return furigana_text
-    except Exception as e:
-        st.warning(f"Furigana generation failed: {e}")
+    except Exception:
         logger.exception("generate_furigana failed")
         return text
 
 def post_process_japanese(text: str) -> str:
     if not isinstance(text, str):
         return text
-    text = re.sub(r'[\x00-\x1f\x7f]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    text = text.replace(" ?", "？").replace(" !", "！").replace(" :", "：")
-    text = re.sub(r'^\[NOT JAPANESE OUTPUT\]\s*', '', text)
-    return text
-
-def is_japanese(text: str) -> bool:
-    if not text:
-        return False
-    return bool(re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', text))
+    return japanese_normalizer(text)
 
 def _sudachi_to_string(morphemes) -> str:
     try:
@@ -0,0 +1,467 @@
+# Optional multi-process CPU inference: N translator processes taking sentence chunks as they become idle
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import collections
+import multiprocessing
+import multiprocessing.connection
+from types import SimpleNamespace
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+from modules.config import (
+    WORKER_POOL_SIZE, WORKER_THREADS, WORKER_AFFINITY, WORKER_CALIBRATION_SENTENCES,
+    MODEL_CACHE_DIR, MODEL_CONFIGS, INFERENCE_BACKENDS, DEFAULT_INFERENCE_BACKEND
+)
+from modules.metrics import metrics
+
+logger = logging.getLogger("jana")
+
+CALIBRATION_FILE = os.path.join(MODEL_CACHE_DIR, "worker_calibration.json")
+CALIBRATION_CHUNK = 8  # sentences per task during calibration
+MAX_WORKER_RESTARTS = 3  # replacements for crashed workers before the pool gives up
+
+CALIBRATION_SENTENCES = [
+    "The contract enters into force on the first day of the following month.",
+    "Please submit the signed form before Friday.",
+    "The results of the survey are summarized in the table below.",
+    "If the device overheats, disconnect it from the power supply immediately.",
+    "All employees must complete the safety training by the end of the year.",
+    "Prices do not include shipping costs or import duties.",
+    "Section 4.2 describes the procedure for filing a complaint with the regulator.",
+    "Thank you for your patience while we investigate the issue.",
+]
+
+
+def available_cores() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def _worker_main(worker_id: int, model_name: str, backend: str, threads: int, cores: Optional[List[int]], conn):
+    """Worker process: load the translator once, then translate chunks from conn until None arrives"""
+    try:
+        if cores:
+            os.sched_setaffinity(0, cores)
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # only allowed before the first parallel op
+        from modules.backends import load_translator
+        from modules.translation import GenerateWrapper
+        tokenizer, model, _ = load_translator(model_name, backend, "cpu")
+    except Exception as e:
+        conn.send((None, worker_id, f"worker {worker_id} failed to start: {e}"))
+        return
+    conn.send((None, worker_id, None))
+
+    wrappers = {}
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        task_id, src_lang, tgt_lang, decoding, segments = task
+        try:
+            key = (src_lang, tgt_lang, tuple(sorted(decoding.items())))
+            translator = wrappers.get(key)
+            if translator is None:
+                translator = wrappers[key] = GenerateWrapper(model, tokenizer, src_lang, tgt_lang, decoding)
+            conn.send((task_id, list(translator(segments)), None))
+        except Exception as e:
+            conn.send((task_id, None, str(e)))
+
+
+class _Worker:
+    """Parent-side view of one worker process: its pipe and the chunk it is translating"""
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.task_id = None
+
+
+class CPUWorkerPool:
+    """Translator processes fed from one pending queue held by the parent.
+
+    Each worker has its own pipe and gets the next chunk as soon as it returns the previous
+    one, so a worker that drew long sentences does not hold up the others (work stealing).
+    Each chunk's future resolves to its outputs, so callers get results back in their own
+    order. A worker that dies fails only the chunk it held and is replaced; after
+    MAX_WORKER_RESTARTS replacements the pool is marked broken and get_worker_pool() falls
+    back to in-process translation.
+    """
+    def __init__(self, model_name: str, backend: str = DEFAULT_INFERENCE_BACKEND, workers: int = 2,
+                 threads: Optional[int] = None, affinity: bool = WORKER_AFFINITY):
+        cores = available_cores()
+        self.key = (model_name, backend)
+        self.workers = max(1, workers)
+        self.threads = threads or max(1, len(cores) // self.workers)
+        self.broken = None
+        self._cores = cores if affinity else None
+        # spawn: workers must not inherit this process's threads and locks
+        self._context = multiprocessing.get_context("spawn")
+        self._futures: Dict[int, Future] = {}
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._restarts = 0
+        self._ready_event = threading.Event()
+        self._start_error = None
+        self._closed = False
+        self._workers = [self._spawn(worker_id) for worker_id in range(self.workers)]
+        self._collector = threading.Thread(target=self._collect, name="jana-worker-results", daemon=True)
+        self._collector.start()
+        logger.info(f"Started {self.workers} translator workers x {self.threads} threads for {model_name} ({backend})"
+                    + (", pinned" if affinity else ""))
+
+    def _spawn(self, worker_id: int) -> _Worker:
+        assigned = self._cores[worker_id * self.threads:(worker_id + 1) * self.threads] if self._cores else None
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, name=f"jana-worker-{worker_id}", daemon=True,
+            args=(worker_id, self.key[0], self.key[1], self.threads, assigned or None, child_conn)
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _dispatch(self):
+        """Hand pending chunks to idle workers; call with the lock held"""
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if worker.ready and worker.task_id is None:
+                task = self._pending.popleft()
+                worker.task_id = task[0]
+                try:
+                    worker.conn.send(task)
+                except OSError:
+                    pass  # the worker is gone; the collector fails this chunk when it notices
+
+    def _fail_pending(self, message: str):
+        with self._lock:
+            futures, self._futures = self._futures, {}
+            self._pending.clear()
+        for future in futures.values():
+            future.set_exception(RuntimeError(message))
+
+    def _worker_died(self, worker_id: int):
+        """Fail the chunk the dead worker held, then replace it (or give up after too many crashes)"""
+        worker = self._workers[worker_id]
+        worker.process.join(timeout=1)
+        message = f"translator worker {worker.process.name} exited (code {worker.process.exitcode})"
+        logger.error(message)
+        metrics.inc("worker_crashes")
+        worker.conn.close()
+        with self._lock:
+            future = self._futures.pop(worker.task_id, None) if worker.task_id is not None else None
+        if future is not None:
+            future.set_exception(RuntimeError(message))
+        if not self._ready_event.is_set():
+            # Died while loading: the pool never started
+            self._start_error = self._start_error or message
+            self._ready_event.set()
+            self.broken = message
+            return
+        if self._restarts >= MAX_WORKER_RESTARTS:
+            self.broken = f"{message}; {self._restarts} workers already replaced"
+            self._fail_pending(self.broken)
+            return
+        self._restarts += 1
+        self._workers[worker_id] = self._spawn(worker_id)
+
+    def _handle(self, worker: _Worker, message):
+        task_id, payload, error = message
+        if task_id is None:
+            # Start-up report: payload is the worker id
+            if error:
+                logger.error(error)
+                self._start_error = self._start_error or error
+                self.broken = error
+                self._ready_event.set()
+                return
+            with self._lock:
+                worker.ready = True
+                self._dispatch()
+            if all(w.ready for w in self._workers):
+                self._ready_event.set()
+            return
+        with self._lock:
+            future = self._futures.pop(task_id, None)
+            worker.task_id = None
+            self._dispatch()
+        if future is None:
+            return
+        if error:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(payload)
+
+    def _collect(self):
+        while not self._closed and not self.broken:
+            by_handle = {}
+            for worker_id, worker in enumerate(self._workers):
+                by_handle[worker.conn] = worker_id
+                by_handle[worker.process.sentinel] = worker_id
+            dead = set()
+            try:
+                ready = multiprocessing.connection.wait(list(by_handle), timeout=1.0)
+            except OSError:
+                return  # connections closed by close()
+            for handle in ready:
+                worker_id = by_handle[handle]
+                worker = self._workers[worker_id]
+                if handle is worker.conn:
+                    try:
+                        message = worker.conn.recv()
+                    except (EOFError, OSError):
+                        dead.add(worker_id)
+                        continue
+                    self._handle(worker, message)
+                else:
+                    dead.add(worker_id)
+            if self._closed:
+                return
+            for worker_id in sorted(dead):
+                if self.broken:
+                    return
+                # A result sent just before exiting has been handled above
+                while self._workers[worker_id].conn.poll():
+                    try:
+                        self._handle(self._workers[worker_id], self._workers[worker_id].conn.recv())
+                    except (EOFError, OSError):
+                        break
+                self._worker_died(worker_id)
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """Block until every worker has loaded the translator; raises if one failed to start"""
+        self._ready_event.wait(timeout)
+        if self._start_error:
+            raise RuntimeError(self._start_error)
+
+    def submit(self, translator, segments: List[str]) -> Future:
+        """Queue one chunk for a GenerateWrapper's language pair and decoding setup"""
+        future = Future()
+        if self.broken:
+            future.set_exception(RuntimeError(self.broken))
+            return future
+        with self._lock:
+            task_id = self._next_id
+            self._next_id += 1
+            self._futures[task_id] = future
+            self._pending.append((task_id, translator.src_lang, translator.tgt_lang, translator.decoding, list(segments)))
+            self._dispatch()
+        metrics.inc("worker_chunks")
+        return future
+
+    def translate(self, translator, chunks: Sequence[List[str]]) -> List[list]:
+        """Translate chunks in parallel; one output list (or the Exception) per chunk, in chunk order"""
+        futures = [self.submit(translator, chunk) for chunk in chunks]
+        outputs = []
+        for future in futures:
+            try:
+                outputs.append(future.result())
+            except Exception as e:
+                outputs.append(e)
+        return outputs
+
+    def queue_depth(self) -> int:
+        return len(self._futures)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, ValueError):
+                    pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self._fail_pending("worker pool closed")
+
+
+def candidate_splits(cores: int) -> List[Tuple[int, int]]:
+    """(workers, threads per worker) splits that use every core, from one big worker to one per core"""
+    splits = []
+    workers = 1
+    while workers <= cores:
+        splits.append((workers, cores // workers))
+        workers *= 2
+    return splits
+
+
+def _calibration_key(model_name: str, backend: str, cores: int) -> str:
+    return f"{model_name}|{backend}|{cores}"
+
+
+def calibrate(model_name: str, backend: str = DEFAULT_INFERENCE_BACKEND, affinity: bool = WORKER_AFFINITY,
+              sentences: int = WORKER_CALIBRATION_SENTENCES, splits: Optional[List[Tuple[int, int]]] = None) -> dict:
+    """Time each worker/thread split on a short run and return the fastest, saved for later starts"""
+    from modules.translation import TARGET_LANG, decoding_kwargs
+    cores = len(available_cores())
+    splits = splits or candidate_splits(cores)
+    texts = [CALIBRATION_SENTENCES[i % len(CALIBRATION_SENTENCES)] for i in range(sentences)]
+    probe = SimpleNamespace(src_lang="en", tgt_lang=TARGET_LANG, decoding=decoding_kwargs())
+
+    runs = []
+    for workers, threads in splits:
+        pool = CPUWorkerPool(model_name, backend, workers, threads, affinity)
+        try:
+            pool.wait_ready()
+            pool.translate(probe, [texts[:1]] * workers)  # warm-up
+            chunks = [texts[i:i + CALIBRATION_CHUNK] for i in range(0, len(texts), CALIBRATION_CHUNK)]
+            start = time.perf_counter()
+            outputs = pool.translate(probe, chunks)
+            seconds = time.perf_counter() - start
+        finally:
+            pool.close()
+        failed = [o for o in outputs if isinstance(o, Exception)]
+        if failed:
+            raise RuntimeError(f"calibration run failed: {failed[0]}")
+        runs.append({"workers": workers, "threads": threads, "sentences_per_s": round(len(texts) / seconds, 2)})
+        logger.info(f"Worker calibration {workers}x{threads}: {runs[-1]['sentences_per_s']} sentences/s")
+
+    best = max(runs, key=lambda run: run["sentences_per_s"])
+    result = {"workers": best["workers"], "threads": best["threads"], "runs": runs}
+    saved = _load_calibrations()
+    saved[_calibration_key(model_name, backend, cores)] = result
+    os.makedirs(os.path.dirname(CALIBRATION_FILE) or ".", exist_ok=True)
+    with open(CALIBRATION_FILE, "w", encoding="utf-8") as f:
+        json.dump(saved, f, indent=2)
+    return result
+
+
+def _load_calibrations() -> dict:
+    try:
+        with open(CALIBRATION_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saved_calibration(model_name: str, backend: str) -> Optional[dict]:
+    return _load_calibrations().get(_calibration_key(model_name, backend, len(available_cores())))
+
+
+def resolve_split(model_name: str, backend: str, workers, threads: Optional[int]) -> Tuple[int, int]:
+    """Turn the configured size ("auto" or a number) into (workers, threads), calibrating if needed"""
+    cores = len(available_cores())
+    if workers == "auto":
+        calibration = saved_calibration(model_name, backend)
+        if calibration is None:
+            calibration = calibrate(model_name, backend)
+        return calibration["workers"], calibration["threads"]
+    workers = max(1, int(workers))
+    return workers, threads or max(1, cores // workers)
+
+
+_settings = {"workers": WORKER_POOL_SIZE, "threads": WORKER_THREADS, "affinity": WORKER_AFFINITY}
+_pool = None
+_pool_lock = threading.Lock()
+_calibrating = set()
+
+
+def _calibrate_in_background(model_name: str, backend: str):
+    key = (model_name, backend)
+    try:
+        calibrate(model_name, backend, _settings["affinity"])
+        logger.info(f"Worker calibration for {model_name} ({backend}) finished; the pool starts with the next batch")
+    except Exception:
+        logger.exception("Worker calibration failed; translator worker pool disabled")
+        with _pool_lock:
+            _settings["workers"] = None
+    finally:
+        with _pool_lock:
+            _calibrating.discard(key)
+
+
+def configure_worker_pool(workers=None, threads: Optional[int] = None, affinity: bool = WORKER_AFFINITY):
+    """Enable the pool with workers processes (a number or "auto"), or disable it with None/0"""
+    global _pool
+    with _pool_lock:
+        _settings.update(workers=workers, threads=threads, affinity=affinity)
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_worker_pool() -> Optional[CPUWorkerPool]:
+    """Pool for the active CPU translator, started on first use; None when the pool is off or not applicable"""
+    global _pool
+    if not _settings["workers"]:
+        return None
+    from modules.models import active_translator
+    active = active_translator()
+    if active is None:
+        return None
+    model_name, backend, device = active
+    if device != "cpu":
+        return None
+    with _pool_lock:
+        if _pool is not None and _pool.broken:
+            _pool.close()
+            _pool = None
+            _settings["workers"] = None
+            logger.error("Translator worker pool disabled after repeated worker crashes; translating in-process")
+            return None
+        if _pool is not None and _pool.key != (model_name, backend):
+            _pool.close()
+            _pool = None
+        if _pool is None and _settings["workers"] == "auto" and saved_calibration(model_name, backend) is None:
+            # Never calibrate on the caller's thread (the shared inference service): translate
+            # in-process until a background calibration has saved a split
+            if (model_name, backend) not in _calibrating:
+                _calibrating.add((model_name, backend))
+                threading.Thread(target=_calibrate_in_background, args=(model_name, backend),
+                                 name="jana-worker-calibration", daemon=True).start()
+            return None
+        if _pool is None:
+            pool = None
+            try:
+                workers, threads = resolve_split(model_name, backend, _settings["workers"], _settings["threads"])
+                pool = CPUWorkerPool(model_name, backend, workers, threads, _settings["affinity"])
+                pool.wait_ready()
+            except Exception:
+                if pool is not None:
+                    pool.close()
+                # Stay in-process rather than retrying the calibration or start on every batch
+                _settings["workers"] = None
+                logger.exception("Translator worker pool disabled")
+                return None
+            _pool = pool
+            metrics.register_gauge("worker_queue_depth", lambda: _pool.queue_depth() if _pool else 0)
+        return _pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the CPU translator worker pool")
+    parser.add_argument("--model", default=next(iter(MODEL_CONFIGS.values()))['name'], help="HuggingFace model id")
+    parser.add_argument("--backend", default=DEFAULT_INFERENCE_BACKEND, choices=list(INFERENCE_BACKENDS))
+    parser.add_argument("--sentences", type=int, default=WORKER_CALIBRATION_SENTENCES)
+    parser.add_argument("--pin-cores", action="store_true", help="Pin each worker to its own cores")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    result = calibrate(args.model, args.backend, args.pin_cores, args.sentences)
+    for run in result["runs"]:
+        print(f"{run['workers']:>3} workers x {run['threads']:>3} threads  {run['sentences_per_s']:>8} sentences/s")
+    print(f"Best: {result['workers']} x {result['threads']} (saved to {CALIBRATION_FILE})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())